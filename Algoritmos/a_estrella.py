@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+A* "de verdad" sobre el GrafoCSR.
+
+- peso="longitud": minimiza metros; heurística = distancia haversine al destino.
+- peso="tiempo":   minimiza segundos; heurística = haversine / velocidad máxima
+                   del grafo (nunca sobreestima, así que sigue siendo óptimo).
+
+A diferencia de Dijkstra, la búsqueda va "apuntando" al destino y expande
+muchos menos nodos.
+"""
+
+import heapq
+import math
+from typing import List, Tuple
+
+from Algoritmos.grafo_csr import GrafoCSR
+
+RADIO_TIERRA_M = 6_371_000.0
+
+PESOS_VALIDOS = ("longitud", "tiempo")
+
+
+def _heuristica(csr: GrafoCSR, destino: int, peso: str):
+    """Devuelve h(nodo) -> cota inferior del costo hasta destino."""
+    lat, lon = csr.coords_rad
+    lat_d = lat[destino]
+    lon_d = lon[destino]
+    cos_lat_d = math.cos(lat_d)
+
+    # Un poco por debajo de la distancia real para absorber redondeos
+    # de los largos de OSM (float32) y seguir siendo admisible.
+    factor = 0.999
+    if peso == "tiempo":
+        factor = factor * 3.6 / csr.velocidad_maxima  # m -> s a la velocidad máxima
+
+    def h(n: int) -> float:
+        lat_n = lat[n]
+        dlat = lat_d - lat_n
+        dlon = lon_d - lon[n]
+        a = math.sin(dlat / 2) ** 2 + math.cos(lat_n) * cos_lat_d * math.sin(dlon / 2) ** 2
+        return 2 * RADIO_TIERRA_M * math.asin(min(1.0, math.sqrt(a))) * factor
+
+    return h
+
+
+def a_estrella(csr: GrafoCSR, origen: int, destino: int, peso: str = "tiempo") -> Tuple[List[int], int]:
+    """
+    Camino óptimo origen -> destino (índices internos).
+    Devuelve (camino, nodos_expandidos); camino = [] si no hay ruta.
+    """
+    if peso not in PESOS_VALIDOS:
+        raise ValueError(f"peso debe ser uno de {PESOS_VALIDOS}, no {peso!r}")
+    if origen == destino:
+        return [origen], 0
+
+    offsets, destinos, longitud, tiempo = csr.listas
+    costos = tiempo if peso == "tiempo" else longitud
+    h = _heuristica(csr, destino, peso)
+
+    g_score = {origen: 0.0}
+    previo = {origen: -1}
+    cerrados = set()
+    pq = [(h(origen), origen)]
+    expandidos = 0
+
+    while pq:
+        _, nodo = heapq.heappop(pq)
+        if nodo in cerrados:
+            continue
+        if nodo == destino:
+            break
+        cerrados.add(nodo)
+        expandidos += 1
+
+        g_nodo = g_score[nodo]
+        for k in range(offsets[nodo], offsets[nodo + 1]):
+            vecino = destinos[k]
+            if vecino in cerrados:
+                continue
+            tentativo = g_nodo + costos[k]
+            if tentativo < g_score.get(vecino, math.inf):
+                g_score[vecino] = tentativo
+                previo[vecino] = nodo
+                heapq.heappush(pq, (tentativo + h(vecino), vecino))
+    else:
+        return [], expandidos
+
+    camino = [destino]
+    while camino[-1] != origen:
+        camino.append(previo[camino[-1]])
+    camino.reverse()
+    return camino, expandidos
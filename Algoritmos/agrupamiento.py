@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Agrupamiento de pedidos por cercanía en la red de calles (k-medoides).
+
+Con la matriz de tiempos entre paradas se arman k grupos compactos (uno por
+repartidor), con un tope de pedidos por grupo para repartir la carga:
+
+1. Medoides iniciales: el punto más central y después, de a uno, el más
+   lejano a los medoides ya elegidos (k-means++ determinístico).
+2. Asignación con capacidad: los pares (pedido, medoide) se recorren de más
+   cerca a más lejos y cada pedido va al medoide libre más cercano.
+3. Cada grupo elige como nuevo medoide al pedido que minimiza la suma de
+   tiempos al resto. Se repite 2-3 hasta que no cambie nada.
+
+Se usa un tiempo simétrico ((ida + vuelta) / 2): lo que importa es qué tan
+cerca están dos paradas, no el sentido de las calles.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+_SIN_CAMINO = 1e9
+
+
+def _simetrica(tiempos: np.ndarray) -> np.ndarray:
+    t = np.where(np.isfinite(tiempos), tiempos, _SIN_CAMINO)
+    return (t + t.T) / 2.0
+
+
+def _medoides_iniciales(d: np.ndarray, k: int) -> List[int]:
+    medoides = [int(np.argmin(d.sum(axis=1)))]
+    while len(medoides) < k:
+        distancia_a_medoides = d[:, medoides].min(axis=1)
+        distancia_a_medoides[medoides] = -1
+        medoides.append(int(np.argmax(distancia_a_medoides)))
+    return medoides
+
+
+def _asignar_con_capacidad(d: np.ndarray, medoides: List[int], capacidad: int) -> np.ndarray:
+    n = d.shape[0]
+    etiquetas = np.full(n, -1, dtype=np.int64)
+    carga = np.zeros(len(medoides), dtype=np.int64)
+
+    # Cada medoide es de su propio grupo
+    for g, m in enumerate(medoides):
+        etiquetas[m] = g
+        carga[g] += 1
+
+    costos = d[:, medoides]
+    for plano in np.argsort(costos, axis=None, kind="stable"):
+        punto, g = divmod(int(plano), len(medoides))
+        if etiquetas[punto] >= 0 or carga[g] >= capacidad:
+            continue
+        etiquetas[punto] = g
+        carga[g] += 1
+    return etiquetas
+
+
+def k_medoides(
+    tiempos: np.ndarray,
+    k: int,
+    capacidad: Optional[int] = None,
+    max_iteraciones: int = 20,
+) -> np.ndarray:
+    """
+    Etiqueta de grupo (0..k-1) para cada fila de la matriz de tiempos.
+    `capacidad` = máximo de pedidos por grupo (por defecto, reparto parejo).
+    """
+    n = tiempos.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    k = max(1, min(k, n))
+    if capacidad is None:
+        capacidad = -(-n // k)
+    capacidad = max(capacidad, -(-n // k))
+
+    d = _simetrica(tiempos)
+    medoides = _medoides_iniciales(d, k)
+    etiquetas = _asignar_con_capacidad(d, medoides, capacidad)
+
+    for _ in range(max_iteraciones):
+        nuevos = []
+        for g in range(k):
+            miembros = np.flatnonzero(etiquetas == g)
+            sub = d[np.ix_(miembros, miembros)]
+            nuevos.append(int(miembros[np.argmin(sub.sum(axis=1))]))
+        if nuevos == medoides:
+            break
+        medoides = nuevos
+        etiquetas = _asignar_con_capacidad(d, medoides, capacidad)
+
+    return etiquetas
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Árbol de caminos mínimos desde UN origen fijo (el local).
+
+Todos los pedidos salen del mismo nodo, así que en vez de buscar una ruta
+nueva por cada cliente se corre un Dijkstra completo una sola vez y se
+guardan tres arrays (distancia, tiempo y predecesor por nodo). Después la
+ruta a cualquier cliente es solo seguir predecesores: O(largo del camino).
+
+El árbol se vuelve a calcular únicamente si cambia el snapshot del grafo
+(la caché va por CSR.version) o el nodo de origen.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from Algoritmos.grafo_csr import GrafoCSR, camino_desde_predecesores, obtener_csr, resumen_camino
+
+
+@dataclass(frozen=True)
+class ArbolCaminos:
+    csr: GrafoCSR
+    origen: int               # id OSM del origen
+    peso: str                 # 'tiempo' o 'longitud': qué minimiza el árbol
+    distancia_m: np.ndarray   # inf si el nodo no es alcanzable
+    tiempo_s: np.ndarray      # tiempo acumulado siguiendo el árbol
+    predecesor: np.ndarray    # -9999 en el origen y en nodos no alcanzables
+
+    @property
+    def version(self) -> str:
+        return self.csr.version
+
+    def alcanzable(self, nodo: int) -> bool:
+        idx = self.csr.indice.get(nodo)
+        return idx is not None and bool(np.isfinite(self.distancia_m[idx]))
+
+    def ruta(self, nodo_destino: int):
+        """
+        Devuelve (path, dist_km, tiempo_min) desde el origen hasta nodo_destino,
+        igual que Rutas.a_star_ruta pero sin volver a buscar.
+        """
+        o = self.csr.idx(self.origen)
+        d = self.csr.idx(nodo_destino)
+        if o == d:
+            return [self.origen], 0.0, 0.0
+
+        camino = camino_desde_predecesores(self.predecesor, o, d)
+        if not camino:
+            return [self.origen], 0.0, 0.0
+
+        dist_km, tiempo_min = resumen_camino(self.csr, camino, self.peso)
+        return [int(self.csr.nodos[i]) for i in camino], dist_km, tiempo_min
+
+
+def construir_arbol(csr: GrafoCSR, nodo_origen: int, peso: str = "tiempo") -> ArbolCaminos:
+    o = csr.idx(nodo_origen)
+    costo, predecesor = dijkstra(
+        csr.matriz(peso), directed=True, indices=o, return_predecessors=True
+    )
+
+    # Largo y tiempo de la arista que llega a cada nodo desde su predecesor
+    largo_m, tiempo_s = csr.magnitudes(peso)
+    fuentes = csr.fuentes
+    en_arbol = predecesor[csr.destinos] == fuentes
+    largo_llegada = np.zeros(csr.n, dtype=np.float64)
+    tiempo_llegada = np.zeros(csr.n, dtype=np.float64)
+    largo_llegada[csr.destinos[en_arbol]] = largo_m[en_arbol]
+    tiempo_llegada[csr.destinos[en_arbol]] = tiempo_s[en_arbol]
+
+    # Acumulamos en orden de costo: el predecesor siempre va antes
+    distancia = np.full(csr.n, np.inf)
+    tiempo = np.full(csr.n, np.inf)
+    distancia[o] = 0.0
+    tiempo[o] = 0.0
+    alcanzables = np.flatnonzero(np.isfinite(costo))
+    for v in alcanzables[np.argsort(costo[alcanzables], kind="stable")]:
+        p = predecesor[v]
+        if p >= 0:
+            distancia[v] = distancia[p] + largo_llegada[v]
+            tiempo[v] = tiempo[p] + tiempo_llegada[v]
+
+    for a in (distancia, tiempo, predecesor):
+        a.flags.writeable = False
+
+    return ArbolCaminos(
+        csr=csr,
+        origen=nodo_origen,
+        peso=peso,
+        distancia_m=distancia,
+        tiempo_s=tiempo,
+        predecesor=predecesor,
+    )
+
+
+_lock = threading.Lock()
+# (versión del grafo, origen, peso) -> árbol. La versión va en la clave, igual
+# que en contraccion.obtener_ch: un árbol de otro snapshot nunca se devuelve.
+_arboles: Dict[Tuple[str, int, str], ArbolCaminos] = {}
+
+
+def obtener_arbol(nodo_origen: int, peso: str = "tiempo") -> ArbolCaminos:
+    """
+    Devuelve el árbol desde nodo_origen, construyéndolo si no existe para la
+    versión actual del grafo. Al construir uno nuevo se descartan los de
+    versiones anteriores (ya no los pide nadie y cada uno ocupa 3 arrays).
+    """
+    csr = obtener_csr()
+    clave = (csr.version, nodo_origen, peso)
+    arbol = _arboles.get(clave)
+    if arbol is not None:
+        return arbol
+
+    with _lock:
+        arbol = _arboles.get(clave)
+        if arbol is None:
+            arbol = construir_arbol(csr, nodo_origen, peso)
+            for vieja in [c for c in _arboles if c[0] != csr.version]:
+                del _arboles[vieja]
+            _arboles[clave] = arbol
+        return arbol
+
+
+def arbol_existente(nodo_origen: int, peso: str = "tiempo") -> Optional[ArbolCaminos]:
+    """Árbol ya calculado y vigente para ese origen, o None (no calcula nada)."""
+    return _arboles.get((obtener_csr().version, nodo_origen, peso))
+
+
+def invalidar(nodo_origen: Optional[int] = None) -> None:
+    """Descarta los árboles de un origen (o todos), p. ej. si se mudó el local."""
+    with _lock:
+        for clave in list(_arboles):
+            if nodo_origen is None or clave[1] == nodo_origen:
+                del _arboles[clave]
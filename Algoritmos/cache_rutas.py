@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Caché LRU de rutas ya calculadas: (origen, destino, peso) -> (path, km, min).
+
+Clientes que repiten y vecinos caen en los mismos nodos, así que muchas rutas
+se piden más de una vez. La clave incluye la versión del grafo, de modo que
+al cambiar el snapshot las entradas viejas simplemente dejan de usarse.
+
+Opcionalmente se guarda en disco al apagar y se lee al arrancar.
+
+Con pool de procesos cada proceso tiene su propia caché. Los procesos del
+pool anotan lo nuevo (rutas y aciertos/fallos, ver seguir_novedades) y el
+proceso web lo suma a la suya con `incorporar`: esa es la que se muestra en
+/cacherutas y la que se guarda en disco.
+"""
+
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+Ruta = Tuple[List[int], float, float]
+
+
+class CacheRutas:
+    def __init__(self, max_entradas: int = 5000):
+        self.max_entradas = max_entradas
+        self._datos: "OrderedDict[Hashable, Ruta]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        # Solo en procesos del pool: rutas nuevas y contadores ya reportados
+        self._novedades: Optional[List[Tuple[Hashable, Ruta]]] = None
+        self._aciertos_reportados = 0
+        self._fallos_reportados = 0
+
+    def obtener(self, clave: Hashable) -> Optional[Ruta]:
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is None:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+        path, dist_km, tiempo_min = valor
+        return list(path), dist_km, tiempo_min
+
+    def guardar(self, clave: Hashable, valor: Ruta) -> None:
+        path, dist_km, tiempo_min = valor
+        valor = (tuple(path), dist_km, tiempo_min)
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            self._recortar()
+            if self._novedades is not None:
+                self._novedades.append((clave, valor))
+
+    def _recortar(self) -> None:
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+            self.desalojos += 1
+
+    # ---------------- entre procesos ----------------
+
+    def seguir_novedades(self) -> None:
+        """A partir de ahora anota lo nuevo para tomar_novedades (procesos del pool)."""
+        with self._lock:
+            self._novedades = []
+            self._aciertos_reportados = self.aciertos
+            self._fallos_reportados = self.fallos
+
+    def tomar_novedades(self) -> Optional[Dict[str, Any]]:
+        """
+        Rutas guardadas y aciertos/fallos desde la última llamada, o None si
+        esta caché no anota novedades (el proceso web).
+        """
+        with self._lock:
+            if self._novedades is None:
+                return None
+            novedades = {
+                "rutas": self._novedades,
+                "aciertos": self.aciertos - self._aciertos_reportados,
+                "fallos": self.fallos - self._fallos_reportados,
+            }
+            self._novedades = []
+            self._aciertos_reportados = self.aciertos
+            self._fallos_reportados = self.fallos
+        return novedades
+
+    def incorporar(self, novedades: Optional[Dict[str, Any]]) -> None:
+        """Suma lo que reportó otro proceso con tomar_novedades."""
+        if not novedades:
+            return
+        with self._lock:
+            for clave, valor in novedades["rutas"]:
+                self._datos[clave] = valor
+                self._datos.move_to_end(clave)
+            self._recortar()
+            self.aciertos += novedades["aciertos"]
+            self.fallos += novedades["fallos"]
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else None,
+            }
+
+    # ---------------- persistencia ----------------
+
+    def guardar_en_disco(self, path: str) -> None:
+        with self._lock:
+            items = list(self._datos.items())
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(items, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        logging.info(f"[CACHE RUTAS] {len(items)} rutas guardadas en {path}")
+
+    def cargar_de_disco(self, path: str, version: Optional[str] = None) -> int:
+        """
+        Carga entradas guardadas antes. Si se pasa `version`, descarta las que
+        no sean de esa versión del grafo (la versión es el primer campo de la clave).
+        """
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "rb") as f:
+                items = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"[CACHE RUTAS] No se pudo leer {path}: {e}")
+            return 0
+
+        cargadas = 0
+        with self._lock:
+            for clave, valor in items[-self.max_entradas:]:
+                if version is not None and clave[0] != version:
+                    continue
+                self._datos[clave] = valor
+                cargadas += 1
+        logging.info(f"[CACHE RUTAS] {cargadas} rutas cargadas desde {path}")
+        return cargadas
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+Contraction Hierarchies (CH) sobre el GrafoCSR de Salto.
+
+Preproceso (una vez por snapshot, offline):
+    - se "contraen" los nodos de a uno, del menos al más importante;
+    - al sacar un nodo v se agregan atajos u -> w si el único camino mínimo
+      de u a w pasaba por v (búsqueda de testigos acotada).
+
+Consulta: Dijkstra bidireccional que SOLO sube de rango (desde el origen por
+aristas hacia adelante, desde el destino por aristas hacia atrás). Explora
+unos pocos cientos de nodos aunque el grafo tenga miles, así que sirve para
+muchas consultas punto a punto (lotes, matrices).
+
+El resultado se guarda al lado del snapshot del grafo:
+    python -m Algoritmos.contraccion --construir [--peso tiempo]
+"""
+
+import argparse
+import heapq
+import logging
+import math
+import os
+import pickle
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from Algoritmos import grafo_salto
+from Algoritmos.grafo_csr import GrafoCSR, obtener_csr
+
+# Cuántos nodos puede asentar una búsqueda de testigos antes de rendirse
+# (si se rinde, se agrega el atajo: más atajos, pero el resultado es correcto)
+MAX_ASENTADOS_TESTIGO = 500
+
+
+def ruta_ch(peso: str = "tiempo") -> str:
+    base, _ = os.path.splitext(grafo_salto.ruta_snapshot())
+    return f"{base}.ch-{peso}.pickle"
+
+
+# -----------------------------------------------------------
+# PREPROCESO
+# -----------------------------------------------------------
+
+def _buscar_testigos(salientes, origen: int, excluido: int, objetivos: Dict[int, float]) -> set:
+    """
+    Dijkstra acotado desde `origen` sin pasar por `excluido`.
+    Devuelve los objetivos w que tienen un camino alternativo de costo <= objetivos[w].
+    """
+    limite = max(objetivos.values())
+    dist = {origen: 0.0}
+    pq = [(0.0, origen)]
+    asentados = 0
+
+    while pq:
+        d, u = heapq.heappop(pq)
+        if d > dist[u]:
+            continue
+        if d > limite or asentados >= MAX_ASENTADOS_TESTIGO:
+            break
+        asentados += 1
+        for x, (w, _) in salientes[u].items():
+            if x == excluido:
+                continue
+            nd = d + w
+            if nd < dist.get(x, math.inf):
+                dist[x] = nd
+                heapq.heappush(pq, (nd, x))
+
+    return {w for w, costo in objetivos.items() if dist.get(w, math.inf) <= costo}
+
+
+def _atajos_necesarios(salientes, entrantes, v: int) -> List[Tuple[int, int, float]]:
+    atajos = []
+    for u, (w_uv, _) in entrantes[v].items():
+        objetivos = {w: w_uv + w_vw for w, (w_vw, _) in salientes[v].items() if w != u}
+        if not objetivos:
+            continue
+        testigos = _buscar_testigos(salientes, u, v, objetivos)
+        for w, costo in objetivos.items():
+            if w not in testigos:
+                atajos.append((u, w, costo))
+    return atajos
+
+
+def _a_csr(n: int, listas: List[List[Tuple[int, float, int]]]) -> Tuple[np.ndarray, ...]:
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(l) for l in listas], out=offsets[1:])
+    planas = [a for l in listas for a in l]
+    destinos = np.array([a[0] for a in planas], dtype=np.int32)
+    pesos = np.array([a[1] for a in planas], dtype=np.float64)
+    medios = np.array([a[2] for a in planas], dtype=np.int32)
+    return offsets, destinos, pesos, medios
+
+
+def construir_ch(csr: GrafoCSR, peso: str = "tiempo") -> "JerarquiaContraccion":
+    """Contrae todo el grafo. Puede tardar (se hace offline, ver CLI)."""
+    n = csr.n
+    costos = csr.tiempo_s if peso == "tiempo" else csr.longitud_m
+    fuentes = csr.fuentes.tolist()
+    destinos = csr.destinos.tolist()
+    costos = costos.astype(np.float64).tolist()
+
+    # Grafo "restante" (sin los nodos ya contraídos): {vecino: (costo, nodo_medio)}
+    salientes: List[Dict[int, Tuple[float, int]]] = [dict() for _ in range(n)]
+    entrantes: List[Dict[int, Tuple[float, int]]] = [dict() for _ in range(n)]
+    for u, v, c in zip(fuentes, destinos, costos):
+        if u == v:
+            continue
+        if v not in salientes[u] or c < salientes[u][v][0]:
+            salientes[u][v] = (c, -1)
+            entrantes[v][u] = (c, -1)
+
+    sube_adelante: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+    sube_atras: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+    rango = np.full(n, -1, dtype=np.int32)
+    vecinos_borrados = [0] * n
+
+    def prioridad(v: int, atajos) -> int:
+        return len(atajos) - len(entrantes[v]) - len(salientes[v]) + vecinos_borrados[v]
+
+    heap = [(prioridad(v, _atajos_necesarios(salientes, entrantes, v)), v) for v in range(n)]
+    heapq.heapify(heap)
+
+    siguiente = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        atajos = _atajos_necesarios(salientes, entrantes, v)
+        nueva = prioridad(v, atajos)
+        if heap and nueva > heap[0][0]:
+            heapq.heappush(heap, (nueva, v))
+            continue
+
+        for u, w, c in atajos:
+            if w not in salientes[u] or c < salientes[u][w][0]:
+                salientes[u][w] = (c, v)
+                entrantes[w][u] = (c, v)
+
+        # Lo que queda conectado a v tiene rango mayor: son aristas "hacia arriba"
+        sube_adelante[v] = [(w, c, m) for w, (c, m) in salientes[v].items()]
+        sube_atras[v] = [(u, c, m) for u, (c, m) in entrantes[v].items()]
+        for w in salientes[v]:
+            del entrantes[w][v]
+            vecinos_borrados[w] += 1
+        for u in entrantes[v]:
+            del salientes[u][v]
+            vecinos_borrados[u] += 1
+        salientes[v] = {}
+        entrantes[v] = {}
+
+        rango[v] = siguiente
+        siguiente += 1
+
+    return JerarquiaContraccion(
+        version=csr.version,
+        peso=peso,
+        rango=rango,
+        adelante=_a_csr(n, sube_adelante),
+        atras=_a_csr(n, sube_atras),
+    )
+
+
+# -----------------------------------------------------------
+# CONSULTA
+# -----------------------------------------------------------
+
+class JerarquiaContraccion:
+    def __init__(self, version: str, peso: str, rango: np.ndarray, adelante, atras):
+        self.version = version
+        self.peso = peso
+        self.rango = rango
+        self.adelante = adelante
+        self.atras = atras
+
+        # Para el bucle de consulta usamos listas de Python por nodo
+        self._adelante = self._listas(adelante)
+        self._atras = self._listas(atras)
+
+        # Nodo medio de cada atajo (a, b); las aristas originales no están
+        self._medio: Dict[Tuple[int, int], int] = {}
+        for v, aristas in enumerate(self._adelante):
+            for w, _, m in aristas:
+                if m >= 0:
+                    self._medio[(v, w)] = m
+        for v, aristas in enumerate(self._atras):
+            for u, _, m in aristas:
+                if m >= 0:
+                    self._medio[(u, v)] = m
+
+    @staticmethod
+    def _listas(partes) -> List[List[Tuple[int, float, int]]]:
+        offsets, destinos, pesos, medios = (p.tolist() for p in partes)
+        return [
+            list(zip(destinos[offsets[i]:offsets[i + 1]],
+                     pesos[offsets[i]:offsets[i + 1]],
+                     medios[offsets[i]:offsets[i + 1]]))
+            for i in range(len(offsets) - 1)
+        ]
+
+    @property
+    def cantidad_atajos(self) -> int:
+        return len(self._medio)
+
+    def consulta(self, origen: int, destino: int) -> Tuple[float, List[int]]:
+        """
+        Costo mínimo y camino (índices internos) origen -> destino.
+        Devuelve (inf, []) si no hay camino.
+        """
+        if origen == destino:
+            return 0.0, [origen]
+
+        dist = ({origen: 0.0}, {destino: 0.0})
+        previo = ({origen: (-1, -1)}, {destino: (-1, -1)})
+        colas = ([(0.0, origen)], [(0.0, destino)])
+        aristas = (self._adelante, self._atras)
+        mejor = math.inf
+        encuentro = -1
+
+        while True:
+            tope_f = colas[0][0][0] if colas[0] else math.inf
+            tope_b = colas[1][0][0] if colas[1] else math.inf
+            if min(tope_f, tope_b) >= mejor:
+                break
+            # Avanzamos el lado con menor tope (si el otro ya no sirve, siempre este)
+            lado = 0 if tope_f <= tope_b else 1
+
+            d, u = heapq.heappop(colas[lado])
+            mio, otro = dist[lado], dist[1 - lado]
+            if d > mio[u]:
+                continue
+            if u in otro and d + otro[u] < mejor:
+                mejor = d + otro[u]
+                encuentro = u
+
+            # Stall-on-demand: si a u se llega más barato bajando desde un nodo
+            # de rango mayor ya alcanzado, no vale la pena expandirlo
+            if any(mio.get(x, math.inf) + c < d for x, c, _ in aristas[1 - lado][u]):
+                continue
+
+            for x, c, m in aristas[lado][u]:
+                nd = d + c
+                if nd < mio.get(x, math.inf):
+                    mio[x] = nd
+                    previo[lado][x] = (u, m)
+                    heapq.heappush(colas[lado], (nd, x))
+                    if x in otro and nd + otro[x] < mejor:
+                        mejor = nd + otro[x]
+                        encuentro = x
+
+        if encuentro < 0:
+            return math.inf, []
+
+        # Aristas (a, b, medio) de la jerarquía, en orden origen -> destino
+        subida = []
+        x = encuentro
+        while x != origen:
+            p, m = previo[0][x]
+            subida.append((p, x, m))
+            x = p
+        subida.reverse()
+        x = encuentro
+        while x != destino:
+            s, m = previo[1][x]
+            subida.append((x, s, m))
+            x = s
+
+        camino = [origen]
+        for a, b, m in subida:
+            self._desempacar(a, b, m, camino)
+        return mejor, camino
+
+    def _desempacar(self, a: int, b: int, medio: int, camino: List[int]) -> None:
+        """Expande un atajo a -> b en las aristas originales (agrega a `camino`)."""
+        pila = [(a, b, medio)]
+        while pila:
+            a, b, m = pila.pop()
+            if m < 0:
+                camino.append(b)
+                continue
+            pila.append((m, b, self._medio.get((m, b), -1)))
+            pila.append((a, m, self._medio.get((a, m), -1)))
+
+    # ---------------- persistencia ----------------
+
+    def guardar(self, path: Optional[str] = None) -> str:
+        path = path or ruta_ch(self.peso)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(
+                {
+                    "version": self.version,
+                    "peso": self.peso,
+                    "rango": self.rango,
+                    "adelante": self.adelante,
+                    "atras": self.atras,
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def cargar(cls, path: str) -> "JerarquiaContraccion":
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return cls(**data)
+
+
+_lock = threading.Lock()
+# peso -> (versión del grafo, jerarquía). None = "no hay una válida para esa
+# versión": se recuerda para no ir al disco en cada ruta.
+_jerarquias: Dict[str, Tuple[str, Optional[JerarquiaContraccion]]] = {}
+
+
+def obtener_ch(peso: str = "tiempo", construir_si_falta: bool = False) -> Optional[JerarquiaContraccion]:
+    """
+    Jerarquía para el grafo cargado. Se lee del disco si hay una de la misma
+    versión del snapshot; si no, se construye solo si `construir_si_falta`
+    (tarda, por eso al arrancar el servidor NO se construye).
+    El resultado, también "no hay", queda en memoria hasta que cambie la
+    versión del grafo.
+    """
+    csr = obtener_csr()
+    entrada = _jerarquias.get(peso)
+    if entrada is not None and entrada[0] == csr.version:
+        if entrada[1] is not None or not construir_si_falta:
+            return entrada[1]
+
+    with _lock:
+        entrada = _jerarquias.get(peso)
+        if entrada is not None and entrada[0] == csr.version:
+            if entrada[1] is not None or not construir_si_falta:
+                return entrada[1]
+
+        ch = None
+        path = ruta_ch(peso)
+        if os.path.exists(path):
+            ch = JerarquiaContraccion.cargar(path)
+            if ch.version != csr.version:
+                logging.warning(f"[CH] {path} es de otra versión del grafo ({ch.version}), se ignora")
+                ch = None
+
+        if ch is None and construir_si_falta:
+            t0 = time.perf_counter()
+            ch = construir_ch(csr, peso)
+            ch.guardar(path)
+            logging.info(f"[CH] Jerarquía '{peso}' construida en {time.perf_counter() - t0:.1f}s")
+
+        _jerarquias[peso] = (csr.version, ch)
+        return ch
+
+
+# -----------------------------------------------------------
+# CLI
+# -----------------------------------------------------------
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Contraction Hierarchies del grafo de Salto")
+    parser.add_argument("--construir", action="store_true", help="(Re)construye y guarda la jerarquía")
+    parser.add_argument("--peso", choices=("tiempo", "longitud"), default="tiempo")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.construir:
+        path = ruta_ch(args.peso)
+        if os.path.exists(path):
+            os.remove(path)
+    ch = obtener_ch(args.peso, construir_si_falta=args.construir)
+    if ch is None:
+        print("No hay jerarquía para el grafo actual. Construila con --construir")
+        return
+    print(f"Jerarquía '{ch.peso}' version={ch.version} atajos={ch.cantidad_atajos}")
+
+
+if __name__ == "__main__":
+    main()
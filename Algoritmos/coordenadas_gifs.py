@@ -7,87 +7,93 @@ Automatically generated by Colab.
 
 
 
-import osmnx as ox
-import networkx as nx
-
 import heapq
-import matplotlib.pyplot as plt
-
-from PIL import Image
-import io
-import os
-
-# Variable global para almacenar frames
-frames = []
-
-# Cargar el grafo de Salto, Uruguay
-place_name = "Salto, Uruguay"
-G = ox.graph_from_place(place_name, network_type="drive")
-
-
-# Procesar atributos del grafo (velocidades, pesos, etc.)
-for edge in G.edges:
-    maxspeed = 40
-    if "maxspeed" in G.edges[edge]:
-        maxspeed = G.edges[edge]["maxspeed"]
-        if type(maxspeed) == list:
-            speeds = [int(speed) for speed in maxspeed]
-            maxspeed = min(speeds)
-        elif type(maxspeed) == str:
-            maxspeed = int(maxspeed)
-    G.edges[edge]["maxspeed"] = maxspeed
-    G.edges[edge]["weight"] = G.edges[edge]["length"] / maxspeed
-
-def style_unvisited_edge(edge):
-    G.edges[edge]["color"] = "#d36206"
-    G.edges[edge]["alpha"] = 0.2
-    G.edges[edge]["linewidth"] = 0.5
-
-def style_visited_edge(edge):
-    G.edges[edge]["color"] = "#d36206"
-    G.edges[edge]["alpha"] = 1
-    G.edges[edge]["linewidth"] = 1
-
-def style_active_edge(edge):
-    G.edges[edge]["color"] = '#e8a900'
-    G.edges[edge]["alpha"] = 1
-    G.edges[edge]["linewidth"] = 1
-
-def style_path_edge(edge):
-    G.edges[edge]["color"] = "white"
-    G.edges[edge]["alpha"] = 1
-    G.edges[edge]["linewidth"] = 1
-
-def plot_graph_to_image(title="", save_frame=False, frame_num=0):
-    plt.style.use('dark_background')
-    fig, ax = plt.subplots(figsize=(12, 12), facecolor='#000000')
-    ax.set_facecolor('#000000')
-    ox.plot_graph(
-        G,
-        ax=ax,
-        node_size=[G.nodes[node]["size"] for node in G.nodes],
-        edge_color=[G.edges[edge]["color"] for edge in G.edges],
-        edge_alpha=[G.edges[edge]["alpha"] for edge in G.edges],
-        edge_linewidth=[G.edges[edge]["linewidth"] for edge in G.edges],
-        node_color="white",
-        bgcolor="#000000",
-        show=False,
-        close=False
+
+from Algoritmos.grafo_salto import obtener_grafo
+from Algoritmos.render_rutas import COLORES_PALETA, a_gif, obtener_render
+
+# Grafo de Salto compartido con Dominio.Rutas (snapshot local).
+# Los atributos "maxspeed" y "weight" ya vienen calculados desde el snapshot.
+G = obtener_grafo()
+
+# ============================================================
+# ESTADO DE UN RENDER
+# ============================================================
+
+class Animacion:
+    """
+    Todo el estado de UN render: frames capturados, estilo de las aristas,
+    nodos destacados y punteros 'previous' de la última búsqueda.
+
+    Antes esto se escribía sobre G.nodes / G.edges (compartidos) y en la
+    lista global `frames`, así que dos renders no podían correr a la vez.
+    Ahora cada llamada usa su propia Animacion y el grafo solo se lee.
+    """
+
+    def __init__(self):
+        self.frames = []
+        # Estilo de cada arista que NO está en el estilo base ("no visitada")
+        self.estilo_aristas = {}
+        self.nodos_destacados = set()
+        self.previous = {}
+
+    def style_unvisited_edge(self, edge):
+        self.estilo_aristas.pop(edge[:2], None)
+
+    def style_visited_edge(self, edge):
+        self.estilo_aristas[edge[:2]] = "visitada"
+
+    def style_active_edge(self, edge):
+        self.estilo_aristas[edge[:2]] = "activa"
+
+    def style_path_edge(self, edge):
+        self.estilo_aristas[edge[:2]] = "camino"
+
+    def reset(self, orig, dest):
+        """Deja todas las aristas sin visitar y destaca origen y destino."""
+        self.estilo_aristas.clear()
+        self.previous = {}
+        self.nodos_destacados = {orig, dest}
+
+
+def plot_graph_to_image(anim, title="", save_frame=False, frame_num=0):
+    """
+    Dibuja el estado de `anim` (aristas estilizadas + nodos destacados)
+    sobre el mapa base cacheado. Devuelve la imagen (PIL).
+    """
+    por_estilo = {"visitada": [], "activa": [], "camino": []}
+    for arista, estilo in anim.estilo_aristas.items():
+        por_estilo[estilo].append(arista)
+
+    img = obtener_render().frame(
+        title,
+        visitadas=por_estilo["visitada"],
+        activas=por_estilo["activa"],
+        camino=por_estilo["camino"],
+        nodos=anim.nodos_destacados,
     )
-    clean_title = title.encode('ascii', 'ignore').decode('ascii')
-    ax.set_title(clean_title, color='white', fontsize=16, pad=20)
 
     if save_frame:
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight',
-                    facecolor='#000000', edgecolor='none', dpi=100)
-        buf.seek(0)
-        img = Image.open(buf).copy()
-        frames.append(img)
-        buf.close()
+        anim.frames.append(img)
 
-    plt.close()
-    return fig
+    return img
+
+def render_ruta_final(caminos, title=""):
+    """
+    Modo "solo imagen final": dibuja de una vez una ruta ya calculada
+    (lista de caminos, cada uno una lista de nodos) sin estilizar aristas
+    paso a paso ni guardar frames. Devuelve la imagen (PIL).
+    """
+    aristas = []
+    nodos = []
+    for camino in caminos:
+        if not camino:
+            continue
+        aristas.extend(zip(camino, camino[1:]))
+        nodos.append(camino[0])
+        nodos.append(camino[-1])
+
+    return obtener_render().frame(title, camino=aristas, nodos=nodos)
 
 def distance(node1, node2):
     x1, y1 = G.nodes[node1]["x"], G.nodes[node1]["y"]
@@ -98,30 +104,23 @@ def distance(node1, node2):
 # ALGORITMO DE DIJKSTRA
 # ============================================================
 
-def dijkstra_gif(orig, dest):
-    global frames
-    frames = []
+def dijkstra_gif(orig, dest, anim=None):
+    """Dijkstra animado. Devuelve la Animacion con los frames capturados."""
+    anim = anim or Animacion()
+    anim.frames = []
 
     # Inicialización: todos los nodos están sin visitar y a distancia infinita
-    for node in G.nodes:
-        G.nodes[node]["visited"] = False
-        G.nodes[node]["distance"] = float("inf")
-        G.nodes[node]["previous"] = None
-        G.nodes[node]["size"] = 0
-    for edge in G.edges:
-        style_unvisited_edge(edge)
-
-    # El nodo origen tiene distancia 0
-    G.nodes[orig]["distance"] = 0
-    G.nodes[orig]["size"] = 50
-    G.nodes[dest]["size"] = 50
+    anim.reset(orig, dest)
+    visited = set()
+    dist = {orig: 0}
+    previous = anim.previous
 
     # Cola de prioridad: almacena (distancia_acumulada, nodo)
     pq = [(0, orig)]
     step = 0
 
     # Guardar frame inicial (para la animación)
-    plot_graph_to_image("Dijkstra - Inicio", save_frame=True, frame_num=0)
+    plot_graph_to_image(anim, "Dijkstra - Inicio", save_frame=True, frame_num=0)
 
     # Bucle principal del algoritmo
     while pq:
@@ -130,72 +129,64 @@ def dijkstra_gif(orig, dest):
 
         # Si llegamos al destino, detenemos el algoritmo
         if node == dest:
-            plot_graph_to_image(f"Dijkstra - Destino encontrado! (Iteraciones: {step})",
+            plot_graph_to_image(anim, f"Dijkstra - Destino encontrado! (Iteraciones: {step})",
                                 save_frame=True, frame_num=step+1)
             break
 
         # Si ya fue visitado, lo ignoramos
-        if G.nodes[node]["visited"]:
+        if node in visited:
             continue
 
         # Marcamos el nodo como visitado
-        G.nodes[node]["visited"] = True
+        visited.add(node)
 
         # Exploramos sus vecinos
         for edge in G.out_edges(node):
-            style_visited_edge((edge[0], edge[1], 0))  # Pintamos la arista explorada
+            anim.style_visited_edge(edge)  # Pintamos la arista explorada
             neighbor = edge[1]
             weight = G.edges[(edge[0], edge[1], 0)]["weight"]
 
             # Si encontramos un camino más corto hacia el vecino, actualizamos
-            if G.nodes[neighbor]["distance"] > G.nodes[node]["distance"] + weight:
-                G.nodes[neighbor]["distance"] = G.nodes[node]["distance"] + weight
-                G.nodes[neighbor]["previous"] = node
+            if dist.get(neighbor, float("inf")) > dist[node] + weight:
+                dist[neighbor] = dist[node] + weight
+                previous[neighbor] = node
                 # Insertamos en la cola con la nueva distancia
-                heapq.heappush(pq, (G.nodes[neighbor]["distance"], neighbor))
+                heapq.heappush(pq, (dist[neighbor], neighbor))
                 # Resaltamos los vecinos activos (en expansión)
                 for edge2 in G.out_edges(neighbor):
-                    style_active_edge((edge2[0], edge2[1], 0))
+                    anim.style_active_edge(edge2)
 
         step += 1
 
         # Guardar frame cada 10 pasos para no generar demasiadas imágenes
         if step % 10 == 0:
-            plot_graph_to_image(f"Dijkstra explorando... (Iteracion: {step})",
+            plot_graph_to_image(anim, f"Dijkstra explorando... (Iteracion: {step})",
                                 save_frame=True, frame_num=step)
 
-    print(f"Dijkstra completado: {len(frames)} frames capturados")
+    print(f"Dijkstra completado: {len(anim.frames)} frames capturados")
+    return anim
 
 # ============================================================
 # ALGORITMO A*
 # ============================================================
 
-def a_star_gif(orig, dest):
-    global frames
-    frames = []
-
-    # Inicializamos valores de cada nodo
-    for node in G.nodes:
-        G.nodes[node]["previous"] = None
-        G.nodes[node]["size"] = 0
-        G.nodes[node]["g_score"] = float("inf")  # costo desde el origen
-        G.nodes[node]["f_score"] = float("inf")  # costo estimado total
-    for edge in G.edges:
-        style_unvisited_edge(edge)
-
-    # Inicializamos el nodo origen
-    G.nodes[orig]["size"] = 50
-    G.nodes[dest]["size"] = 50
-    G.nodes[orig]["g_score"] = 0
-    # f = g + h → h se calcula con la distancia euclidiana (heurística)
-    G.nodes[orig]["f_score"] = distance(orig, dest)
+def a_star_gif(orig, dest, anim=None):
+    """A* animado. Devuelve la Animacion con los frames capturados."""
+    anim = anim or Animacion()
+    anim.frames = []
+
+    # Inicializamos valores (solo los nodos que toca la búsqueda)
+    anim.reset(orig, dest)
+    previous = anim.previous
+    g_score = {orig: 0}  # costo desde el origen
 
+    # f = g + h → h se calcula con la distancia euclidiana (heurística)
     # Cola de prioridad: contiene (f_score, nodo)
-    pq = [(G.nodes[orig]["f_score"], orig)]
+    pq = [(distance(orig, dest), orig)]
     step = 0
 
     # Primer frame
-    plot_graph_to_image("A* - Inicio", save_frame=True, frame_num=0)
+    plot_graph_to_image(anim, "A* - Inicio", save_frame=True, frame_num=0)
 
     # Bucle principal del algoritmo A*
     while pq:
@@ -204,66 +195,65 @@ def a_star_gif(orig, dest):
 
         # Si llegamos al destino, terminamos
         if node == dest:
-            plot_graph_to_image(f"A* - Destino encontrado! (Iteraciones: {step})",
+            plot_graph_to_image(anim, f"A* - Destino encontrado! (Iteraciones: {step})",
                                 save_frame=True, frame_num=step+1)
             break
 
         # Exploramos los vecinos del nodo actual
         for edge in G.out_edges(node):
-            style_visited_edge((edge[0], edge[1], 0))
+            anim.style_visited_edge(edge)
             neighbor = edge[1]
 
             # Costo real desde el origen hasta el vecino (g)
-            tentative_g_score = G.nodes[node]["g_score"] + distance(node, neighbor)
+            tentative_g_score = g_score[node] + distance(node, neighbor)
 
             # Si encontramos un camino más corto hacia el vecino
-            if tentative_g_score < G.nodes[neighbor]["g_score"]:
+            if tentative_g_score < g_score.get(neighbor, float("inf")):
                 # Actualizamos su padre (para reconstruir el camino)
-                G.nodes[neighbor]["previous"] = node
-                G.nodes[neighbor]["g_score"] = tentative_g_score
+                previous[neighbor] = node
+                g_score[neighbor] = tentative_g_score
                 # f = g + h (h = distancia estimada al destino)
-                G.nodes[neighbor]["f_score"] = tentative_g_score + distance(neighbor, dest)
+                f_score = tentative_g_score + distance(neighbor, dest)
                 # Insertamos en la cola con prioridad f_score
-                heapq.heappush(pq, (G.nodes[neighbor]["f_score"], neighbor))
+                heapq.heappush(pq, (f_score, neighbor))
                 # Resaltamos los vecinos activos
                 for edge2 in G.out_edges(neighbor):
-                    style_active_edge((edge2[0], edge2[1], 0))
+                    anim.style_active_edge(edge2)
 
         step += 1
 
         # Guardamos un frame cada 5 pasos (A* suele ser más rápido)
         if step % 5 == 0:
-            plot_graph_to_image(f"A* explorando... (Iteracion: {step})",
+            plot_graph_to_image(anim, f"A* explorando... (Iteracion: {step})",
                                 save_frame=True, frame_num=step)
 
-    print(f"A* completado: {len(frames)} frames capturados")
+    print(f"A* completado: {len(anim.frames)} frames capturados")
+    return anim
 
 # ============================================================
 
-def reconstruct_path_gif(orig, dest, algorithm_name=""):
+def reconstruct_path_gif(orig, dest, algorithm_name="", anim=None):
     """
-    Reconstruye el camino usando los punteros 'previous' dejados por a_star_gif
-    y calcula la distancia total en km. También agrega frames para el GIF.
+    Reconstruye el camino usando los punteros 'previous' que dejó la
+    búsqueda en `anim` y calcula la distancia total en km.
+    También agrega el frame final a anim.frames.
     """
-    global frames  # 🔴 ESTA LÍNEA TIENE QUE SER LA PRIMERA DENTRO DE LA FUNCIÓN
-
     # 1) Chequeo básico: ¿hay camino?
-    if G.nodes[dest].get("previous") is None and dest != orig:
+    if anim is None or (anim.previous.get(dest) is None and dest != orig):
         print("No se encontro un camino valido")
         return False
 
     # 2) Resetear estilos de aristas
-    for edge in G.edges:
-        style_unvisited_edge(edge)
+    anim.estilo_aristas.clear()
 
     dist_m = 0.0
-    speeds = []
+    tiempo_h = 0.0
     curr = dest
     path_edges = []
 
     # 3) Reconstruir camino dest -> orig
     while curr != orig:
-        prev = G.nodes[curr].get("previous")
+        prev = anim.previous.get(curr)
         if prev is None:
             # Camino roto, no deberia pasar si se chequeo arriba
             break
@@ -278,23 +268,19 @@ def reconstruct_path_gif(orig, dest, algorithm_name=""):
             maxspeed = 30.0
 
         dist_m += length
-        speeds.append(maxspeed)
+        tiempo_h += (length / 1000.0) / maxspeed
 
         # Estilizamos esta arista como parte del camino óptimo
         path_edges.append((prev, curr, 0))
-        style_visited_edge((prev, curr, 0))
+        anim.style_visited_edge((prev, curr, 0))
 
         curr = prev
 
     path_edges.reverse()
     dist_km = dist_m / 1000.0
-
-    if speeds:
-        vel_prom = sum(speeds) / len(speeds)
-        tiempo_min = dist_km / vel_prom * 60.0
-    else:
-        vel_prom = 0.0
-        tiempo_min = 0.0
+    tiempo_min = tiempo_h * 60.0
+    # Velocidad media real del recorrido (ponderada por largo de cada tramo)
+    vel_prom = dist_km / tiempo_h if tiempo_h > 0 else 0.0
 
     if vel_prom > 0:
         final_title = (
@@ -310,52 +296,37 @@ def reconstruct_path_gif(orig, dest, algorithm_name=""):
         )
 
     # Frame final
-    plot_graph_to_image(final_title, save_frame=True, frame_num=len(path_edges))
+    plot_graph_to_image(anim, final_title, save_frame=True, frame_num=len(path_edges))
 
     print(f"Distancia: {dist_km:.2f} km")
     if vel_prom > 0:
         print(f"Velocidad promedio: {vel_prom:.1f} km/h")
         print(f"Tiempo total: {tiempo_min:.1f} minutos")
-    print(f"Camino completado: {len(frames)} frames totales")
+    print(f"Camino completado: {len(anim.frames)} frames totales")
 
     return True
 
 
-def create_gif(output_path="pathfinding.gif", duration=0.6, loop=0):
+def create_gif(frames, duration=0.6, loop=0, colores=COLORES_PALETA):
     """
-    Crea el GIF a partir de la lista global 'frames' y, además,
-    guarda el ÚLTIMO frame como PNG para poder enviarlo por WhatsApp.
-    Devuelve (gif_path, png_path).
+    Codifica los frames como GIF en memoria (paleta compartida y reducida,
+    ver render_rutas.a_gif) y devuelve los bytes, o None si no hay frames.
+    No escribe nada en disco: quien lo llama decide qué hacer con los bytes.
     """
-    global frames
-
     if not frames:
         print("No hay frames para crear el GIF.")
-        return None, None
-
-    # 1) Crear el GIF como siempre
-    frames[0].save(
-        output_path,
-        save_all=True,
-        append_images=frames[1:],
-        duration=int(duration * 1000),
-        loop=loop,
-    )
+        return None
+
+    gif = a_gif(frames, duracion_s=duration, loop=loop, colores=colores)
+    print(f"GIF creado: {len(frames)} frames | {len(gif) / 1024:.0f} KB")
+    return gif
 
-    # 2) Guardar el último frame como PNG
-    png_path = os.path.splitext(output_path)[0] + ".png"
-    try:
-        ultimo_frame = frames[-1]
-        # Si ultimo_frame es un objeto PIL.Image:
-        ultimo_frame.save(png_path, format="PNG")
-        print(f"PNG del frame final creado: {png_path}")
-    except Exception as e:
-        print(f"Error al guardar el PNG final: {e}")
-        png_path = None
-
-    print(f"GIF creado exitosamente: {output_path}")
-    print(f"{len(frames)} frames | PNG final en: {png_path}")
-    return output_path, png_path
+
+def _guardar(path, contenido):
+    """Solo para la demo de consola de abajo."""
+    with open(path, "wb") as f:
+        f.write(contenido)
+    print(f"Guardado: {path}")
 
 def get_coordinates():
     print("SELECCION DE COORDENADAS PARA SALTO, URUGUAY")
@@ -391,18 +362,15 @@ def get_coordinates():
             return (-31.3833, -57.9667), (-31.3825, -57.9658)
 
 if __name__ == "__main__":
-    largest_cc = max(nx.strongly_connected_components(G), key=len)
-    valid_nodes = list(largest_cc)
+    from Algoritmos.indice_espacial import obtener_indice
+
+    # El índice solo contiene nodos de la componente fuertemente conexa
+    # principal, así que origen y destino siempre tienen camino.
+    indice = obtener_indice()
+    valid_nodes = indice.indices
     start_coords, end_coords = get_coordinates()
     print("\nBuscando nodos mas cercanos a tus coordenadas...")
-    start = ox.distance.nearest_nodes(G, start_coords[1], start_coords[0])
-    end = ox.distance.nearest_nodes(G, end_coords[1], end_coords[0])
-    if start not in valid_nodes:
-        print("El punto de origen no esta en la red vial principal. Buscando alternativa...")
-        start = min(valid_nodes, key=lambda n: ((G.nodes[n]['x'] - start_coords[1])**2 + (G.nodes[n]['y'] - start_coords[0])**2)**0.5)
-    if end not in valid_nodes:
-        print("El punto de destino no esta en la red vial principal. Buscando alternativa...")
-        end = min(valid_nodes, key=lambda n: ((G.nodes[n]['x'] - end_coords[1])**2 + (G.nodes[n]['y'] - end_coords[0])**2)**0.5)
+    start, end = (int(n) for n in indice.snap_many([start_coords, end_coords]))
     print(f"\nCOORDENADAS SELECCIONADAS:")
     print(f"Origen: {start_coords[0]:.4f}, {start_coords[1]:.4f} → Nodo {start}")
     print(f"Destino: {end_coords[0]:.4f}, {end_coords[1]:.4f} → Nodo {end}")
@@ -410,14 +378,14 @@ if __name__ == "__main__":
     print("\n" + "="*50)
     print("1️⃣ GENERANDO GIF DE DIJKSTRA")
     print("-" * 30)
-    dijkstra_gif(start, end)
-    if reconstruct_path_gif(start, end, "Dijkstra"):
-        dijkstra_gif_file = create_gif("Dijkstra", duration=600)
+    anim = dijkstra_gif(start, end)
+    if reconstruct_path_gif(start, end, "Dijkstra", anim):
+        _guardar("Dijkstra.gif", create_gif(anim.frames, duration=0.6))
     print("\n" + "="*50)
     print("2️⃣ GENERANDO GIF DE A*")
     print("-" * 30)
-    a_star_gif(start, end)
-    if reconstruct_path_gif(start, end, "A_Star"):
-        astar_gif_file = create_gif("A_Star", duration=400)
+    anim = a_star_gif(start, end)
+    if reconstruct_path_gif(start, end, "A_Star", anim):
+        _guardar("A_Star.gif", create_gif(anim.frames, duration=0.4))
     print("\n" + "="*20)
     print("GIFs generados exitosamente!")
\ No newline at end of file
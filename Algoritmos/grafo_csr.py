@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Representación compacta (CSR) del grafo vial de Salto para el ruteo.
+
+El MultiDiGraph de osmnx guarda cada arista como dict-de-dicts, lo cual es
+cómodo para dibujar pero lento y pesado para calcular rutas. Acá se arma UNA
+vez un grafo "congelado" con arrays de NumPy:
+
+    offsets[i] .. offsets[i+1]  -> posiciones de las aristas que salen del nodo i
+    destinos[k]                 -> índice del nodo destino de la arista k
+    longitud_m[k], maxspeed[k], tiempo_s[k]
+
+Los nodos se identifican por índice (0..n-1); `nodos[i]` es el id OSM.
+
+Entre aristas paralelas u -> v (mismo par, distinta calle o carril) queda
+UNA posición k, pero los dos pesos se eligen por separado: longitud_m es el
+de la paralela más corta y tiempo_s el de la más rápida. Así ni el ruteo por
+distancia ni el ruteo por tiempo se quedan con una arista peor. Para informar
+la otra magnitud del camino elegido se usa `magnitudes(peso)`.
+"""
+
+import threading
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from Algoritmos.grafo_salto import obtener_grafo, parse_maxspeed, version_grafo
+
+# scipy no distingue bien una arista de largo 0 de "no hay arista"
+_PESO_MINIMO = 1e-3
+
+
+@dataclass(frozen=True)
+class GrafoCSR:
+    nodos: np.ndarray        # id OSM de cada índice
+    lat: np.ndarray
+    lon: np.ndarray
+    offsets: np.ndarray      # int64, largo n+1
+    destinos: np.ndarray     # int32, largo m
+    longitud_m: np.ndarray   # float32, de la paralela más corta
+    maxspeed: np.ndarray     # float32, km/h de la paralela más rápida
+    tiempo_s: np.ndarray     # float32, segundos de la paralela más rápida
+    largo_rapida_m: np.ndarray  # float32, largo de la paralela más rápida
+    tiempo_corta_s: np.ndarray  # float32, segundos de la paralela más corta
+    indice: Dict[int, int]   # id OSM -> índice
+    version: str = ""
+
+    @property
+    def n(self) -> int:
+        return len(self.nodos)
+
+    @property
+    def m(self) -> int:
+        return len(self.destinos)
+
+    def idx(self, nodo: int) -> int:
+        """Índice interno de un nodo OSM (KeyError si no está en el grafo)."""
+        return self.indice[nodo]
+
+    def arista(self, u: int, v: int) -> int:
+        """Posición de la arista u -> v (índices internos), o -1 si no existe."""
+        inicio, fin = self.offsets[u], self.offsets[u + 1]
+        pos = np.flatnonzero(self.destinos[inicio:fin] == v)
+        return int(inicio + pos[0]) if len(pos) else -1
+
+    def magnitudes(self, peso: str = "tiempo") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (largo_m, tiempo_s) por arista, de la paralela que usa el ruteo por
+        `peso`: la más rápida con 'tiempo', la más corta con 'longitud'.
+        """
+        if peso == "tiempo":
+            return self.largo_rapida_m, self.tiempo_s
+        return self.longitud_m, self.tiempo_corta_s
+
+    @cached_property
+    def fuentes(self) -> np.ndarray:
+        """Nodo de origen de cada arista (lo inverso de offsets)."""
+        return np.repeat(np.arange(self.n, dtype=np.int32), np.diff(self.offsets))
+
+    @cached_property
+    def velocidad_maxima(self) -> float:
+        """Velocidad más alta del grafo (km/h), para heurísticas admisibles."""
+        return float(self.maxspeed.max()) if self.m else 1.0
+
+    @cached_property
+    def listas(self) -> Tuple[list, list, list, list]:
+        """
+        (offsets, destinos, longitud_m, tiempo_s) como listas de Python.
+        Recorrer listas en un bucle Python es bastante más rápido que
+        indexar arrays de NumPy elemento por elemento.
+        """
+        return (
+            self.offsets.tolist(),
+            self.destinos.tolist(),
+            self.longitud_m.tolist(),
+            self.tiempo_s.tolist(),
+        )
+
+    @cached_property
+    def coords_rad(self) -> Tuple[list, list]:
+        """(lat, lon) de cada nodo en radianes, como listas de Python."""
+        return np.radians(self.lat).tolist(), np.radians(self.lon).tolist()
+
+    def matriz(self, peso: str = "longitud") -> csr_matrix:
+        """Matriz dispersa n x n con el peso pedido ('longitud' o 'tiempo')."""
+        return self._matriz_tiempo if peso == "tiempo" else self._matriz_longitud
+
+    @cached_property
+    def _matriz_longitud(self) -> csr_matrix:
+        return self._armar_matriz(self.longitud_m)
+
+    @cached_property
+    def _matriz_tiempo(self) -> csr_matrix:
+        return self._armar_matriz(self.tiempo_s)
+
+    def _armar_matriz(self, pesos: np.ndarray) -> csr_matrix:
+        datos = np.maximum(pesos.astype(np.float64), _PESO_MINIMO)
+        return csr_matrix((datos, self.destinos, self.offsets), shape=(self.n, self.n))
+
+
+def _solo_lectura(*arrays: np.ndarray) -> None:
+    for a in arrays:
+        a.flags.writeable = False
+
+
+def construir_csr(G: nx.MultiDiGraph, version: str = "") -> GrafoCSR:
+    """
+    Arma el GrafoCSR a partir del MultiDiGraph de osmnx.
+    Entre aristas paralelas u -> v, el peso 'longitud' sale de la más corta
+    (igual que nx.shortest_path con weight="length") y el peso 'tiempo' de
+    la más rápida, cada una elegida por su lado.
+    """
+    nodos = np.fromiter(G.nodes, dtype=np.int64, count=G.number_of_nodes())
+    indice = {int(nodo): i for i, nodo in enumerate(nodos)}
+    lat = np.array([G.nodes[n]["y"] for n in nodos], dtype=np.float64)
+    lon = np.array([G.nodes[n]["x"] for n in nodos], dtype=np.float64)
+
+    us: List[int] = []
+    vs: List[int] = []
+    largos: List[float] = []
+    velocidades: List[float] = []
+    for u, v, data in G.edges(data=True):
+        us.append(indice[u])
+        vs.append(indice[v])
+        largos.append(float(data.get("length", 0.0)))
+        velocidades.append(parse_maxspeed(data.get("maxspeed")))
+
+    u_arr = np.array(us, dtype=np.int32)
+    v_arr = np.array(vs, dtype=np.int32)
+    largo_arr = np.array(largos, dtype=np.float32)
+    vel_arr = np.array(velocidades, dtype=np.float32)
+    tiempo_arr = (largo_arr / 1000.0 / vel_arr * 3600.0).astype(np.float32)
+
+    # Dos órdenes por (u, v): uno desempata por largo y otro por tiempo. Los
+    # grupos (u, v) quedan en la misma posición en ambos, así que la primera
+    # de cada grupo es la paralela más corta en uno y la más rápida en el otro.
+    corta = np.lexsort((largo_arr, v_arr, u_arr))
+    rapida = np.lexsort((tiempo_arr, v_arr, u_arr))
+    if len(corta):
+        u_ord, v_ord = u_arr[corta], v_arr[corta]
+        primera = np.ones(len(corta), dtype=bool)
+        primera[1:] = (u_ord[1:] != u_ord[:-1]) | (v_ord[1:] != v_ord[:-1])
+        corta, rapida = corta[primera], rapida[primera]
+
+    u_arr, v_arr = u_arr[corta], v_arr[corta]
+    offsets = np.zeros(len(nodos) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(u_arr, minlength=len(nodos)), out=offsets[1:])
+
+    longitud_m, tiempo_corta_s = largo_arr[corta], tiempo_arr[corta]
+    largo_rapida_m, tiempo_s = largo_arr[rapida], tiempo_arr[rapida]
+    vel_arr = vel_arr[rapida]
+
+    _solo_lectura(
+        nodos, lat, lon, offsets, v_arr, longitud_m, vel_arr, tiempo_s,
+        largo_rapida_m, tiempo_corta_s,
+    )
+    return GrafoCSR(
+        nodos=nodos,
+        lat=lat,
+        lon=lon,
+        offsets=offsets,
+        destinos=v_arr,
+        longitud_m=longitud_m,
+        maxspeed=vel_arr,
+        tiempo_s=tiempo_s,
+        largo_rapida_m=largo_rapida_m,
+        tiempo_corta_s=tiempo_corta_s,
+        indice=indice,
+        version=version,
+    )
+
+
+_lock = threading.Lock()
+_csr: Optional[GrafoCSR] = None
+
+
+def obtener_csr() -> GrafoCSR:
+    """GrafoCSR compartido, construido una sola vez desde el grafo de Salto."""
+    global _csr
+    if _csr is None:
+        with _lock:
+            if _csr is None:
+                _csr = construir_csr(obtener_grafo(), version=version_grafo())
+    return _csr
+
+
+# -----------------------------------------------------------
+# MOTOR DE RUTAS SOBRE EL CSR
+# -----------------------------------------------------------
+
+def camino_desde_predecesores(predecesores: np.ndarray, origen: int, destino: int) -> List[int]:
+    """Reconstruye origen -> destino (índices internos) desde un array de predecesores."""
+    camino = [destino]
+    actual = destino
+    while actual != origen:
+        actual = int(predecesores[actual])
+        if actual < 0:
+            return []
+        camino.append(actual)
+    camino.reverse()
+    return camino
+
+
+def resumen_camino(csr: GrafoCSR, camino: List[int], peso: str = "tiempo") -> Tuple[float, float]:
+    """
+    Devuelve (dist_km, tiempo_min) de un camino de índices internos.
+    El tiempo es la suma del tiempo de cada arista (largo / maxspeed), o sea
+    que los tramos largos pesan más que los cortos. `peso` es con el que se
+    buscó el camino: decide cuál de las aristas paralelas se recorrió.
+    """
+    if len(camino) < 2:
+        return 0.0, 0.0
+
+    aristas = [csr.arista(u, v) for u, v in zip(camino, camino[1:])]
+    aristas = [k for k in aristas if k >= 0]
+    if not aristas:
+        return 0.0, 0.0
+
+    largo_m, tiempo_s = csr.magnitudes(peso)
+    dist_km = float(largo_m[aristas].sum(dtype=np.float64)) / 1000.0
+    tiempo_min = float(tiempo_s[aristas].sum(dtype=np.float64)) / 60.0
+    return dist_km, tiempo_min
+
+
+def ruta(csr: GrafoCSR, nodo_origen: int, nodo_destino: int, peso: str = "longitud"):
+    """
+    Ruta más corta ('longitud' o 'tiempo') entre dos nodos OSM, con Dijkstra.
+    Devuelve lo mismo que Rutas.a_star_ruta: (path, dist_km, tiempo_min).
+    """
+    o = csr.idx(nodo_origen)
+    d = csr.idx(nodo_destino)
+    if o == d:
+        return [nodo_origen], 0.0, 0.0
+
+    _, predecesores = dijkstra(
+        csr.matriz(peso), directed=True, indices=o, return_predecessors=True
+    )
+    camino = camino_desde_predecesores(predecesores, o, d)
+    if not camino:
+        return [nodo_origen], 0.0, 0.0
+
+    dist_km, tiempo_min = resumen_camino(csr, camino, peso)
+    return [int(csr.nodos[i]) for i in camino], dist_km, tiempo_min
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Proveedor ÚNICO del grafo vial de Salto.
+
+Antes cada módulo (Rutas, coordenadas_gifs) descargaba su propio grafo de
+OpenStreetMap al importarse. Ahora el grafo se lee una sola vez desde un
+snapshot local versionado y todos comparten la MISMA instancia.
+
+Refrescar el snapshot (fuera del arranque del servidor):
+    python -m Algoritmos.grafo_salto --refrescar
+    python -m Algoritmos.grafo_salto --desde-graphml salto.graphml
+    python -m Algoritmos.grafo_salto --info
+"""
+
+import argparse
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import networkx as nx
+
+PLACE_NAME = "Salto, Uruguay"
+NETWORK_TYPE = "drive"
+
+# Versión del FORMATO del snapshot. Si cambia cómo preparamos el grafo
+# (atributos, velocidades, etc.) se sube este número y los snapshots viejos
+# dejan de usarse.
+VERSION_SNAPSHOT = 2  # 2: maxspeed con varios valores / en mph bien convertido
+
+VELOCIDAD_DEFAULT = 40.0
+KM_POR_MILLA = 1.609
+_NUMERO = re.compile(r"\d+(?:[.,]\d+)?")
+
+DIR_DATOS = os.getenv(
+    "GRAFO_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"),
+)
+
+_lock = threading.Lock()
+_grafo: Optional[nx.MultiDiGraph] = None
+_meta: Dict[str, Any] = {}
+
+
+# -----------------------------------------------------------
+# HELPERS
+# -----------------------------------------------------------
+
+def parse_maxspeed(raw) -> float:
+    """
+    Convierte el 'maxspeed' de OSM (número, "45", "60 mph", "30;50",
+    ["30", "60"]) a km/h. En un texto con varios valores ("30;50", "30|50")
+    vale el primero; si es una lista nos quedamos con la velocidad más baja.
+    """
+    if raw is None:
+        return VELOCIDAD_DEFAULT
+    if isinstance(raw, (list, tuple)):
+        speeds = [parse_maxspeed(s) for s in raw]
+        return min(speeds) if speeds else VELOCIDAD_DEFAULT
+    if isinstance(raw, str):
+        primero = re.split(r"[;|]", raw)[0].strip().lower()
+        numero = _NUMERO.search(primero)
+        if not numero:
+            return VELOCIDAD_DEFAULT  # "none", "signals", "walk", ...
+        speed = float(numero.group().replace(",", "."))
+        if "mph" in primero:
+            speed *= KM_POR_MILLA
+        return speed if speed > 0 else VELOCIDAD_DEFAULT
+    try:
+        speed = float(raw)
+    except Exception:
+        return VELOCIDAD_DEFAULT
+    return speed if speed > 0 else VELOCIDAD_DEFAULT
+
+
+def ruta_snapshot() -> str:
+    return os.path.join(DIR_DATOS, f"salto_{NETWORK_TYPE}_v{VERSION_SNAPSHOT}.pickle")
+
+
+def _preparar_grafo(G: nx.MultiDiGraph) -> nx.MultiDiGraph:
+    """
+    Deja los atributos de las aristas listos para usar:
+    - maxspeed: float en km/h
+    - weight: length / maxspeed (lo que usa coordenadas_gifs)
+    """
+    for _, _, data in G.edges(data=True):
+        maxspeed = parse_maxspeed(data.get("maxspeed"))
+        data["maxspeed"] = maxspeed
+        data["weight"] = float(data.get("length", 0.0)) / maxspeed
+    return G
+
+
+# -----------------------------------------------------------
+# SNAPSHOT EN DISCO
+# -----------------------------------------------------------
+
+def guardar_snapshot(G: nx.MultiDiGraph, origen: str, path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Guarda el grafo (ya preparado) en disco. Escribe a un archivo temporal
+    y lo renombra, así un worker nunca lee un snapshot a medio escribir.
+    """
+    path = path or ruta_snapshot()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    meta = {
+        "version": VERSION_SNAPSHOT,
+        "place": PLACE_NAME,
+        "network_type": NETWORK_TYPE,
+        "origen": origen,
+        "creado": int(time.time()),
+        "nodos": G.number_of_nodes(),
+        "aristas": G.number_of_edges(),
+    }
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump({"meta": meta, "grafo": G}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+    logging.info(f"[GRAFO] Snapshot guardado en {path} ({meta['nodos']} nodos, {meta['aristas']} aristas)")
+    return meta
+
+
+def _leer_snapshot(path: str):
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+
+    meta = data.get("meta", {})
+    if meta.get("version") != VERSION_SNAPSHOT:
+        raise ValueError(
+            f"Snapshot {path} tiene versión {meta.get('version')!r}, "
+            f"se esperaba {VERSION_SNAPSHOT}. Refrescalo con: python -m Algoritmos.grafo_salto --refrescar"
+        )
+    return data["grafo"], meta
+
+
+def descargar_grafo() -> nx.MultiDiGraph:
+    """Descarga el grafo desde OpenStreetMap (necesita red)."""
+    import osmnx as ox
+
+    G = ox.graph_from_place(PLACE_NAME, network_type=NETWORK_TYPE)
+    return _preparar_grafo(G)
+
+
+def grafo_desde_graphml(path_graphml: str) -> nx.MultiDiGraph:
+    """Arma el grafo a partir de un GraphML exportado con osmnx (sin red)."""
+    import osmnx as ox
+
+    G = ox.load_graphml(path_graphml)
+    return _preparar_grafo(G)
+
+
+# -----------------------------------------------------------
+# API PÚBLICA
+# -----------------------------------------------------------
+
+def obtener_grafo() -> nx.MultiDiGraph:
+    """
+    Devuelve la instancia compartida del grafo de Salto.
+    La primera llamada lo lee del snapshot local; si todavía no existe
+    snapshot lo descarga UNA vez y lo deja guardado.
+    """
+    global _grafo, _meta
+
+    if _grafo is not None:
+        return _grafo
+
+    with _lock:
+        if _grafo is not None:
+            return _grafo
+
+        path = ruta_snapshot()
+        t0 = time.perf_counter()
+
+        if os.path.exists(path):
+            G, meta = _leer_snapshot(path)
+        else:
+            logging.warning(f"[GRAFO] No existe {path}, descargando de OSM (solo esta vez)...")
+            G = descargar_grafo()
+            meta = guardar_snapshot(G, origen="osm", path=path)
+
+        _grafo, _meta = G, meta
+        logging.info(
+            f"[GRAFO] Grafo de Salto cargado en {time.perf_counter() - t0:.2f}s "
+            f"({G.number_of_nodes()} nodos, version={version_grafo()})"
+        )
+        return _grafo
+
+
+def version_grafo() -> str:
+    """
+    Identificador del snapshot cargado (formato + fecha de creación).
+    Sirve como clave para cachés que dependen del grafo.
+    """
+    if not _meta:
+        obtener_grafo()
+    return f"v{_meta.get('version')}-{_meta.get('creado')}"
+
+
+# -----------------------------------------------------------
+# CLI
+# -----------------------------------------------------------
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Snapshot local del grafo vial de Salto")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--refrescar", action="store_true",
+                       help="Descarga el grafo de OSM y reemplaza el snapshot")
+    grupo.add_argument("--desde-graphml", metavar="ARCHIVO",
+                       help="Arma el snapshot desde un GraphML ya descargado")
+    grupo.add_argument("--info", action="store_true",
+                       help="Muestra los datos del snapshot actual")
+    parser.add_argument("--salida", default=None, help=f"Ruta del snapshot (default: {ruta_snapshot()})")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    path = args.salida or ruta_snapshot()
+
+    if args.info:
+        if not os.path.exists(path):
+            print(f"No hay snapshot en {path}")
+            return
+        _, meta = _leer_snapshot(path)
+        for clave, valor in meta.items():
+            print(f"{clave}: {valor}")
+        return
+
+    if args.refrescar:
+        G = descargar_grafo()
+        guardar_snapshot(G, origen="osm", path=path)
+    else:
+        G = grafo_desde_graphml(args.desde_graphml)
+        guardar_snapshot(G, origen=os.path.basename(args.desde_graphml), path=path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Índice espacial para pasar coordenadas (lat, lon) al nodo más cercano.
+
+Se arma UNA vez con un BallTree (distancia haversine) de scikit-learn, y
+solo con los nodos de la componente fuertemente conexa más grande: así el
+nodo devuelto siempre se puede alcanzar desde el local (y volver).
+"""
+
+import threading
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+from sklearn.neighbors import BallTree
+
+from Algoritmos.grafo_csr import GrafoCSR, obtener_csr
+
+RADIO_TIERRA_M = 6_371_000.0
+
+
+def componente_principal(csr: GrafoCSR) -> np.ndarray:
+    """Índices internos de los nodos de la componente fuertemente conexa más grande."""
+    _, etiquetas = connected_components(csr.matriz(), directed=True, connection="strong")
+    mayor = np.bincount(etiquetas).argmax()
+    return np.flatnonzero(etiquetas == mayor)
+
+
+class IndiceEspacial:
+    def __init__(self, csr: GrafoCSR):
+        self.csr = csr
+        self.indices = componente_principal(csr)
+        self._ruteable = np.zeros(csr.n, dtype=bool)
+        self._ruteable[self.indices] = True
+        coords = np.radians(np.column_stack((csr.lat[self.indices], csr.lon[self.indices])))
+        self._arbol = BallTree(coords, metric="haversine")
+
+    def snap_many_idx(self, coords: Iterable[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Para cada (lat, lon) devuelve (índices internos, distancia en metros)
+        del nodo ruteable más cercano.
+        """
+        puntos = np.radians(np.asarray(list(coords), dtype=np.float64).reshape(-1, 2))
+        if len(puntos) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        dist, pos = self._arbol.query(puntos, k=1)
+        return self.indices[pos[:, 0]], dist[:, 0] * RADIO_TIERRA_M
+
+    def snap_many(self, coords: Iterable[Tuple[float, float]]) -> np.ndarray:
+        """Batch: lista de (lat, lon) -> array de ids OSM de los nodos más cercanos."""
+        idx, _ = self.snap_many_idx(coords)
+        return self.csr.nodos[idx]
+
+    def snap(self, lat: float, lon: float) -> int:
+        """(lat, lon) -> id OSM del nodo ruteable más cercano."""
+        return int(self.snap_many([(lat, lon)])[0])
+
+    def es_ruteable(self, nodo: int) -> bool:
+        idx = self.csr.indice.get(nodo)
+        return idx is not None and bool(self._ruteable[idx])
+
+
+_lock = threading.Lock()
+_indice: Optional[IndiceEspacial] = None
+
+
+def obtener_indice() -> IndiceEspacial:
+    """Índice espacial compartido (se arma la primera vez que se pide)."""
+    global _indice
+    if _indice is None:
+        with _lock:
+            if _indice is None:
+                _indice = IndiceEspacial(obtener_csr())
+    return _indice
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Matriz de distancias / tiempos entre todos los pares de un conjunto de nodos.
+
+Se hace UNA búsqueda por origen (Dijkstra compilado de scipy, varios
+orígenes por llamada) y de cada árbol resultante se leen las columnas de
+los destinos. Así N paradas cuestan N búsquedas, no N x N.
+
+Además del costo que se optimiza, se calcula la otra magnitud del MISMO
+camino (p. ej. los km de la ruta más rápida) acumulando sobre el árbol de
+predecesores con "pointer jumping" vectorizado.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from Algoritmos.grafo_csr import GrafoCSR
+
+# Orígenes por tanda: acota la memoria (tanda x n nodos por array)
+ORIGENES_POR_TANDA = 64
+
+
+def _acumular_en_arbol(csr: GrafoCSR, predecesores: np.ndarray, valores_arista: np.ndarray) -> np.ndarray:
+    """
+    Para cada fila (un árbol de caminos) suma `valores_arista` desde la raíz
+    hasta cada nodo. Devuelve un array con la misma forma que `predecesores`.
+    """
+    filas, n = predecesores.shape
+
+    # Valor de la arista que llega a cada nodo desde su predecesor
+    en_arbol = predecesores[:, csr.destinos] == csr.fuentes[None, :]
+    fila, arista = np.nonzero(en_arbol)
+    acumulado = np.zeros((filas, n), dtype=np.float64)
+    acumulado[fila, csr.destinos[arista]] = valores_arista[arista]
+    acumulado = acumulado.ravel()
+
+    # Puntero al predecesor en el array aplanado (-1 = raíz o no alcanzable)
+    puntero = np.where(
+        predecesores >= 0,
+        predecesores + (np.arange(filas) * n)[:, None],
+        -1,
+    ).ravel()
+
+    # Pointer jumping: en cada vuelta cada nodo suma lo de su "ancestro" y
+    # salta al ancestro del ancestro -> log2(profundidad) vueltas.
+    activos = np.flatnonzero(puntero >= 0)
+    while len(activos):
+        padres = puntero[activos]
+        acumulado[activos] += acumulado[padres]
+        puntero[activos] = puntero[padres]
+        activos = activos[puntero[activos] >= 0]
+
+    return acumulado.reshape(filas, n)
+
+
+def matriz_distancias(
+    csr: GrafoCSR,
+    indices: Sequence[int],
+    peso: str = "tiempo",
+    limite: Optional[float] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Matrices N x N (dist_km, tiempo_min) entre los nodos dados (índices internos),
+    siguiendo el camino óptimo según `peso`. inf donde no hay camino.
+    `limite` acota cada búsqueda (segundos o metros, según el peso).
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    cantidad = len(indices)
+    dist_km = np.full((cantidad, cantidad), np.inf)
+    tiempo_min = np.full((cantidad, cantidad), np.inf)
+    if cantidad == 0:
+        return dist_km, tiempo_min
+
+    # La magnitud que NO se optimiza se acumula sobre el árbol
+    largo_m, tiempo_s = csr.magnitudes(peso)
+    otra = largo_m if peso == "tiempo" else tiempo_s
+
+    for inicio in range(0, cantidad, ORIGENES_POR_TANDA):
+        tanda = indices[inicio:inicio + ORIGENES_POR_TANDA]
+        costo, predecesores = dijkstra(
+            csr.matriz(peso),
+            directed=True,
+            indices=tanda,
+            return_predecessors=True,
+            limit=np.inf if limite is None else limite,
+        )
+        otra_magnitud = _acumular_en_arbol(csr, predecesores, otra)
+
+        costo = costo[:, indices]
+        otra_magnitud = np.where(np.isfinite(costo), otra_magnitud[:, indices], np.inf)
+
+        if peso == "tiempo":
+            tiempo_min[inicio:inicio + len(tanda)] = costo / 60.0
+            dist_km[inicio:inicio + len(tanda)] = otra_magnitud / 1000.0
+        else:
+            dist_km[inicio:inicio + len(tanda)] = costo / 1000.0
+            tiempo_min[inicio:inicio + len(tanda)] = otra_magnitud / 60.0
+
+    np.fill_diagonal(dist_km, 0.0)
+    np.fill_diagonal(tiempo_min, 0.0)
+    return dist_km, tiempo_min
+
+
+def tiempos_desde(
+    csr: GrafoCSR,
+    origen: int,
+    destinos: Sequence[int],
+    peso: str = "tiempo",
+    limite: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Costo óptimo (segundos o metros, según el peso) desde UN origen a varios
+    destinos (índices internos), con una sola búsqueda. inf si no hay camino
+    o queda más allá de `limite`.
+    """
+    costo = dijkstra(
+        csr.matriz(peso),
+        directed=True,
+        indices=int(origen),
+        limit=np.inf if limite is None else limite,
+    )
+    return costo[np.asarray(destinos, dtype=np.int64)]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Orden de visita de las paradas de un lote (TSP abierto desde el local).
+
+Recibe la matriz de tiempos reales por calle (fila 0 = local, filas 1..n =
+paradas) y devuelve en qué orden visitar las paradas para que el recorrido
+total sea lo más corto posible:
+
+1. Vecino más cercano como tour inicial.
+2. Mejora local con 2-opt (dar vuelta un tramo) y Or-opt (mover un bloque de
+   1 a 3 paradas a otra posición), hasta que nada mejore o se acabe el
+   presupuesto de tiempo.
+
+La matriz puede ser asimétrica (calles de una mano), por eso cada movimiento
+se evalúa con el costo completo del recorrido; con lotes de pocas paradas
+eso es despreciable.
+"""
+
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# Costo para pares sin camino: malo, pero permite seguir ordenando el resto
+_SIN_CAMINO = 1e9
+
+
+def costo_recorrido(tiempos: np.ndarray, orden: Sequence[int], volver: bool = False) -> float:
+    """Costo de salir del local (0) y visitar `orden`; con volver=True regresa al local."""
+    if not len(orden):
+        return 0.0
+    recorrido = [0, *orden, 0] if volver else [0, *orden]
+    return float(sum(tiempos[a, b] for a, b in zip(recorrido, recorrido[1:])))
+
+
+def vecino_mas_cercano(tiempos: np.ndarray) -> List[int]:
+    n = tiempos.shape[0]
+    pendientes = set(range(1, n))
+    orden: List[int] = []
+    actual = 0
+    while pendientes:
+        siguiente = min(pendientes, key=lambda j: (tiempos[actual, j], j))
+        orden.append(siguiente)
+        pendientes.remove(siguiente)
+        actual = siguiente
+    return orden
+
+
+def ordenar_paradas(
+    tiempos: np.ndarray,
+    presupuesto_s: float = 0.05,
+    volver: bool = False,
+    inicial: Optional[Sequence[int]] = None,
+) -> List[int]:
+    """
+    Orden de visita (índices 1..n de la matriz) que minimiza el costo total.
+    `inicial` es un orden candidato extra (p. ej. por distancia al local):
+    se arranca del mejor entre ese y el vecino más cercano.
+    """
+    tiempos = np.where(np.isfinite(tiempos), tiempos, _SIN_CAMINO)
+    n = tiempos.shape[0] - 1
+    if n <= 1:
+        return list(range(1, n + 1))
+
+    limite = time.perf_counter() + presupuesto_s
+
+    def costo(orden):
+        return costo_recorrido(tiempos, orden, volver)
+
+    candidatos = [vecino_mas_cercano(tiempos)]
+    if inicial is not None:
+        candidatos.append(list(inicial))
+    mejor = min(candidatos, key=costo)
+    mejor_costo = costo(mejor)
+
+    mejoro = True
+    while mejoro and time.perf_counter() < limite:
+        mejoro = False
+
+        # 2-opt: invertir el tramo [i, j]
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                candidato = mejor[:i] + mejor[i:j + 1][::-1] + mejor[j + 1:]
+                c = costo(candidato)
+                if c < mejor_costo - 1e-9:
+                    mejor, mejor_costo, mejoro = candidato, c, True
+            if time.perf_counter() >= limite:
+                return mejor
+
+        # Or-opt: mover un bloque de 1..3 paradas a otra posición
+        for largo in (1, 2, 3):
+            for i in range(n - largo + 1):
+                bloque = mejor[i:i + largo]
+                resto = mejor[:i] + mejor[i + largo:]
+                for k in range(len(resto) + 1):
+                    if k == i:
+                        continue
+                    candidato = resto[:k] + bloque + resto[k:]
+                    c = costo(candidato)
+                    if c < mejor_costo - 1e-9:
+                        mejor, mejor_costo, mejoro = candidato, c, True
+                        break
+                if time.perf_counter() >= limite:
+                    return mejor
+
+    return mejor
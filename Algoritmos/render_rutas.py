@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Render headless e incremental del mapa de Salto.
+
+Antes cada frame armaba una figura nueva y llamaba a ox.plot_graph sobre
+TODO el grafo con listas de color/alpha/ancho por arista. Acá la red de
+calles se dibuja UNA vez (por versión del grafo) en un raster base, y cada
+frame solo restaura ese raster y pinta encima las aristas que cambiaron,
+los nodos destacados y el título (blitting de matplotlib sobre Agg).
+
+No usa pyplot, así que funciona sin display.
+
+Las imágenes se codifican en memoria (a_png / a_gif) con una paleta
+reducida: el mapa tiene pocos colores y así pesa varias veces menos.
+"""
+
+import io
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import networkx as nx
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from PIL import Image
+
+from Algoritmos.grafo_salto import obtener_grafo, version_grafo
+
+FONDO = "#000000"
+
+# Estilos de las aristas (los mismos colores que usaba coordenadas_gifs)
+ESTILOS = {
+    "visitada": {"colors": "#d36206", "alpha": 1.0, "linewidths": 1.0},
+    "activa": {"colors": "#e8a900", "alpha": 1.0, "linewidths": 1.0},
+    "camino": {"colors": "white", "alpha": 1.0, "linewidths": 1.0},
+}
+
+Arista = Tuple[int, int]
+
+# Colores de la paleta al codificar (0 = PNG en RGB sin cuantizar)
+COLORES_PALETA = int(os.getenv("RENDER_COLORES", "32"))
+
+
+class RenderRutas:
+    def __init__(self, G: nx.MultiDiGraph, version: str = "", tam: float = 12, dpi: int = 80):
+        self.version = version
+        self._lock = threading.Lock()
+
+        # Coordenadas (lon, lat) de cada nodo y polilínea de cada arista u -> v
+        self._coords: Dict[int, Tuple[float, float]] = {
+            n: (data["x"], data["y"]) for n, data in G.nodes(data=True)
+        }
+        self._segmentos: Dict[Arista, np.ndarray] = {}
+        for u, v, data in G.edges(data=True):
+            if (u, v) in self._segmentos:
+                continue
+            geom = data.get("geometry")
+            if geom is not None:
+                self._segmentos[(u, v)] = np.asarray(geom.coords)
+            else:
+                self._segmentos[(u, v)] = np.array([self._coords[u], self._coords[v]])
+
+        self._fig = Figure(figsize=(tam, tam), dpi=dpi, facecolor=FONDO)
+        self._canvas = FigureCanvasAgg(self._fig)
+        ax = self._fig.add_axes((0, 0, 1, 1))
+        ax.set_facecolor(FONDO)
+        ax.set_axis_off()
+
+        # Red de calles completa, en el estilo "no visitada"
+        ax.add_collection(LineCollection(
+            list(self._segmentos.values()), colors="#d36206", alpha=0.2, linewidths=0.5
+        ))
+        xs = np.array([c[0] for c in self._coords.values()])
+        ys = np.array([c[1] for c in self._coords.values()])
+        margen_x = (xs.max() - xs.min()) * 0.02 or 0.001
+        margen_y = (ys.max() - ys.min()) * 0.02 or 0.001
+        ax.set_xlim(xs.min() - margen_x, xs.max() + margen_x)
+        ax.set_ylim(ys.min() - margen_y, ys.max() + margen_y)
+        # Grados de longitud "miden" menos que los de latitud (igual que osmnx)
+        ax.set_aspect(1 / np.cos(np.radians(ys.mean())), adjustable="box")
+
+        # Capas que cambian frame a frame (animated=True: no entran en el fondo)
+        self._capas = {
+            nombre: ax.add_collection(LineCollection([], animated=True, **estilo))
+            for nombre, estilo in ESTILOS.items()
+        }
+        self._nodos = ax.scatter([], [], s=50, c="white", zorder=3, animated=True)
+        self._titulo = ax.text(
+            0.5, 0.985, "", transform=ax.transAxes, ha="center", va="top",
+            color="white", fontsize=16, animated=True,
+        )
+        self._ax = ax
+
+        self._canvas.draw()
+        self._fondo = self._canvas.copy_from_bbox(self._fig.bbox)
+
+    def _segmentos_de(self, aristas: Iterable[Arista]):
+        return [self._segmentos[a] for a in aristas if a in self._segmentos]
+
+    def frame(
+        self,
+        titulo: str = "",
+        visitadas: Iterable[Arista] = (),
+        activas: Iterable[Arista] = (),
+        camino: Iterable[Arista] = (),
+        nodos: Iterable[int] = (),
+    ) -> Image.Image:
+        """
+        Devuelve una imagen RGB: la red base + las aristas pedidas encima.
+        Orden de pintado: visitadas, activas, camino (la última gana).
+        """
+        with self._lock:
+            self._canvas.restore_region(self._fondo)
+
+            for nombre, aristas in (("visitada", visitadas), ("activa", activas), ("camino", camino)):
+                capa = self._capas[nombre]
+                segmentos = self._segmentos_de(aristas)
+                if segmentos:
+                    capa.set_segments(segmentos)
+                    self._ax.draw_artist(capa)
+
+            puntos = [self._coords[n] for n in nodos if n in self._coords]
+            if puntos:
+                self._nodos.set_offsets(np.array(puntos))
+                self._ax.draw_artist(self._nodos)
+
+            if titulo:
+                self._titulo.set_text(titulo.encode("ascii", "ignore").decode("ascii"))
+                self._ax.draw_artist(self._titulo)
+
+            rgba = np.asarray(self._canvas.buffer_rgba())
+            return Image.fromarray(rgba[:, :, :3].copy())
+
+
+_lock = threading.Lock()
+_render: Optional[RenderRutas] = None
+
+
+def obtener_render() -> RenderRutas:
+    """Render compartido; se rehace si cambió la versión del grafo."""
+    global _render
+    version = version_grafo()
+    if _render is None or _render.version != version:
+        with _lock:
+            if _render is None or _render.version != version:
+                _render = RenderRutas(obtener_grafo(), version=version)
+    return _render
+
+
+# ------------------------------------------------------------
+# CODIFICACIÓN EN MEMORIA
+# ------------------------------------------------------------
+
+def _paleta(imagen: Image.Image, colores: int) -> Image.Image:
+    return imagen.quantize(colors=colores, method=Image.Quantize.FASTOCTREE)
+
+
+def a_png(imagen: Image.Image, colores: int = COLORES_PALETA) -> bytes:
+    """PNG en bytes; con `colores` > 0 se guarda con paleta (mucho más chico)."""
+    if colores > 0:
+        imagen = _paleta(imagen, colores)
+    buffer = io.BytesIO()
+    imagen.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def a_gif(
+    frames: Sequence[Image.Image],
+    duracion_s: float = 0.6,
+    loop: int = 0,
+    colores: int = COLORES_PALETA,
+) -> bytes:
+    """
+    GIF animado en bytes. Todos los frames comparten UNA paleta (la del
+    último, que tiene todos los estilos), así Pillow no cuantiza cada
+    frame por su cuenta y puede guardar solo lo que cambia entre frames.
+    """
+    if not frames:
+        return b""
+    paleta = _paleta(frames[-1], colores if 0 < colores <= 256 else 256)
+    cuantizados: List[Image.Image] = [
+        f.quantize(palette=paleta, dither=Image.Dither.NONE) for f in frames
+    ]
+    buffer = io.BytesIO()
+    cuantizados[0].save(
+        buffer,
+        format="GIF",
+        save_all=True,
+        append_images=cuantizados[1:],
+        duration=int(duracion_s * 1000),
+        loop=loop,
+        optimize=True,
+    )
+    return buffer.getvalue()
@@ -1,25 +1,53 @@
 # Dominio/Chat.py
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from Menu import menuCompleto  # tu menú completo de productos
 from Dominio.Modelos import Pedido, ItemCarrito
 from Dominio import Rutas
-import osmnx as ox
-from Dominio.Rutas import G
+from Algoritmos.indice_espacial import obtener_indice
 
 PAGE_SIZE = 5
 
+# Índice espacial sobre la componente conexa principal del grafo de Salto
+INDICE = obtener_indice()
+
 LAT_LOCAL = -31.387591856643436
 LON_LOCAL = -57.962891374932944
 
-NODO_LOCAL = ox.nearest_nodes(G, LON_LOCAL, LAT_LOCAL)
+NODO_LOCAL = INDICE.snap(LAT_LOCAL, LON_LOCAL)
+
+# Todas las rutas salen del local: dejamos su árbol de caminos listo al arrancar
+Rutas.precalcular_arbol(NODO_LOCAL)
 
 def get_nodo_mas_cercano(lat: float, lng: float) -> int:
     """
-    Devuelve el id de nodo del grafo G más cercano a las coordenadas (lat, lng).
+    Devuelve el id de nodo del grafo más cercano a las coordenadas (lat, lng).
+    Siempre es un nodo ruteable (componente fuertemente conexa principal).
+    """
+    return INDICE.snap(lat, lng)
+
+
+def calcular_ruta_cliente(lat: float, lng: float) -> Tuple[int, List[int], float, float]:
+    """
+    Ruta local -> cliente: (nodo_cliente, path, dist_km, tiempo_min).
+    No toca ningún Pedido, así puede correr en el pool de procesos.
+    """
+    nodo_cliente = get_nodo_mas_cercano(lat, lng)
+    path, dist_km, tiempo_min = Rutas.a_star_ruta(NODO_LOCAL, nodo_cliente)
+    return nodo_cliente, path, dist_km, tiempo_min
+
+
+def precalentar_proceso() -> None:
+    """
+    Inicializador de cada proceso del pool. Importar este módulo ya carga
+    grafo, índice y árbol del local; acá además se arma el mapa base y la
+    caché de rutas empieza a anotar novedades para el proceso web.
     """
-    return ox.nearest_nodes(G, lng, lat)
+    from Algoritmos.render_rutas import obtener_render
+
+    obtener_render()
+    Rutas.CACHE_RUTAS.seguir_novedades()
 
 
 # ------------------ HELPER DE PAGINADO ------------------ #
@@ -529,7 +557,18 @@ class Chat:
             logging.info(f"[CARRITO] Tel={telefono} vació su carrito.")
 
 
-    def guardar_ubicacion(self, telefono: str, lat: float, lng: float, direccion: str):
+    def guardar_ubicacion(
+        self,
+        telefono: str,
+        lat: float,
+        lng: float,
+        direccion: str,
+        ruta: Optional[Tuple[int, List[int], float, float]] = None,
+    ):
+        """
+        Guarda ubicación, ruta y zona en el pedido. Si `ruta` ya viene
+        calculada (ver calcular_ruta_cliente) no se vuelve a rutear.
+        """
         pedido = self.obtener_o_crear_pedido(telefono)
         if not pedido:
             logging.warning(f"[UBICACION] No hay pedido para tel={telefono}")
@@ -540,10 +579,9 @@ class Chat:
         try:
             # Usamos las constantes definidas en ESTE archivo (Chat.py)
             nodo_local = NODO_LOCAL
-            nodo_cliente = get_nodo_mas_cercano(lat, lng)
-
-            path, dist_km, tiempo_min = Rutas.a_star_ruta(nodo_local, nodo_cliente)
-            
+            if ruta is None:
+                ruta = calcular_ruta_cliente(lat, lng)
+            nodo_cliente, path, dist_km, tiempo_min = ruta
 
             pedido.ubicacion = (lat, lng)
             pedido.direccion_texto = direccion
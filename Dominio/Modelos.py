@@ -1,3 +1,5 @@
+import time
+import uuid
 from dataclasses import dataclass, field
 from typing import List, Tuple, Optional
 
@@ -57,6 +59,13 @@ class Pedido:
     entregado: bool = False
     calificacion: Optional[int] = None
 
+    repartidor: Optional[str] = None  # id (zona) del repartidor asignado
+    id_pedido: str = field(default_factory=lambda: uuid.uuid4().hex)
+    creado: float = field(default_factory=time.time)
+    confirmado: Optional[float] = None  # entra al reparto (epoch)
+    enviado: Optional[float] = None     # salió en un lote al repartidor
+    entregado_en: Optional[float] = None
+
     @property
     def total(self) -> int:
         return sum(item.precio * item.cantidad for item in self.items)
@@ -1,11 +1,59 @@
+import heapq
+import itertools
+import os
+import time
+from collections import deque
 from dataclasses import dataclass, field
-from typing import List, Dict
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Sequence, Set
 
+import numpy as np
+
+from Algoritmos.agrupamiento import k_medoides
 from Dominio.Modelos import Pedido
 
-MAX_PEDIDOS_POR_LOTE = 1
 ZONAS_VALIDAS = ("NO", "NE", "SO", "SE")
 
+# Cierre de lotes (valores por defecto; cada zona puede pisarlos con el
+# sufijo _NO, _NE, _SO o _SE, p. ej. LOTE_MAX_PEDIDOS_SE=4):
+# - LOTE_MAX_PEDIDOS: tamaño máximo del lote
+# - LOTE_ESPERA_MAX_S: espera máxima desde el pedido confirmado más viejo
+# - LOTE_ETA_MAX_MIN: si saliendo ya, algún pedido llegaría después de esto
+#   (contado desde que se confirmó), el lote sale
+MAX_PEDIDOS_POR_LOTE = int(os.getenv("LOTE_MAX_PEDIDOS", "7"))
+ESPERA_MAX_LOTE_S = float(os.getenv("LOTE_ESPERA_MAX_S", "300"))
+ETA_MAX_MIN = float(os.getenv("LOTE_ETA_MAX_MIN", "40"))
+
+# Minutos que se pierden en cada entrega (estacionar, tocar timbre, cobrar)
+MIN_POR_PARADA = float(os.getenv("MIN_POR_PARADA", "2"))
+
+# Minutos "extra" que cuesta cada pedido que el repartidor ya tiene en la
+# tanda: cuanto más alto, más parejo el reparto; cuanto más bajo, más
+# compactos los lotes.
+PENALIZACION_CARGA_MIN = float(os.getenv("PENALIZACION_CARGA_MIN", "3"))
+
+
+# ============================================================
+# CONFIGURACIÓN DE LOTES
+# ============================================================
+
+@dataclass(frozen=True)
+class ConfigLote:
+    """
+    Cuándo se cierra el lote de un repartidor: lo que pase primero entre
+    llenarse, esperar demasiado o arriesgar la hora de entrega.
+    """
+    max_pedidos: int = MAX_PEDIDOS_POR_LOTE
+    espera_max_s: float = ESPERA_MAX_LOTE_S
+    eta_max_min: float = ETA_MAX_MIN
+
+    @classmethod
+    def desde_entorno(cls, zona: str) -> "ConfigLote":
+        return cls(
+            max_pedidos=int(os.getenv(f"LOTE_MAX_PEDIDOS_{zona}", MAX_PEDIDOS_POR_LOTE)),
+            espera_max_s=float(os.getenv(f"LOTE_ESPERA_MAX_S_{zona}", ESPERA_MAX_LOTE_S)),
+            eta_max_min=float(os.getenv(f"LOTE_ETA_MAX_MIN_{zona}", ETA_MAX_MIN)),
+        )
+
 
 # ============================================================
 # LOTE DE REPARTO
@@ -17,9 +65,10 @@ class LoteReparto:
     Representa un lote de pedidos para un repartidor.
     """
     pedidos: List[Pedido] = field(default_factory=list)
+    max_pedidos: int = MAX_PEDIDOS_POR_LOTE
 
     def esta_completo(self) -> bool:
-        return len(self.pedidos) >= MAX_PEDIDOS_POR_LOTE
+        return len(self.pedidos) >= self.max_pedidos
 
     def agregar_pedido(self, pedido: Pedido) -> None:
         self.pedidos.append(pedido)
@@ -28,6 +77,82 @@ class LoteReparto:
         self.pedidos.clear()
 
 
+# ============================================================
+# ESTADÍSTICAS DE ENTREGAS
+# ============================================================
+
+# Rendimiento de la moto para estimar nafta
+KM_POR_LITRO = float(os.getenv("KM_POR_LITRO", "10"))
+
+
+@dataclass
+class EstadisticasEntregas:
+    """
+    Acumulados de las entregas de un repartidor, actualizados en cada
+    entrega / calificación: leerlos no recorre la lista de pedidos.
+    Con suma y suma de cuadrados salen promedio y desvío en O(1).
+    """
+    cantidad: int = 0
+    distancia_km: float = 0.0
+    distancia_km_cuadrados: float = 0.0
+    calificados: int = 0
+    suma_estrellas: int = 0
+    suma_estrellas_cuadrados: int = 0
+    # Entregas y km por hora del día (0..23, hora local)
+    por_hora: List[List[float]] = field(default_factory=lambda: [[0, 0.0] for _ in range(24)])
+
+    def agregar_entrega(self, pedido: Pedido) -> None:
+        km = pedido.distancia_km or 0.0
+        self.cantidad += 1
+        self.distancia_km += km
+        self.distancia_km_cuadrados += km * km
+
+        hora = time.localtime(pedido.entregado_en or time.time()).tm_hour
+        self.por_hora[hora][0] += 1
+        self.por_hora[hora][1] += km
+
+        if pedido.calificacion is not None:
+            self.cambiar_calificacion(None, pedido.calificacion)
+
+    def cambiar_calificacion(self, anterior: Optional[int], nueva: int) -> None:
+        if anterior is not None:
+            self.calificados -= 1
+            self.suma_estrellas -= anterior
+            self.suma_estrellas_cuadrados -= anterior * anterior
+        self.calificados += 1
+        self.suma_estrellas += nueva
+        self.suma_estrellas_cuadrados += nueva * nueva
+
+    @staticmethod
+    def _promedio_y_desvio(n: int, suma: float, cuadrados: float):
+        if not n:
+            return None, None
+        promedio = suma / n
+        return promedio, max(cuadrados / n - promedio * promedio, 0.0) ** 0.5
+
+    def resumen(self) -> Dict[str, object]:
+        estrellas, desvio_estrellas = self._promedio_y_desvio(
+            self.calificados, self.suma_estrellas, self.suma_estrellas_cuadrados
+        )
+        km_promedio, desvio_km = self._promedio_y_desvio(
+            self.cantidad, self.distancia_km, self.distancia_km_cuadrados
+        )
+        return {
+            "cantidad_entregados": self.cantidad,
+            "cantidad_calificados": self.calificados,
+            "promedio_estrellas": estrellas,
+            "desvio_estrellas": desvio_estrellas,
+            "distancia_total_km": self.distancia_km,
+            "distancia_promedio_km": km_promedio,
+            "desvio_distancia_km": desvio_km,
+            "litros_nafta_estimados": self.distancia_km / KM_POR_LITRO,
+            "entregas_por_hora": {
+                h: {"cantidad": int(c), "distancia_km": km}
+                for h, (c, km) in enumerate(self.por_hora) if c
+            },
+        }
+
+
 # ============================================================
 # REPARTIDOR
 # ============================================================
@@ -37,12 +162,39 @@ class RepartidorZona:
     """
     Repartidor asignado a una zona (NO, NE, SO, SE).
     Maneja su lote actual y una cola de espera.
+
+    Los pendientes están indexados por id_pedido, así sacar uno (p. ej. al
+    entregarlo) es O(1): del lote se saca directo (son pocos) y en la cola
+    se marca como anulado y se descarta cuando llega su turno.
     """
     zona: str
     telefono_whatsapp: str
     lote_actual: LoteReparto = field(default_factory=LoteReparto)
-    cola_espera: List[Pedido] = field(default_factory=list)
+    cola_espera: Deque[Pedido] = field(default_factory=deque)
     pedidos_entregados: List[Pedido] = field(default_factory=list)
+    config: ConfigLote = field(default_factory=ConfigLote)
+    estadisticas: EstadisticasEntregas = field(default_factory=EstadisticasEntregas, init=False)
+
+    # id_pedido -> pedido, de todo lo pendiente (lote + cola)
+    _pendientes: Dict[str, Pedido] = field(default_factory=dict, init=False, repr=False)
+    # id_pedido -> pedido entregado (el mismo objeto que pedidos_entregados)
+    _entregados: Dict[str, Pedido] = field(default_factory=dict, init=False, repr=False)
+    # ids que siguen en cola_espera pero ya no cuentan (entregados / sacados)
+    _anulados: Set[str] = field(default_factory=set, init=False, repr=False)
+    # Aviso al gestor cuando cambia la carga (para su heap de repartidores)
+    al_cambiar: Optional[Callable[["RepartidorZona"], None]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        self.lote_actual.max_pedidos = self.config.max_pedidos
+        self.cola_espera = deque(self.cola_espera)
+        for p in list(self.lote_actual.pedidos) + list(self.cola_espera):
+            self._pendientes[p.id_pedido] = p
+
+    def _avisar(self) -> None:
+        if self.al_cambiar is not None:
+            self.al_cambiar(self)
 
     def asignar_pedido(self, pedido: Pedido) -> bool:
         """
@@ -50,13 +202,74 @@ class RepartidorZona:
         Si el lote está completo, lo manda a la cola de espera.
         Devuelve True si DESPUÉS de asignar el pedido el lote quedó completo.
         """
+        if pedido.confirmado is None:
+            pedido.confirmado = time.time()
+
+        self._pendientes[pedido.id_pedido] = pedido
+        self._anulados.discard(pedido.id_pedido)
+        try:
+            if not self.lote_actual.esta_completo():
+                self.lote_actual.agregar_pedido(pedido)
+                return self.lote_actual.esta_completo()
+
+            # Lote ya lleno → pasa a cola de espera
+            self.cola_espera.append(pedido)
+            return False
+        finally:
+            self._avisar()
+
+    def quitar_pedido(self, pedido: Pedido) -> bool:
+        """
+        Saca un pedido pendiente (lote o cola). False si no estaba.
+        """
+        if self._pendientes.pop(pedido.id_pedido, None) is None:
+            return False
+
+        lote = self.lote_actual.pedidos
+        for i, p in enumerate(lote):
+            if p.id_pedido == pedido.id_pedido:
+                del lote[i]
+                self._rellenar_lote()
+                break
+        else:
+            self._anulados.add(pedido.id_pedido)
+        self._avisar()
+        return True
+
+    def vaciar_pendientes(self) -> List[Pedido]:
+        """Saca todos los pendientes (lote y cola) y los devuelve en orden."""
+        pendientes = self.obtener_pedidos_pendientes()
+        self.lote_actual.vaciar()
+        self.cola_espera.clear()
+        self._pendientes.clear()
+        self._anulados.clear()
+        self._avisar()
+        return pendientes
+
+    def cantidad_en_cola(self) -> int:
+        return len(self._pendientes) - len(self.lote_actual.pedidos)
+
+    def cantidad_pendientes(self) -> int:
+        return len(self._pendientes)
+
+    def carga_tanda_abierta(self) -> int:
+        """Largo de la tanda a la que se sumaría un pedido nuevo (O(1))."""
         if not self.lote_actual.esta_completo():
-            self.lote_actual.agregar_pedido(pedido)
-            return self.lote_actual.esta_completo()
+            return len(self.lote_actual.pedidos)
+        # Con la última tanda de la cola completa, el pedido nuevo abre otra
+        return self.cantidad_en_cola() % self.config.max_pedidos
 
-        # Lote ya lleno → pasa a cola de espera
-        self.cola_espera.append(pedido)
-        return False
+    def _en_cola(self) -> Iterator[Pedido]:
+        return (p for p in self.cola_espera if p.id_pedido not in self._anulados)
+
+    def _rellenar_lote(self) -> None:
+        # Si hay pedidos en cola, completamos el lote (salteando anulados)
+        while self.cola_espera and not self.lote_actual.esta_completo():
+            p = self.cola_espera.popleft()
+            if p.id_pedido in self._anulados:
+                self._anulados.discard(p.id_pedido)
+                continue
+            self.lote_actual.agregar_pedido(p)
 
     def obtener_lote_actual(self) -> List[Pedido]:
         """
@@ -67,34 +280,123 @@ class RepartidorZona:
         pedidos.sort(key=lambda p: getattr(p, "distancia_km", 0.0))
         return pedidos
 
+    def tanda_abierta(self) -> List[Pedido]:
+        """
+        Pedidos de la tanda a la que se sumaría un pedido nuevo: el lote
+        actual si tiene lugar, si no la última tanda (incompleta) de la cola.
+        """
+        if not self.lote_actual.esta_completo():
+            return self.lote_actual.pedidos
+
+        faltan = self.carga_tanda_abierta()
+        tanda: List[Pedido] = []
+        for p in reversed(self.cola_espera):
+            if len(tanda) >= faltan:
+                break
+            if p.id_pedido not in self._anulados:
+                tanda.append(p)
+        tanda.reverse()
+        return tanda
+
     def obtener_pedidos_pendientes(self) -> List[Pedido]:
         """
         Devuelve todos los pedidos que aún no se marcaron como entregados:
         - los del lote actual
         - los de la cola de espera
         """
-        return list(self.lote_actual.pedidos) + list(self.cola_espera)
+        return list(self.lote_actual.pedidos) + list(self._en_cola())
+
+    def eta_maxima_min(self, ahora: float) -> float:
+        """
+        Peor demora (minutos desde que se confirmó hasta la entrega) entre
+        los pedidos del lote si saliera ahora, en el orden de siempre.
+        Estimación optimista: cada parada llega como pronto a su tiempo
+        desde el local y suma MIN_POR_PARADA por cada entrega previa.
+        """
+        peor = 0.0
+        llegada = 0.0
+        for i, p in enumerate(self.obtener_lote_actual()):
+            llegada = max(llegada + (MIN_POR_PARADA if i else 0.0), p.tiempo_estimado_min)
+            esperando = (ahora - (p.confirmado or ahora)) / 60.0
+            peor = max(peor, esperando + llegada)
+        return peor
+
+    def motivo_cierre(self, ahora: float, margen_s: float = 0.0) -> Optional[str]:
+        """
+        Por qué habría que enviar el lote ahora ("tamaño", "espera", "eta"),
+        o None si puede seguir juntando pedidos. `margen_s` adelanta los
+        límites de tiempo (p. ej. el intervalo del planificador).
+        """
+        pedidos = self.lote_actual.pedidos
+        if not pedidos:
+            return None
+        if self.lote_actual.esta_completo():
+            return "tamaño"
+
+        mas_viejo = min(p.confirmado or ahora for p in pedidos)
+        if ahora + margen_s - mas_viejo >= self.config.espera_max_s:
+            return "espera"
+        if self.eta_maxima_min(ahora) + margen_s / 60.0 >= self.config.eta_max_min:
+            return "eta"
+        return None
 
     def registrar_entrega(self, pedido: Pedido) -> None:
         """
-        Registra un pedido como entregado.
+        Registra un pedido como entregado y suma sus acumulados.
         """
+        if pedido.entregado_en is None:
+            pedido.entregado_en = time.time()
         self.pedidos_entregados.append(pedido)
+        self._entregados[pedido.id_pedido] = pedido
+        self.estadisticas.agregar_entrega(pedido)
 
-    def marcar_lote_enviado(self) -> List[Pedido]:
+    def entregado_por_id(self, id_pedido: str) -> Optional[Pedido]:
+        """
+        El pedido entregado tal como está en los registros del repartidor
+        (puede haber otras copias del mismo pedido, p. ej. leídas de la base).
+        """
+        return self._entregados.get(id_pedido)
+
+    def registrar_calificacion(self, pedido: Pedido, valor: int) -> None:
+        """
+        Guarda la nota de un pedido entregado (si ya tenía una, la reemplaza
+        también en los acumulados). `pedido` tiene que ser el de
+        entregado_por_id: la nota anterior se toma de él.
+        """
+        self.estadisticas.cambiar_calificacion(pedido.calificacion, valor)
+        pedido.calificacion = valor
+
+    def entregados_pagina(self, offset: int = 0, limite: int = 50) -> List[Pedido]:
+        """Entregados en orden de entrega, de a páginas (O(limite))."""
+        offset = max(offset, 0)
+        return self.pedidos_entregados[offset:offset + max(limite, 0)]
+
+    def entregados_desde(self, cursor: int = 0, limite: int = 50) -> tuple[List[Pedido], int]:
+        """
+        Entregados a partir de `cursor` y el cursor siguiente. La lista solo
+        crece, así que el cursor es estable: pasando el último devuelto se
+        reciben solo las entregas nuevas.
+        """
+        pedidos = self.entregados_pagina(cursor, limite)
+        return pedidos, max(cursor, 0) + len(pedidos)
+
+    def marcar_lote_enviado(self, enviados: Optional[List[Pedido]] = None) -> List[Pedido]:
         """
         Se llama luego de enviar la imagen al repartidor.
-        Vacía el lote actual y lo rellena con la siguiente tanda (si hay).
+        Saca del lote los pedidos enviados (por defecto, todo el lote; los
+        que entraron mientras se enviaba se quedan) y lo rellena con la
+        siguiente tanda (si hay).
         Devuelve la lista de pedidos que formaban el lote enviado.
         """
-        enviados = list(self.lote_actual.pedidos)
-        self.lote_actual.vaciar()
-
-        # Si hay pedidos en cola, cargamos hasta 7 para el próximo lote
-        while self.cola_espera and not self.lote_actual.esta_completo():
-            p = self.cola_espera.pop(0)
-            self.lote_actual.agregar_pedido(p)
+        if enviados is None:
+            enviados = list(self.lote_actual.pedidos)
+        ids = {p.id_pedido for p in enviados}
+        self.lote_actual.pedidos[:] = [p for p in self.lote_actual.pedidos if p.id_pedido not in ids]
+        for id_pedido in ids:
+            self._pendientes.pop(id_pedido, None)
 
+        self._rellenar_lote()
+        self._avisar()
         return enviados
 
 
@@ -105,10 +407,64 @@ class RepartidorZona:
 @dataclass
 class GestorReparto:
     """
-    Maneja la asignación de pedidos a 4 repartidores (uno por zona).
+    Maneja la asignación de pedidos a 4 repartidores (uno por zona),
+    agrupando por cercanía en la red de calles y balanceando la carga.
     """
     repartidores: Dict[str, RepartidorZona] = field(default_factory=dict)
 
+    # Tiempos por calle (minutos), se inyectan desde afuera para no atar el
+    # dominio al grafo: (nodo, [destinos]) -> tiempos y [nodos] -> matriz N x N
+    tiempos_desde: Optional[Callable[[int, List[int]], Sequence[float]]] = field(default=None, repr=False)
+    matriz_tiempos: Optional[Callable[[List[int]], np.ndarray]] = field(default=None, repr=False)
+
+    # Heap de repartidores por carga: (clave_carga, secuencia, zona). Las
+    # entradas viejas no se borran: se descartan al verlas (secuencia vieja).
+    _heap: List[tuple] = field(default_factory=list, init=False, repr=False)
+    _vigente: Dict[str, int] = field(default_factory=dict, init=False, repr=False)
+    _secuencia: "itertools.count" = field(default_factory=itertools.count, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        for r in self.repartidores.values():
+            r.al_cambiar = self._actualizar_carga
+            self._actualizar_carga(r)
+
+    @staticmethod
+    def clave_carga(r: RepartidorZona) -> tuple:
+        """Orden de preferencia: con lugar en el lote, tanda más corta, menos pendientes."""
+        return (r.lote_actual.esta_completo(), r.carga_tanda_abierta(), r.cantidad_pendientes())
+
+    def _actualizar_carga(self, r: RepartidorZona) -> None:
+        sec = next(self._secuencia)
+        self._vigente[r.zona] = sec
+        heapq.heappush(self._heap, (self.clave_carga(r), sec, r.zona))
+
+        # Si se juntaron muchas entradas viejas, se rearma
+        if len(self._heap) > 4 * len(self.repartidores) + 64:
+            self._heap = [e for e in self._heap if self._vigente.get(e[2]) == e[1]]
+            heapq.heapify(self._heap)
+
+    def _menos_cargados(self, hasta: Callable[[tuple, tuple], bool]) -> List[RepartidorZona]:
+        """
+        Repartidores en orden de carga mientras `hasta(clave_primero, clave)`
+        sea True. Cuesta O(k log n) para los k devueltos.
+        """
+        vistos: List[tuple] = []
+        elegidos: List[RepartidorZona] = []
+        while self._heap:
+            entrada = heapq.heappop(self._heap)
+            clave, sec, zona = entrada
+            if self._vigente.get(zona) != sec:
+                continue
+            if elegidos and not hasta(vistos[0][0], clave):
+                vistos.append(entrada)
+                break
+            vistos.append(entrada)
+            elegidos.append(self.repartidores[zona])
+
+        for entrada in vistos:
+            heapq.heappush(self._heap, entrada)
+        return elegidos
+
     @classmethod
     def desde_config(cls, mapa_telefonos: Dict[str, str]) -> "GestorReparto":
         """
@@ -119,14 +475,21 @@ class GestorReparto:
         for zona, tel in mapa_telefonos.items():
             if zona not in ZONAS_VALIDAS:
                 continue
-            reps[zona] = RepartidorZona(zona=zona, telefono_whatsapp=tel)
+            reps[zona] = RepartidorZona(
+                zona=zona,
+                telefono_whatsapp=tel,
+                config=ConfigLote.desde_entorno(zona),
+            )
 
         return cls(repartidores=reps)
 
     def asignar_pedido(self, pedido: Pedido) -> tuple[bool, str]:
         """
-        Asigna el pedido al repartidor que tenga MÁS ESPACIO en su tanda
-        de hasta 7 pedidos, sin importar la zona del pedido.
+        Asigna el pedido al repartidor cuya tanda abierta (el lote actual, o
+        la cola si el lote ya está lleno) quede más cerca por calle, con una
+        penalización por cada pedido que ya tenga (PENALIZACION_CARGA_MIN).
+        Abrir una tanda vacía cuesta el viaje desde el local. Sin tiempos
+        por calle (o sin nodo del cliente) reparte por carga, como antes.
 
         Devuelve (lote_lleno, id_repartidor) donde id_repartidor puede ser
         la 'zona' o un nombre interno del repartidor.
@@ -134,23 +497,123 @@ class GestorReparto:
         if not self.repartidores:
             raise RuntimeError("No hay repartidores configurados en el GestorReparto.")
 
-        # Elegimos el repartidor cuyo lote_actual tenga MENOS pedidos
-        mejor_repartidor = min(
-            self.repartidores.values(),
-            key=lambda r: len(r.lote_actual.pedidos)
-        )
+        # Candidatos desde el heap de carga: primero los que tienen lugar en
+        # el lote. La cercanía ahorra a lo sumo el viaje desde el local, así
+        # que un repartidor con más carga que eso (en minutos de penalización)
+        # que el menos cargado no puede ganar y ni se mira.
+        if self.tiempos_desde is None or pedido.nodo_destino is None:
+            margen = -1.0
+        else:
+            margen = pedido.tiempo_estimado_min
+
+        def alcanza(primero: tuple, clave: tuple) -> bool:
+            return (
+                clave[0] == primero[0]
+                and PENALIZACION_CARGA_MIN * (clave[1] - primero[1]) <= margen
+            )
+
+        candidatos = self._menos_cargados(alcanza)
+        tiempos = self._tiempos_a_tandas(pedido, candidatos)
+
+        def costo(r: RepartidorZona):
+            tanda = r.tanda_abierta() if tiempos else ()
+            cercania = min(
+                (tiempos[p.nodo_destino] for p in tanda if p.nodo_destino in tiempos),
+                default=pedido.tiempo_estimado_min,
+            )
+            return (
+                min(cercania, pedido.tiempo_estimado_min)
+                + PENALIZACION_CARGA_MIN * r.carga_tanda_abierta(),
+                r.cantidad_pendientes(),
+            )
 
+        mejor_repartidor = min(candidatos, key=costo)
+
+        pedido.repartidor = mejor_repartidor.zona
         lote_lleno = mejor_repartidor.asignar_pedido(pedido)
 
         # Ahora su .zona es el ID del repartidor
         return lote_lleno, mejor_repartidor.zona
 
+    def _tiempos_a_tandas(self, pedido: Pedido, candidatos: List[RepartidorZona]) -> Dict[int, float]:
+        """
+        {nodo: minutos} desde el cliente nuevo a cada parada de las tandas
+        abiertas de los candidatos (una sola búsqueda). Vacío si no se puede.
+        """
+        if self.tiempos_desde is None or pedido.nodo_destino is None:
+            return {}
+        destinos = list({
+            p.nodo_destino
+            for r in candidatos for p in r.tanda_abierta()
+            if p.nodo_destino is not None
+        })
+        if not destinos:
+            return {}
+        minutos = self.tiempos_desde(pedido.nodo_destino, destinos)
+        return {n: float(t) for n, t in zip(destinos, minutos) if np.isfinite(t)}
+
+    def redistribuir_pendientes(self) -> List[str]:
+        """
+        Rearma las tandas que todavía NO se enviaron agrupando TODOS los
+        pedidos pendientes por cercanía (k-medoides sobre tiempos por calle,
+        un grupo por repartidor, con tope parejo de pedidos por grupo).
+        Cada grupo queda con el repartidor que ya tenía más pedidos de él.
+        Dentro de cada repartidor se respeta el orden de llegada.
+
+        Devuelve las zonas cuyo lote actual quedó completo (para enviarlo).
+        """
+        if self.matriz_tiempos is None or len(self.repartidores) < 2:
+            return []
+
+        reps = list(self.repartidores.values())
+        pendientes = [p for r in reps for p in r.obtener_pedidos_pendientes()]
+        con_nodo = [p for p in pendientes if p.nodo_destino is not None]
+        if len(con_nodo) < 2:
+            return []
+
+        tiempos = self.matriz_tiempos([p.nodo_destino for p in con_nodo])
+        etiquetas = k_medoides(tiempos, k=len(reps))
+
+        # Grupo -> repartidor, empezando por los pares con más pedidos en común
+        en_comun: Dict[tuple, int] = {}
+        for p, g in zip(con_nodo, etiquetas):
+            en_comun[(int(g), p.repartidor)] = en_comun.get((int(g), p.repartidor), 0) + 1
+        grupo_a_zona: Dict[int, str] = {}
+        libres = [r.zona for r in reps]
+        for (g, zona), _ in sorted(en_comun.items(), key=lambda kv: -kv[1]):
+            if g not in grupo_a_zona and zona in libres:
+                grupo_a_zona[g] = zona
+                libres.remove(zona)
+        for g in sorted(set(int(g) for g in etiquetas)):
+            if g not in grupo_a_zona:
+                grupo_a_zona[g] = libres.pop(0)
+
+        nuevos: Dict[str, List[Pedido]] = {r.zona: [] for r in reps}
+        for p, g in zip(con_nodo, etiquetas):
+            nuevos[grupo_a_zona[int(g)]].append(p)
+
+        completos: List[str] = []
+        for r in reps:
+            # Los que no tienen nodo se quedan con su repartidor
+            nuevos[r.zona].extend(p for p in r.vaciar_pendientes() if p.nodo_destino is None)
+            for p in sorted(nuevos[r.zona], key=lambda p: p.creado):
+                p.repartidor = r.zona
+                r.asignar_pedido(p)
+            if r.lote_actual.esta_completo():
+                completos.append(r.zona)
+        return completos
+
+    def quitar_pedido(self, pedido: Pedido) -> bool:
+        """Saca un pedido pendiente de su repartidor (O(1)). False si no estaba."""
+        repartidor = self.repartidores.get(pedido.repartidor or "")
+        return repartidor is not None and repartidor.quitar_pedido(pedido)
+
     def obtener_lote_actual(self, zona: str) -> List[Pedido]:
         if zona not in self.repartidores:
             return []
         return self.repartidores[zona].obtener_lote_actual()
 
-    def marcar_lote_enviado(self, zona: str) -> List[Pedido]:
+    def marcar_lote_enviado(self, zona: str, enviados: Optional[List[Pedido]] = None) -> List[Pedido]:
         if zona not in self.repartidores:
             return []
-        return self.repartidores[zona].marcar_lote_enviado()
+        return self.repartidores[zona].marcar_lote_enviado(enviados)
@@ -0,0 +1,402 @@
+"""
+Persistencia de clientes, pedidos y estados de conversación.
+
+`Repositorio` es la interfaz que usa main.py; `RepositorioSQLite` la
+implementa sobre un archivo SQLite en modo WAL (lectores concurrentes con
+un escritor).
+
+La app guarda lotes, carritos y conversaciones en memoria y la base es su
+respaldo, así que UN solo proceso puede atenderla: reclamar_dueno lo
+garantiza con un turno que el dueño renueva y que vence si se cae.
+
+Las escrituras no van directo a la base: se juntan en memoria (la última
+escritura de cada fila gana) y un hilo las graba en UNA transacción cada
+`intervalo_s`. Así el camino caliente de un mensaje no espera al disco.
+Las lecturas ven primero lo pendiente, así que cada proceso lee lo que
+acaba de escribir.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from Dominio.Modelos import Cliente, ItemCarrito, Pedido, UnidadCarrito
+
+# Estado de un pedido en la base
+ESTADO_CARRITO = "carrito"      # todavía armándose en el chat
+ESTADO_ASIGNADO = "asignado"    # confirmado y asignado a un repartidor
+ESTADO_ENTREGADO = "entregado"
+
+
+def estado_pedido(pedido: Pedido) -> str:
+    if pedido.entregado:
+        return ESTADO_ENTREGADO
+    if pedido.repartidor:
+        return ESTADO_ASIGNADO
+    return ESTADO_CARRITO
+
+
+# ============================================================
+# (DE)SERIALIZACIÓN
+# ============================================================
+
+def pedido_a_json(pedido: Pedido) -> str:
+    return json.dumps(asdict(pedido), ensure_ascii=False)
+
+
+def pedido_desde_json(texto: str) -> Pedido:
+    datos = json.loads(texto)
+    items = [
+        ItemCarrito(
+            id_producto=i["id_producto"],
+            nombre=i["nombre"],
+            precio=i["precio"],
+            unidades=[UnidadCarrito(**u) for u in i["unidades"]],
+        )
+        for i in datos.pop("items", [])
+    ]
+    if datos.get("ubicacion") is not None:
+        datos["ubicacion"] = tuple(datos["ubicacion"])
+    return Pedido(items=items, **datos)
+
+
+# ============================================================
+# INTERFAZ
+# ============================================================
+
+class Repositorio(ABC):
+    @abstractmethod
+    def guardar_cliente(self, cliente: Cliente) -> None: ...
+
+    @abstractmethod
+    def guardar_pedido(self, pedido: Pedido) -> None: ...
+
+    @abstractmethod
+    def guardar_estado(self, telefono: str, estado: Optional[Dict[str, Any]]) -> None:
+        """Estado de la conversación del teléfono; None lo borra."""
+
+    @abstractmethod
+    def clientes(self) -> List[Cliente]:
+        """Clientes registrados (sin sus pedidos)."""
+
+    @abstractmethod
+    def estados(self) -> Dict[str, Dict[str, Any]]: ...
+
+    @abstractmethod
+    def pedido_por_codigo(self, codigo: str) -> Optional[Pedido]:
+        """El pedido más reciente con ese código de validación."""
+
+    @abstractmethod
+    def pedidos_por_estado(self, estado: str, repartidor: Optional[str] = None) -> List[Pedido]:
+        """Pedidos en ese estado, en orden de creación."""
+
+    @abstractmethod
+    def reclamar_dueno(self, proceso: str, duracion_s: float) -> str:
+        """
+        Deja a `proceso` como dueño de la base por `duracion_s` (o renueva
+        su turno) si no hay otro dueño vigente. Devuelve el dueño vigente.
+        """
+
+    @abstractmethod
+    def soltar_dueno(self, proceso: str) -> None:
+        """Libera la base si `proceso` es el dueño (al apagar)."""
+
+    def vaciar(self) -> None:
+        """Graba lo pendiente (si la implementación difiere escrituras)."""
+
+    def cerrar(self) -> None:
+        self.vaciar()
+
+
+# ============================================================
+# SQLITE
+# ============================================================
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS clientes (
+    telefono    TEXT PRIMARY KEY,
+    nombre      TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pedidos (
+    id_pedido   TEXT PRIMARY KEY,
+    telefono    TEXT NOT NULL,
+    estado      TEXT NOT NULL,
+    zona        TEXT,
+    repartidor  TEXT,
+    codigo      TEXT,
+    creado      REAL NOT NULL,
+    datos       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_pedidos_telefono ON pedidos (telefono);
+CREATE INDEX IF NOT EXISTS ix_pedidos_codigo ON pedidos (codigo) WHERE codigo IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_pedidos_estado ON pedidos (estado, repartidor, creado);
+CREATE INDEX IF NOT EXISTS ix_pedidos_zona ON pedidos (zona, estado);
+
+CREATE TABLE IF NOT EXISTS estados (
+    telefono    TEXT PRIMARY KEY,
+    datos       TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dueno (
+    id          INTEGER PRIMARY KEY CHECK (id = 1),
+    proceso     TEXT NOT NULL,
+    vence       REAL NOT NULL
+);
+"""
+
+# Clave de una escritura pendiente: (tabla, id de la fila)
+_Clave = Tuple[str, str]
+
+
+class RepositorioSQLite(Repositorio):
+    def __init__(self, path: str, intervalo_s: float = 0.05, max_pendientes: int = 500):
+        self.path = path
+        self.intervalo_s = intervalo_s
+        self.max_pendientes = max_pendientes
+
+        carpeta = os.path.dirname(path)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+
+        self._local = threading.local()
+        with self._conexion() as con:
+            con.executescript(_ESQUEMA)
+
+        # Escrituras pendientes: la última por fila gana
+        self._pendientes: Dict[_Clave, Optional[tuple]] = {}
+        # Tanda que se está grabando: sigue visible para las lecturas hasta el COMMIT
+        self._en_vuelo: Dict[_Clave, Optional[tuple]] = {}
+        self._lock = threading.Lock()
+        self._grabando = threading.Lock()
+        self._hay_pendientes = threading.Event()
+        self._urgente = threading.Event()
+        self._cerrado = False
+
+        self.tandas = 0
+        self.filas_escritas = 0
+
+        self._escritor = threading.Thread(target=self._escribir_en_tandas, name="repo-sqlite", daemon=True)
+        self._escritor.start()
+
+    def _conexion(self) -> sqlite3.Connection:
+        """Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)."""
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA busy_timeout=10000")
+            self._local.con = con
+        return con
+
+    # ---------------- escrituras (diferidas) ----------------
+
+    def _encolar(self, clave: _Clave, fila: Optional[tuple]) -> None:
+        with self._lock:
+            self._pendientes[clave] = fila
+            cantidad = len(self._pendientes)
+        self._hay_pendientes.set()
+        if cantidad >= self.max_pendientes:
+            # Muchas filas juntas: que el escritor no espere el intervalo
+            self._urgente.set()
+
+    def guardar_cliente(self, cliente: Cliente) -> None:
+        self._encolar(("clientes", cliente.telefono), (cliente.telefono, cliente.nombre))
+
+    def guardar_pedido(self, pedido: Pedido) -> None:
+        fila = (
+            pedido.id_pedido,
+            pedido.telefono_cliente,
+            estado_pedido(pedido),
+            pedido.zona,
+            pedido.repartidor,
+            pedido.codigo_validacion,
+            pedido.creado,
+            pedido_a_json(pedido),
+        )
+        self._encolar(("pedidos", pedido.id_pedido), fila)
+
+    def guardar_estado(self, telefono: str, estado: Optional[Dict[str, Any]]) -> None:
+        fila = (telefono, json.dumps(estado, ensure_ascii=False)) if estado else None
+        self._encolar(("estados", telefono), fila)
+
+    def _escribir_en_tandas(self) -> None:
+        while True:
+            self._hay_pendientes.wait()
+            # Juntamos lo que llegue durante el intervalo (salvo apuro o cierre)
+            self._urgente.wait(timeout=self.intervalo_s)
+            self._urgente.clear()
+            try:
+                self.vaciar()
+            except Exception:
+                logging.exception("[REPO] Error grabando tanda en SQLite")
+                time.sleep(1.0)
+            if self._cerrado:
+                return
+
+    def vaciar(self) -> None:
+        # Una tanda a la vez (el escritor y cerrar() pueden coincidir)
+        with self._grabando:
+            self._vaciar()
+
+    def _vaciar(self) -> None:
+        with self._lock:
+            tanda = self._pendientes
+            self._pendientes = {}
+            self._en_vuelo = tanda
+            self._hay_pendientes.clear()
+        if not tanda:
+            return
+
+        con = self._conexion()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            for (tabla, id_fila), fila in tanda.items():
+                if fila is None:
+                    con.execute(f"DELETE FROM {tabla} WHERE {_PK[tabla]} = ?", (id_fila,))
+                else:
+                    con.execute(_UPSERT[tabla], fila)
+            con.execute("COMMIT")
+        except Exception:
+            # Primero devolvemos la tanda (sin pisar escrituras más nuevas):
+            # si falló el BEGIN (p. ej. "database is locked") no hay nada
+            # que deshacer y el ROLLBACK mismo fallaría.
+            with self._lock:
+                for clave, fila in tanda.items():
+                    self._pendientes.setdefault(clave, fila)
+                self._en_vuelo = {}
+                self._hay_pendientes.set()
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+
+        with self._lock:
+            self._en_vuelo = {}
+        self.tandas += 1
+        self.filas_escritas += len(tanda)
+
+    # ---------------- dueño de la base (sin diferir) ----------------
+
+    def reclamar_dueno(self, proceso: str, duracion_s: float) -> str:
+        con = self._conexion()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            fila = con.execute("SELECT proceso, vence FROM dueno WHERE id = 1").fetchone()
+            ahora = time.time()
+            if fila is None or fila[0] == proceso or fila[1] < ahora:
+                con.execute(
+                    "INSERT INTO dueno (id, proceso, vence) VALUES (1, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET proceso = excluded.proceso, vence = excluded.vence",
+                    (proceso, ahora + duracion_s),
+                )
+                vigente = proceso
+            else:
+                vigente = fila[0]
+            con.execute("COMMIT")
+        except Exception:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        return vigente
+
+    def soltar_dueno(self, proceso: str) -> None:
+        self._conexion().execute("DELETE FROM dueno WHERE id = 1 AND proceso = ?", (proceso,))
+
+    def cerrar(self) -> None:
+        self._cerrado = True
+        self._hay_pendientes.set()
+        self._urgente.set()
+        self._escritor.join(timeout=10)
+        self.vaciar()
+
+    # ---------------- lecturas ----------------
+
+    def _pendientes_de(self, tabla: str) -> Dict[str, Optional[tuple]]:
+        """Escrituras sin COMMIT de una tabla (las pendientes pisan a la tanda en vuelo)."""
+        with self._lock:
+            escrituras = {**self._en_vuelo, **self._pendientes}
+        return {k[1]: f for k, f in escrituras.items() if k[0] == tabla}
+
+    def clientes(self) -> List[Cliente]:
+        filas = dict(self._conexion().execute("SELECT telefono, nombre FROM clientes").fetchall())
+        for telefono, fila in self._pendientes_de("clientes").items():
+            filas[telefono] = fila[1]
+        return [Cliente(telefono=t, nombre=n) for t, n in filas.items()]
+
+    def estados(self) -> Dict[str, Dict[str, Any]]:
+        filas = dict(self._conexion().execute("SELECT telefono, datos FROM estados").fetchall())
+        for telefono, fila in self._pendientes_de("estados").items():
+            if fila is None:
+                filas.pop(telefono, None)
+            else:
+                filas[telefono] = fila[1]
+        return {t: json.loads(d) for t, d in filas.items()}
+
+    def pedido_por_codigo(self, codigo: str) -> Optional[Pedido]:
+        candidatos = [
+            (f[6], f[7]) for f in self._pendientes_de("pedidos").values()
+            if f is not None and f[5] == codigo
+        ]
+        fila = self._conexion().execute(
+            "SELECT creado, datos FROM pedidos WHERE codigo = ? ORDER BY creado DESC LIMIT 1", (codigo,)
+        ).fetchone()
+        if fila:
+            candidatos.append(fila)
+        if not candidatos:
+            return None
+        return pedido_desde_json(max(candidatos, key=lambda c: c[0])[1])
+
+    def pedidos_por_estado(self, estado: str, repartidor: Optional[str] = None) -> List[Pedido]:
+        sql = "SELECT id_pedido, creado, datos FROM pedidos WHERE estado = ?"
+        params: tuple = (estado,)
+        if repartidor is not None:
+            sql += " AND repartidor = ?"
+            params += (repartidor,)
+
+        filas = {i: (c, d) for i, c, d in self._conexion().execute(sql, params).fetchall()}
+        for id_pedido, fila in self._pendientes_de("pedidos").items():
+            coincide = fila[2] == estado and (repartidor is None or fila[4] == repartidor)
+            if coincide:
+                filas[id_pedido] = (fila[6], fila[7])
+            else:
+                filas.pop(id_pedido, None)
+
+        return [pedido_desde_json(d) for _, d in sorted(filas.values(), key=lambda f: f[0])]
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            pendientes = len(self._pendientes) + len(self._en_vuelo)
+        return {
+            "path": self.path,
+            "pendientes": pendientes,
+            "tandas": self.tandas,
+            "filas_escritas": self.filas_escritas,
+        }
+
+
+_PK = {"clientes": "telefono", "pedidos": "id_pedido", "estados": "telefono"}
+
+_UPSERT = {
+    "clientes": (
+        "INSERT INTO clientes (telefono, nombre) VALUES (?, ?) "
+        "ON CONFLICT (telefono) DO UPDATE SET nombre = excluded.nombre"
+    ),
+    "pedidos": (
+        "INSERT INTO pedidos (id_pedido, telefono, estado, zona, repartidor, codigo, creado, datos) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (id_pedido) DO UPDATE SET "
+        "estado = excluded.estado, zona = excluded.zona, repartidor = excluded.repartidor, "
+        "codigo = excluded.codigo, datos = excluded.datos"
+    ),
+    "estados": (
+        "INSERT INTO estados (telefono, datos) VALUES (?, ?) "
+        "ON CONFLICT (telefono) DO UPDATE SET datos = excluded.datos"
+    ),
+}
@@ -1,40 +1,54 @@
-from typing import List, Optional
-
-import osmnx as ox
-import networkx as nx  # por si querés usar funciones de networkx también
+import logging
+import os
+from typing import List, Optional, Tuple
 
 from Dominio.Modelos import Pedido
-
-# 👇 IMPORTAMOS LAS FUNCIONES DEL MÓDULO DE GIFS
-# Asegurate de que el archivo se llame exactamente `coordenadas_gifs.py`
-from Algoritmos.coordenadas_gifs import (
-    frames,
-    a_star_gif,          # algoritmo A* que pinta el grafo y llena frames
-    reconstruct_path_gif,
-    create_gif,
-)
+from Algoritmos import arbol_caminos, contraccion, grafo_csr
+from Algoritmos.a_estrella import a_estrella
+from Algoritmos.cache_rutas import CacheRutas
+from Algoritmos.matriz_distancias import matriz_distancias as calcular_matriz
+from Algoritmos.matriz_distancias import tiempos_desde as calcular_tiempos_desde
+from Algoritmos.orden_paradas import ordenar_paradas
+from Algoritmos.indice_espacial import obtener_indice
+from Algoritmos.grafo_salto import obtener_grafo
+
+# Dibujo de la ruta final sobre el mapa base (ver Algoritmos/coordenadas_gifs.py)
+from Algoritmos.coordenadas_gifs import render_ruta_final
+from Algoritmos.render_rutas import a_png
 
 # -----------------------------------------------------------
 # GRAFO DE SALTO (una sola vez)
 # -----------------------------------------------------------
 
-# Cargar el grafo de Salto, Uruguay
-G = ox.graph_from_place("Salto, Uruguay", network_type="drive")
-
-def _parse_maxspeed(raw) -> float:
-    if raw is None:
-        return 40.0
-    if isinstance(raw, (list, tuple)):
-        raw = raw[0]
-    if isinstance(raw, str):
-        digits = "".join(ch for ch in raw if ch.isdigit())
-        if digits:
-            return float(digits)
-        return 40.0
-    try:
-        return float(raw)
-    except Exception:
-        return 40.0
+# Instancia compartida (snapshot local, ver Algoritmos/grafo_salto.py)
+G = obtener_grafo()
+
+# Versión compacta (arrays) del mismo grafo, para el ruteo
+CSR = grafo_csr.obtener_csr()
+
+# Índice espacial (BallTree) para pasar coordenadas a nodos ruteables
+INDICE = obtener_indice()
+
+# Contraction Hierarchy precalculada (si existe en disco para este snapshot)
+if contraccion.obtener_ch("tiempo") is None:
+    logging.info("[RUTAS] Sin Contraction Hierarchy, se usa A* (python -m Algoritmos.contraccion --construir)")
+
+# Caché de rutas ya calculadas. Con CACHE_RUTAS_ARCHIVO se guarda en disco
+# al apagar (ver guardar_cache_rutas) y se relee al arrancar.
+CACHE_RUTAS_ARCHIVO = os.getenv("CACHE_RUTAS_ARCHIVO", "")
+CACHE_RUTAS = CacheRutas(max_entradas=int(os.getenv("CACHE_RUTAS_MAX", "5000")))
+if CACHE_RUTAS_ARCHIVO:
+    CACHE_RUTAS.cargar_de_disco(CACHE_RUTAS_ARCHIVO, version=CSR.version)
+
+
+# Tiempo máximo para mejorar el orden de visita de un lote (2-opt / Or-opt)
+PRESUPUESTO_ORDEN_S = float(os.getenv("PRESUPUESTO_ORDEN_MS", "50")) / 1000.0
+
+
+def guardar_cache_rutas() -> None:
+    """Persiste la caché de rutas si hay archivo configurado."""
+    if CACHE_RUTAS_ARCHIVO:
+        CACHE_RUTAS.guardar_en_disco(CACHE_RUTAS_ARCHIVO)
 
 # -----------------------------------------------------------
 # A* PARA LÓGICA (DISTANCIA / TIEMPO)
@@ -43,107 +57,184 @@ def _parse_maxspeed(raw) -> float:
 
 def coordenadas_a_nodo(lat: float, lon: float) -> int:
     """
-    Convierte lat/lon a nodo más cercano del grafo.
-    Ojo: osmnx usa (x = lon, y = lat).
+    Convierte lat/lon a nodo más cercano del grafo (solo nodos ruteables).
+    """
+    return INDICE.snap(lat, lon)
+
+
+def coordenadas_a_nodos(coords: List[Tuple[float, float]]) -> List[int]:
+    """
+    Versión batch de coordenadas_a_nodo: lista de (lat, lon) -> lista de nodos.
     """
-    return ox.distance.nearest_nodes(G, lon, lat)
+    return [int(n) for n in INDICE.snap_many(coords)]
 
 
-def a_star_ruta(nodo_origen: int, nodo_destino: int):
+def a_star_ruta(nodo_origen: int, nodo_destino: int, peso: str = "tiempo"):
     """
-    Calcula ruta más corta por 'length' entre nodo_origen y nodo_destino.
+    Calcula la ruta óptima entre nodo_origen y nodo_destino con A*.
+    peso="tiempo" minimiza minutos (largo / maxspeed de cada calle),
+    peso="longitud" minimiza kilómetros.
     Devuelve: path (lista de nodos), dist_km, tiempo_min.
+
+    El tiempo es el del camino elegido (suma arista por arista).
+    Si el origen tiene un árbol precalculado (el local), no busca: lo lee.
+    Entre otros pares usa la Contraction Hierarchy si está construida
+    (python -m Algoritmos.contraccion --construir), si no A*.
+    Los resultados quedan en CACHE_RUTAS (LRU por par de nodos).
     """
-    try:
-        path = nx.shortest_path(G, nodo_origen, nodo_destino, weight="length")
-    except nx.NetworkXNoPath:
-        return [nodo_origen], 0.0, 0.0
+    clave = (CSR.version, nodo_origen, nodo_destino, peso)
+    ruta = CACHE_RUTAS.obtener(clave)
+    if ruta is not None:
+        return ruta
 
-    if not path or len(path) == 1:
-        return path, 0.0, 0.0
+    ruta = _calcular_ruta(nodo_origen, nodo_destino, peso)
+    CACHE_RUTAS.guardar(clave, ruta)
+    return ruta
 
-    dist_m = 0.0
-    speeds = []
 
-    for u, v in zip(path, path[1:]):
-        edge_data = G.get_edge_data(u, v)
-        if not edge_data:
-            continue
+def en_pool(funcion, *args):
+    """
+    Corre funcion(*args) en un proceso del pool y devuelve (resultado,
+    novedades de CACHE_RUTAS). El proceso web las pasa a incorporar_novedades.
+    """
+    return funcion(*args), CACHE_RUTAS.tomar_novedades()
+
 
-        e0 = list(edge_data.values())[0]
-        length = float(e0.get("length", 0.0))
-        maxspeed = _parse_maxspeed(e0.get("maxspeed", 40.0))
+def incorporar_novedades(novedades) -> None:
+    """Suma a CACHE_RUTAS las rutas y aciertos/fallos de un proceso del pool."""
+    CACHE_RUTAS.incorporar(novedades)
 
-        dist_m += length
-        speeds.append(maxspeed)
 
-    dist_km = dist_m / 1000.0
+def _calcular_ruta(nodo_origen: int, nodo_destino: int, peso: str):
+    arbol = arbol_caminos.arbol_existente(nodo_origen, peso)
+    if arbol is not None:
+        return arbol.ruta(nodo_destino)
 
-    if speeds:
-        vel_prom = sum(speeds) / len(speeds)
-        tiempo_min = dist_km / vel_prom * 60.0
+    o = CSR.idx(nodo_origen)
+    d = CSR.idx(nodo_destino)
+    ch = contraccion.obtener_ch(peso)
+    if ch is not None:
+        _, camino = ch.consulta(o, d)
     else:
-        vel_prom = 40.0
-        tiempo_min = dist_km / vel_prom * 60.0 if dist_km > 0 else 0.0
+        camino, _ = a_estrella(CSR, o, d, peso)
+    if not camino:
+        return [nodo_origen], 0.0, 0.0
 
-    return path, dist_km, tiempo_min
+    dist_km, tiempo_min = grafo_csr.resumen_camino(CSR, camino, peso)
+    return [int(CSR.nodos[i]) for i in camino], dist_km, tiempo_min
 
-# -----------------------------------------------------------
-# GIF PARA LOTE DE PEDIDOS (USANDO coordenadas_gifs)
-# -----------------------------------------------------------
 
-def generar_gif_ruta_lote(pedidos: List[Pedido]) -> Optional[str]:
+def matriz_distancias(nodos: List[int], peso: str = "tiempo"):
     """
-    Genera un GIF para un lote de pedidos, encadenando
-    la ruta local -> pedido1 -> pedido2 -> ... en orden.
+    Matrices N x N entre los nodos dados (p. ej. las paradas de un lote):
+    devuelve (dist_km, tiempo_min) como arrays de NumPy, fila = origen.
+    Una sola búsqueda por origen; inf si no hay camino.
+    """
+    indices = [CSR.idx(n) for n in nodos]
+    return calcular_matriz(CSR, indices, peso)
 
-    Para el GIF usamos las funciones de `coordenadas_gifs`:
-    - a_star_gif (que recalcula la ruta y pinta el grafo)
-    - reconstruct_path_gif
-    - create_gif
 
-    Devuelve el path del GIF o None si falla.
+def tiempos_desde(nodo_origen: int, destinos: List[int], limite_min: Optional[float] = None):
+    """
+    Minutos por calle desde nodo_origen a cada destino (una sola búsqueda,
+    acotada a `limite_min` si se pasa; inf si no hay camino o queda lejos).
+    Lo usa el reparto para ver qué tanda queda más cerca de un pedido nuevo.
     """
+    segundos = calcular_tiempos_desde(
+        CSR,
+        CSR.idx(nodo_origen),
+        [CSR.idx(n) for n in destinos],
+        "tiempo",
+        None if limite_min is None else limite_min * 60.0,
+    )
+    return segundos / 60.0
 
+
+def precalcular_arbol(nodo_origen: int, peso: str = "tiempo") -> None:
+    """
+    Calcula (una vez por versión del grafo) el árbol de caminos mínimos
+    desde nodo_origen. Se usa para el local, que es origen de todos los pedidos.
+    """
+    arbol_caminos.obtener_arbol(nodo_origen, peso)
+
+# -----------------------------------------------------------
+# IMAGEN PARA LOTE DE PEDIDOS (EN MEMORIA, SIN ARCHIVOS)
+# -----------------------------------------------------------
+
+def _ordenar_lote(pedidos: List[Pedido]) -> Tuple[Optional[int], List[Pedido]]:
+    """
+    (nodo de inicio, pedidos con nodos válidos en orden de visita).
+    El orden sale de los tiempos reales por calle entre todas las paradas
+    (ver Algoritmos/orden_paradas.py), no de la distancia al local.
+    """
     # Filtramos pedidos que tengan nodos válidos
     pedidos_validos = [
         p for p in pedidos
         if p.nodo_origen is not None and p.nodo_destino is not None
     ]
     if not pedidos_validos:
-        return None
+        return None, []
 
     # En este ejemplo todos usan el mismo nodo_origen (el del local)
     nodo_inicio = pedidos_validos[0].nodo_origen
 
-    # Orden simple: por distancia_km ascendente (más cercanos primero)
-    pedidos_ordenados = sorted(
-        pedidos_validos,
-        key=lambda p: p.distancia_km
-    )
+    if len(pedidos_validos) == 1:
+        return nodo_inicio, pedidos_validos
 
-    # Limpiamos los frames globales del módulo de GIFs
-    frames.clear()
+    # Matriz de tiempos: fila/columna 0 = local, i = pedidos_validos[i - 1]
+    nodos = [nodo_inicio] + [p.nodo_destino for p in pedidos_validos]
+    _, tiempos_min = matriz_distancias(nodos, "tiempo")
 
-    nodo_actual = nodo_inicio
-    hay_algo = False
+    # El orden de siempre (más cercanos primero) entra como candidato inicial
+    por_distancia = sorted(
+        range(1, len(nodos)),
+        key=lambda i: pedidos_validos[i - 1].distancia_km
+    )
+    orden = ordenar_paradas(tiempos_min, presupuesto_s=PRESUPUESTO_ORDEN_S, inicial=por_distancia)
+    return nodo_inicio, [pedidos_validos[i - 1] for i in orden]
 
-    for idx, p in enumerate(pedidos_ordenados, start=1):
-        # Para el GIF usamos el A* propio del módulo de GIFs
-        a_star_gif(nodo_actual, p.nodo_destino)
-        ok = reconstruct_path_gif(nodo_actual, p.nodo_destino, f"Lote #{idx}")
-        if not ok:
-            continue
 
-        nodo_actual = p.nodo_destino
-        hay_algo = True
+def ruta_lote(pedidos: List[Pedido]) -> Optional[Tuple[List[int], bytes]]:
+    """
+    Para enviar un lote: (orden, png). `orden` son posiciones en `pedidos`
+    en el orden de visita (para armar el resumen igual que el mapa) y
+    `png` la imagen de la ruta completa.
+    """
+    nodo_inicio, pedidos_ordenados = _ordenar_lote(pedidos)
+    if not pedidos_ordenados:
+        return None
 
-    if not hay_algo:
+    imagen = _imagen_ruta_lote(nodo_inicio, pedidos_ordenados)
+    if imagen is None:
         return None
 
-    gif_path, png_path = create_gif("pathfinding_lote_reparto_salto.gif")
+    posicion = {id(p): i for i, p in enumerate(pedidos)}
+    orden = [posicion[id(p)] for p in pedidos_ordenados]
+    return orden, a_png(imagen)
+
 
-    if not png_path:
+def _imagen_ruta_lote(nodo_inicio: int, pedidos_ordenados: List[Pedido]):
+    """Calcula los tramos del lote y dibuja la ruta completa (imagen PIL)."""
+    caminos = []
+    dist_total = 0.0
+    tiempo_total = 0.0
+
+    nodo_actual = nodo_inicio
+    for p in pedidos_ordenados:
+        path, dist_km, tiempo_min = a_star_ruta(nodo_actual, p.nodo_destino)
+        if len(path) < 2 and nodo_actual != p.nodo_destino:
+            logging.warning(f"[RUTAS] Sin camino {nodo_actual} -> {p.nodo_destino}, se saltea")
+            continue
+        caminos.append(path)
+        dist_total += dist_km
+        tiempo_total += tiempo_min
+        nodo_actual = p.nodo_destino
+
+    if not caminos:
         return None
 
-    return png_path
+    titulo = (
+        f"Lote ({len(caminos)} pedidos) - CAMINO OPTIMO\n"
+        f"Distancia: {dist_total:.2f}km | Tiempo: {tiempo_total:.1f}min"
+    )
+    return render_ruta_final(caminos, titulo)
@@ -1,17 +1,33 @@
+import asyncio
 import os
 import logging
-from typing import Any, Dict, List
+import socket
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import PlainTextResponse
 
 import random
-from Dominio.Chat import Chat
+from Dominio.Chat import Chat, calcular_ruta_cliente, precalentar_proceso
 from Dominio.Reparto import GestorReparto
 from Dominio import Rutas
 from Dominio.Modelos import Pedido, Cliente
+from Dominio.Repositorio import (
+    ESTADO_ASIGNADO,
+    ESTADO_CARRITO,
+    ESTADO_ENTREGADO,
+    Repositorio,
+    RepositorioSQLite,
+)
 from utils.get_message_type import get_message_type
+from utils.cache_media import CacheMedia
+from utils.colas_por_clave import ColasPorClave
+from utils.limitador import PresupuestoReintentos, TokenBucket, espera_backoff
+from utils.pool_procesos import PoolProcesos, PoolSaturado
 
 # -----------------------------------
 # CONFIGURACIÓN BÁSICA
@@ -19,7 +35,50 @@ from utils.get_message_type import get_message_type
 
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI()
+# Ruteo y render de mapas corren en procesos aparte (ver utils/pool_procesos.py)
+# para no bloquear el event loop. POOL_PROCESOS=0 los corre en un hilo.
+POOL = PoolProcesos(
+    procesos=int(os.getenv("POOL_PROCESOS", "2")),
+    max_en_cola=int(os.getenv("POOL_MAX_EN_COLA", "16")),
+    espera_max=float(os.getenv("POOL_ESPERA_MAX", "30")),
+    inicializador=precalentar_proceso,
+)
+
+
+async def ejecutar_ruteo(funcion, *args):
+    """
+    POOL.ejecutar para trabajos que rutean: lo que el proceso del pool sumó
+    a su caché de rutas (rutas, aciertos, fallos) pasa a Rutas.CACHE_RUTAS,
+    que es la que muestra /cacherutas y la que se guarda al apagar.
+    """
+    resultado, novedades = await POOL.ejecutar(Rutas.en_pool, funcion, *args)
+    Rutas.incorporar_novedades(novedades)
+    return resultado
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global HTTP
+    await tomar_base()
+    cargar_estado_persistido()
+    HTTP = crear_cliente_http()
+    await POOL.iniciar()
+    planificador = asyncio.create_task(planificador_lotes())
+    yield
+    planificador.cancel()
+    # Terminamos lo ya encolado antes de cortar pool y cliente HTTP
+    await COLAS_MENSAJES.cerrar()
+    await DESPACHADOR.cerrar()
+    POOL.cerrar()
+    REPO.cerrar()
+    REPO.soltar_dueno(ID_PROCESO)
+    await HTTP.aclose()
+    HTTP = None
+    # Al apagar: dejamos la caché de rutas en disco para arrancar "en caliente"
+    Rutas.guardar_cache_rutas()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Instancia de tu Chat anterior
 chat = Chat()
@@ -37,19 +96,191 @@ CELULAR_REPARTIDOR = {
 
 gestor_reparto = GestorReparto.desde_config(CELULAR_REPARTIDOR)
 
+# Asignación por cercanía: la búsqueda se corta en REPARTO_RADIO_MIN (más
+# lejos que eso ya no es "cerca" de ninguna tanda)
+REPARTO_RADIO_MIN = float(os.getenv("REPARTO_RADIO_MIN", "20"))
+gestor_reparto.tiempos_desde = lambda nodo, destinos: Rutas.tiempos_desde(nodo, destinos, REPARTO_RADIO_MIN)
+gestor_reparto.matriz_tiempos = lambda nodos: Rutas.matriz_distancias(nodos, "tiempo")[1]
+
+# --------------------------------------------------------
+# PERSISTENCIA
+# --------------------------------------------------------
+
+# Los dicts de arriba son la copia en memoria; cada cambio se graba también
+# en la base (en tandas, ver Dominio/Repositorio.py) y al arrancar se leen
+# de ahí, así un reinicio no pierde carritos, pedidos ni conversaciones.
+#
+# Como lotes, carritos y conversaciones viven en memoria, la app corre con
+# UN solo worker (uvicorn --workers 1). Dos procesos con la misma base
+# cerrarían y mandarían los mismos lotes: al arrancar se toma la base como
+# dueño (tomar_base) y el que no la consigue no arranca.
+DB_PATH = os.getenv("DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "reparto.db"))
+REPO: Repositorio = RepositorioSQLite(DB_PATH)
+
+ID_PROCESO = f"{socket.gethostname()}:{os.getpid()}"
+# Turno de dueño de la base; lo renueva el planificador de lotes en cada vuelta
+REPO_DUENO_S = float(os.getenv("REPO_DUENO_S", "30"))
+
+
+async def tomar_base() -> None:
+    """
+    Toma la base como dueño antes de cargar nada. Si la tiene otro proceso
+    se espera a que venza su turno (uno que se cayó sin soltarla); si sigue
+    renovándolo es otro worker vivo y este no arranca.
+    """
+    limite = time.time() + REPO_DUENO_S + PLANIFICADOR_LOTES_S
+    while True:
+        dueno = REPO.reclamar_dueno(ID_PROCESO, REPO_DUENO_S)
+        if dueno == ID_PROCESO:
+            return
+        if time.time() >= limite:
+            raise RuntimeError(
+                f"La base {DB_PATH} ya la atiende otro proceso ({dueno}). "
+                f"Esta app corre con un solo worker (uvicorn --workers 1)."
+            )
+        logging.warning(f"[REPO] La base es de {dueno}, esperando a que venza su turno...")
+        await asyncio.sleep(1.0)
+
+
+def cargar_estado_persistido() -> None:
+    for cliente in REPO.clientes():
+        clientes[cliente.telefono] = cliente
+
+    estado_usuarios.update(REPO.estados())
+
+    # Carritos en curso (si hay más de uno por teléfono, queda el último)
+    for pedido in REPO.pedidos_por_estado(ESTADO_CARRITO):
+        chat.pedidos[pedido.telefono_cliente] = pedido
+
+    # Pedidos confirmados: los que no salieron vuelven a su repartidor en
+    # el mismo orden (los ya enviados solo esperan el código de entrega)
+    for pedido in REPO.pedidos_por_estado(ESTADO_ASIGNADO):
+        repartidor = gestor_reparto.repartidores.get(pedido.repartidor)
+        if repartidor and pedido.enviado is None:
+            repartidor.asignar_pedido(pedido)
+        if pedido.codigo_validacion:
+            codigos_pedidos[pedido.codigo_validacion] = pedido
+        if pedido.telefono_cliente in clientes:
+            clientes[pedido.telefono_cliente].pedidos.append(pedido)
+
+    for pedido in REPO.pedidos_por_estado(ESTADO_ENTREGADO):
+        repartidor = gestor_reparto.repartidores.get(pedido.repartidor or pedido.zona)
+        if pedido.entregado_en is None:
+            # Pedidos grabados antes de guardar la hora de entrega
+            pedido.entregado_en = pedido.enviado or pedido.confirmado or pedido.creado
+        if repartidor:
+            repartidor.registrar_entrega(pedido)
+        if pedido.telefono_cliente in clientes:
+            clientes[pedido.telefono_cliente].pedidos.append(pedido)
+
+    logging.info(
+        f"[REPO] Cargados {len(clientes)} clientes, {len(chat.pedidos)} carritos, "
+        f"{len(codigos_pedidos)} pedidos pendientes desde {DB_PATH}"
+    )
+
+
+def persistir_telefono(telefono: str) -> None:
+    """Graba (diferido) todo lo que un mensaje puede cambiar de ese cliente."""
+    cliente = clientes.get(telefono)
+    if cliente:
+        REPO.guardar_cliente(cliente)
+        if cliente.pedidos:
+            # El último pedido cambia al confirmarse o al calificarlo
+            REPO.guardar_pedido(cliente.pedidos[-1])
+
+    REPO.guardar_estado(telefono, estado_usuarios.get(telefono))
+
+    pedido = chat.pedidos.get(telefono)
+    if pedido:
+        REPO.guardar_pedido(pedido)
+
+
+def usar_pedido_del_cliente(pedido: Pedido) -> None:
+    """
+    Deja `pedido` como LA copia en la lista del cliente (reemplaza otra con
+    el mismo id_pedido), así persistir_telefono no graba una versión vieja.
+    """
+    cliente = clientes.get(pedido.telefono_cliente)
+    if not cliente:
+        return
+    for i, p in enumerate(cliente.pedidos):
+        if p.id_pedido == pedido.id_pedido:
+            cliente.pedidos[i] = pedido
+            return
+
+
+def generar_codigo_validacion() -> str:
+    """Código de 6 dígitos que no esté en uso por otro pedido sin entregar."""
+    while True:
+        codigo = f"{random.randint(0, 999999):06d}"
+        if codigo in codigos_pedidos:
+            continue
+        otro = REPO.pedido_por_codigo(codigo)
+        if otro is None or otro.entregado:
+            return codigo
+
+
 # --- CREDENCIALES Y CONFIGURACIÓN ---
 ACCESS_TOKEN = os.getenv("ACCESS_TOKEN", "")
 PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID", "")
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN", "")
 VERSION = os.getenv("VERSION", "v22.0")
 
-GRAPH_SEND_URL = f"https://graph.facebook.com/{VERSION}/{PHONE_NUMBER_ID}/messages"
+# Base de la Graph API; apuntarla a utils/mock_graph.py para probar en local
+GRAPH_BASE_URL = os.getenv("GRAPH_BASE_URL", "https://graph.facebook.com").rstrip("/")
+GRAPH_SEND_URL = f"{GRAPH_BASE_URL}/{VERSION}/{PHONE_NUMBER_ID}/messages"
+GRAPH_MEDIA_URL = f"{GRAPH_BASE_URL}/{VERSION}/{PHONE_NUMBER_ID}/media"
 
 logging.info(f"ACCESS_TOKEN cargado? {bool(ACCESS_TOKEN)}")
 logging.info(f"PHONE_NUMBER_ID: {PHONE_NUMBER_ID!r}")
 logging.info(f"GRAPH_SEND_URL: {GRAPH_SEND_URL}")
 
 
+# --------------------------------------------------------
+# CLIENTE HTTP COMPARTIDO
+# --------------------------------------------------------
+
+# Un solo AsyncClient para toda la vida de la app (se crea en lifespan):
+# reutiliza conexiones TCP/TLS con graph.facebook.com en vez de abrir una
+# por mensaje. HTTP/2 multiplexa los envíos sobre la misma conexión.
+GRAPH_HTTP2 = os.getenv("GRAPH_HTTP2", "1") == "1"
+GRAPH_MAX_CONEXIONES = int(os.getenv("GRAPH_MAX_CONEXIONES", "20"))
+GRAPH_MAX_KEEPALIVE = int(os.getenv("GRAPH_MAX_KEEPALIVE", "10"))
+GRAPH_KEEPALIVE_S = float(os.getenv("GRAPH_KEEPALIVE_S", "60"))
+GRAPH_TIMEOUT_S = float(os.getenv("GRAPH_TIMEOUT_S", "20"))
+
+HTTP: Optional[httpx.AsyncClient] = None
+
+
+def crear_cliente_http() -> httpx.AsyncClient:
+    http2 = GRAPH_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401  (httpx lo necesita para HTTP/2)
+        except ImportError:
+            logging.warning("[HTTP] Falta el paquete h2 (pip install 'httpx[http2]'), se usa HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(GRAPH_TIMEOUT_S, connect=5),
+        limits=httpx.Limits(
+            max_connections=GRAPH_MAX_CONEXIONES,
+            max_keepalive_connections=GRAPH_MAX_KEEPALIVE,
+            keepalive_expiry=GRAPH_KEEPALIVE_S,
+        ),
+        headers={"Authorization": f"Bearer {ACCESS_TOKEN}"},
+    )
+
+
+def cliente_http() -> httpx.AsyncClient:
+    """El cliente compartido; si la app no pasó por lifespan se crea acá."""
+    global HTTP
+    if HTTP is None or HTTP.is_closed:
+        HTTP = crear_cliente_http()
+    return HTTP
+
+
 # --------------------------------------------------------
 # HELPERS DE SERIALIZACIÓN
 # --------------------------------------------------------
@@ -94,8 +325,84 @@ def pedido_to_dict(pedido: Pedido) -> Dict[str, Any]:
 # WHATSAPP HELPERS
 # --------------------------------------------------------
 
-async def send_to_whatsapp(payload: Dict[str, Any]) -> None:
-    """Envía un payload crudo a la API de WhatsApp."""
+# --------------------------------------------------------
+# CAUDAL Y REINTENTOS HACIA GRAPH
+# --------------------------------------------------------
+
+# Token bucket por PHONE_NUMBER_ID (ver utils/limitador.py): requests/seg
+# sostenidos y ráfaga máxima. Conviene dejarlo algo por debajo del límite
+# de la cuenta para no recibir 429.
+GRAPH_TASA = float(os.getenv("GRAPH_TASA", "40"))
+GRAPH_RAFAGA = float(os.getenv("GRAPH_RAFAGA", "40"))
+GRAPH_MAX_REINTENTOS = int(os.getenv("GRAPH_MAX_REINTENTOS", "4"))
+
+# Respuestas que vale la pena reintentar (throttling y errores del servidor)
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Errores de red en los que el request seguro NO llegó a Meta (no se pudo
+# conectar / no hubo conexión libre). Un timeout de lectura o una conexión
+# cortada después de mandar el body NO se reintenta: enviar un mensaje no es
+# idempotente y el cliente o el repartidor lo recibiría dos veces.
+ERRORES_SIN_ENVIO = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_baldes: Dict[str, TokenBucket] = {}
+PRESUPUESTO_REINTENTOS = PresupuestoReintentos(
+    proporcion=float(os.getenv("GRAPH_PROPORCION_REINTENTOS", "0.2"))
+)
+
+
+def balde_graph(phone_number_id: str) -> TokenBucket:
+    balde = _baldes.get(phone_number_id)
+    if balde is None:
+        balde = _baldes[phone_number_id] = TokenBucket(GRAPH_TASA, GRAPH_RAFAGA)
+    return balde
+
+
+async def _post_graph(url: str, **kwargs: Any) -> httpx.Response:
+    """
+    POST a la Graph API respetando el token bucket del número y
+    reintentando 429 / 5xx / errores de conexión con backoff exponencial
+    con jitter, mientras alcance el presupuesto de reintentos.
+    Los demás errores (4xx, timeouts de lectura) se lanzan enseguida.
+    """
+    balde = balde_graph(PHONE_NUMBER_ID)
+    intento = 0
+
+    while True:
+        await balde.adquirir()
+        PRESUPUESTO_REINTENTOS.registrar_request()
+
+        resp: Optional[httpx.Response] = None
+        try:
+            resp = await cliente_http().post(url, **kwargs)
+        except ERRORES_SIN_ENVIO as e:
+            error: Exception = e
+        else:
+            if resp.status_code not in ESTADOS_REINTENTABLES:
+                resp.raise_for_status()
+                return resp
+            error = httpx.HTTPStatusError(
+                f"{resp.status_code} {resp.text}", request=resp.request, response=resp
+            )
+
+        intento += 1
+        if intento > GRAPH_MAX_REINTENTOS or not PRESUPUESTO_REINTENTOS.puede_reintentar():
+            raise error
+
+        espera = espera_backoff(intento)
+        if resp is not None and resp.status_code == 429:
+            try:
+                espera = max(espera, float(resp.headers.get("Retry-After", 1)))
+            except ValueError:
+                pass
+            balde.penalizar(espera)
+
+        logging.warning(f"[GRAPH] {error}; reintento {intento} en {espera:.2f}s")
+        await asyncio.sleep(espera)
+
+
+async def _post_whatsapp(payload: Dict[str, Any]) -> None:
+    """Envía un payload crudo a la API de WhatsApp (un request HTTP)."""
     if not ACCESS_TOKEN or not PHONE_NUMBER_ID:
         logging.warning(
             f"Falta ACCESS_TOKEN o PHONE_NUMBER_ID. "
@@ -104,15 +411,171 @@ async def send_to_whatsapp(payload: Dict[str, Any]) -> None:
         logging.info(f"MOCK SEND => {payload}")
         return
 
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
+    resp = await _post_graph(GRAPH_SEND_URL, json=payload)
+    logging.info(f"Respuesta WhatsApp: {resp.status_code} {resp.text}")
+
+
+# --------------------------------------------------------
+# DESPACHO DE MENSAJES SALIENTES
+# --------------------------------------------------------
+
+# Límites de WhatsApp para poder juntar mensajes
+MAX_TEXTO = 4096
+MAX_CUERPO_BOTONES = 1024
+
+DESPACHO_VENTANA_S = float(os.getenv("DESPACHO_VENTANA_MS", "30")) / 1000.0
+DESPACHO_CONCURRENCIA = int(os.getenv("DESPACHO_CONCURRENCIA", "8"))
+
+
+def combinar_payloads(a: Dict[str, Any], b: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Junta dos mensajes seguidos al mismo destinatario en uno solo, si se puede:
+    - texto + texto -> un texto (separados por una línea en blanco)
+    - texto + botones -> los botones con el texto arriba de su cuerpo
+    Devuelve None si no se pueden juntar (otro tipo o se pasa del largo).
+    """
+    if a.get("to") != b.get("to") or a.get("type") != "text":
+        return None
+
+    texto = a["text"]["body"]
+
+    if b.get("type") == "text":
+        unido = f"{texto}\n\n{b['text']['body']}"
+        if len(unido) <= MAX_TEXTO:
+            return {**a, "text": {**a["text"], "body": unido}}
+
+    if b.get("type") == "interactive" and b["interactive"].get("type") == "button":
+        unido = f"{texto}\n\n{b['interactive']['body']['text']}"
+        if len(unido) <= MAX_CUERPO_BOTONES:
+            interactive = {**b["interactive"], "body": {"text": unido}}
+            return {**b, "interactive": interactive}
+
+    return None
+
+
+class DespachadorSalida:
+    """
+    Mensajes salientes por destinatario. Lo que se manda a un mismo número
+    casi al mismo tiempo (p. ej. resumen + botones) se junta con
+    combinar_payloads y sale en menos requests, siempre en orden.
+    Números distintos se envían en paralelo, con `concurrencia` requests
+    como máximo sobre el cliente HTTP compartido.
+
+    Lo que no se espera (esperar=False) no le avisa a nadie si falla: queda
+    en el log y en `ultimos_fallos` (por destinatario), que muestra /despacho.
+    """
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        resp = await client.post(GRAPH_SEND_URL, headers=headers, json=payload)
-        logging.info(f"Respuesta WhatsApp: {resp.status_code} {resp.text}")
-        resp.raise_for_status()
+    def __init__(self, ventana_s: float, concurrencia: int, max_fallos_guardados: int = 50):
+        self.ventana_s = ventana_s
+        self._limite = asyncio.Semaphore(concurrencia)
+        self._pendientes: Dict[str, List[Tuple[Dict[str, Any], Optional[asyncio.Future]]]] = {}
+        self._tareas: Dict[str, asyncio.Task] = {}
+        # to -> último fallo de ese número, los más recientes al final
+        self._fallos: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._max_fallos = max_fallos_guardados
+
+        self.solicitados = 0
+        self.combinados = 0
+        self.enviados = 0
+        self.fallidos = 0
+
+    def encolar(self, payload: Dict[str, Any], esperar: bool = False) -> Optional[asyncio.Future]:
+        """
+        Agrega el payload a la tanda de su destinatario. Con esperar=True
+        devuelve un future que termina cuando el request se hizo (o falló).
+        """
+        to = payload.get("to", "")
+        futuro = asyncio.get_running_loop().create_future() if esperar else None
+        self._pendientes.setdefault(to, []).append((payload, futuro))
+        self.solicitados += 1
+
+        if to not in self._tareas:
+            self._tareas[to] = asyncio.create_task(self._vaciar(to))
+        return futuro
+
+    def _combinar(self, tanda):
+        juntos: List[Tuple[Dict[str, Any], List[asyncio.Future]]] = []
+        for payload, futuro in tanda:
+            unido = combinar_payloads(juntos[-1][0], payload) if juntos else None
+            if unido is not None:
+                juntos[-1] = (unido, juntos[-1][1])
+                self.combinados += 1
+            else:
+                juntos.append((payload, []))
+            if futuro is not None:
+                juntos[-1][1].append(futuro)
+        return juntos
+
+    async def _vaciar(self, to: str) -> None:
+        try:
+            while self._pendientes.get(to):
+                # Breve espera para que llegue el resto de la ráfaga
+                await asyncio.sleep(self.ventana_s)
+                tanda = self._pendientes.pop(to)
+
+                for payload, futuros in self._combinar(tanda):
+                    error: Optional[Exception] = None
+                    try:
+                        async with self._limite:
+                            await _post_whatsapp(payload)
+                        self.enviados += 1
+                    except Exception as e:
+                        error = e
+                        self._registrar_fallo(to, payload, e)
+
+                    for futuro in futuros:
+                        if futuro.done():
+                            continue
+                        if error is None:
+                            futuro.set_result(None)
+                        else:
+                            futuro.set_exception(error)
+        finally:
+            self._tareas.pop(to, None)
+
+    def _registrar_fallo(self, to: str, payload: Dict[str, Any], error: Exception) -> None:
+        self.fallidos += 1
+        anterior = self._fallos.pop(to, None)
+        self._fallos[to] = {
+            "to": to,
+            "tipo": payload.get("type"),
+            "error": f"{type(error).__name__}: {error}",
+            "cuando": time.time(),
+            "fallos": (anterior["fallos"] if anterior else 0) + 1,
+        }
+        while len(self._fallos) > self._max_fallos:
+            self._fallos.popitem(last=False)
+        logging.error(f"[DESPACHO] Falló envío a {to}: {error}")
+
+    async def cerrar(self) -> None:
+        """Espera a que salga todo lo pendiente."""
+        while self._tareas:
+            await asyncio.gather(*list(self._tareas.values()), return_exceptions=True)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "destinatarios_activos": len(self._tareas),
+            "solicitados": self.solicitados,
+            "enviados": self.enviados,
+            "combinados": self.combinados,
+            "fallidos": self.fallidos,
+            "ultimos_fallos": list(reversed(self._fallos.values())),
+        }
+
+
+DESPACHADOR = DespachadorSalida(DESPACHO_VENTANA_S, DESPACHO_CONCURRENCIA)
+
+
+async def send_to_whatsapp(payload: Dict[str, Any], esperar: bool = False) -> None:
+    """
+    Encola un payload para la API de WhatsApp (ver DespachadorSalida).
+    Por defecto no espera el request (los errores quedan en /despacho); con
+    esperar=True sí, y propaga el error. Usar esperar=True cuando lo que se
+    responde depende de que el mensaje haya salido.
+    """
+    futuro = DESPACHADOR.encolar(payload, esperar=esperar)
+    if futuro is not None:
+        await futuro
 
 
 async def send_menu(to: str, nombre: str = "Cliente") -> None:
@@ -128,14 +591,14 @@ async def send_menu(to: str, nombre: str = "Cliente") -> None:
     await send_to_whatsapp(payload)
 
 
-async def send_text(to: str, body: str) -> None:
+async def send_text(to: str, body: str, esperar: bool = False) -> None:
     payload = {
         "messaging_product": "whatsapp",
         "to": to,
         "type": "text",
         "text": {"body": body},
     }
-    await send_to_whatsapp(payload)
+    await send_to_whatsapp(payload, esperar=esperar)
 
 
 async def send_botones_siguiente_paso(to: str) -> None:
@@ -170,55 +633,110 @@ async def send_botones_siguiente_paso(to: str) -> None:
     await send_to_whatsapp(payload)
 
 
-async def upload_media(file_path: str, mime_type: str = "image/gif") -> str:
-    """Sube un archivo y devuelve media_id."""
-    if not ACCESS_TOKEN or not PHONE_NUMBER_ID:
-        logging.warning("No hay ACCESS_TOKEN o PHONE_NUMBER_ID para subir media.")
-        return ""
+# Media ya subida, por hash del contenido (ver utils/cache_media.py)
+CACHE_MEDIA = CacheMedia()
 
-    url = f"https://graph.facebook.com/{VERSION}/{PHONE_NUMBER_ID}/media"
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        with open(file_path, "rb") as f:
-            files = {"file": (os.path.basename(file_path), f, mime_type)}
-            data = {"messaging_product": "whatsapp"}
-            headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
+async def _subir_media(contenido: bytes, mime_type: str) -> str:
+    extension = mime_type.split("/")[-1]
+    files = {"file": (f"media.{extension}", contenido, mime_type)}
+    data = {"messaging_product": "whatsapp"}
 
-            resp = await client.post(url, data=data, files=files, headers=headers)
+    resp = await _post_graph(GRAPH_MEDIA_URL, data=data, files=files, timeout=30)
+
+    logging.info(f"Subida de media: {resp.status_code} {resp.text}")
+    return resp.json().get("id", "")
+
+
+async def upload_media(contenido: bytes, mime_type: str = "image/png") -> str:
+    """
+    Sube los bytes de una imagen y devuelve media_id. Si ese mismo
+    contenido ya se subió (y no venció en Graph) reutiliza su media_id.
+    """
+    if not ACCESS_TOKEN or not PHONE_NUMBER_ID:
+        logging.warning("No hay ACCESS_TOKEN o PHONE_NUMBER_ID para subir media.")
+        return ""
 
-        logging.info(f"Subida de media: {resp.status_code} {resp.text}")
-        resp.raise_for_status()
-        return resp.json().get("id", "")
+    return await CACHE_MEDIA.subir(contenido, mime_type, _subir_media)
 
 
 # --------------------------------------------------------
 # ENVÍO DE LOTES
 # --------------------------------------------------------
 
-async def enviar_lote_zona_al_repartidor(zona: str) -> None:
+# Zonas con un envío en curso: el planificador no arranca otro encima
+LOTES_EN_ENVIO: set = set()
+
+# Envíos fallidos seguidos por zona: (fallos, no reintentar antes de). Así un
+# lote que no se puede mandar (sin token, Graph caído) no se vuelve a
+# renderizar en cada vuelta del planificador.
+FALLOS_LOTE: Dict[str, Tuple[int, float]] = {}
+LOTE_REINTENTO_MAX_S = float(os.getenv("LOTE_REINTENTO_MAX_S", "300"))
+
+
+def lote_en_espera(zona: str, ahora: float) -> bool:
+    fallos = FALLOS_LOTE.get(zona)
+    return fallos is not None and ahora < fallos[1]
+
+
+async def enviar_lote_zona_al_repartidor(zona: str, motivo: str = "tamaño") -> None:
     repartidor = gestor_reparto.repartidores.get(zona)
     if not repartidor:
         logging.warning(f"[REPARTO] No hay repartidor para zona={zona}")
         return
+    if zona in LOTES_EN_ENVIO:
+        return
+
+    LOTES_EN_ENVIO.add(zona)
+    try:
+        enviado = await _enviar_lote(zona, repartidor, motivo)
+    except Exception as e:
+        logging.error(f"[REPARTO] Falló el envío del lote de zona={zona}: {e!r}")
+        enviado = False
+    finally:
+        LOTES_EN_ENVIO.discard(zona)
+
+    if enviado:
+        FALLOS_LOTE.pop(zona, None)
+        return
+
+    # El lote queda como estaba; el planificador lo reintenta con backoff
+    fallos = FALLOS_LOTE.get(zona, (0, 0.0))[0] + 1
+    espera = espera_backoff(fallos, base_s=PLANIFICADOR_LOTES_S, max_s=LOTE_REINTENTO_MAX_S)
+    FALLOS_LOTE[zona] = (fallos, time.time() + espera)
+    logging.warning(f"[REPARTO] Lote de zona={zona} sin enviar ({fallos} fallos), reintento en {espera:.0f}s")
 
+
+async def _enviar_lote(zona: str, repartidor, motivo: str) -> bool:
+    """True si el lote salió (o no había nada que mandar)."""
     pedidos_lote: List[Pedido] = gestor_reparto.obtener_lote_actual(zona)
     if not pedidos_lote:
         logging.info(f"[REPARTO] Lote vacío en zona={zona}")
-        return
+        return True
+
+    try:
+        resultado = await ejecutar_ruteo(Rutas.ruta_lote, pedidos_lote)
+    except PoolSaturado as e:
+        logging.warning(f"[REPARTO] Pool saturado, lote de zona={zona} queda pendiente: {e}")
+        return False
 
-    png_path = Rutas.generar_gif_ruta_lote(pedidos_lote)
-    if not png_path:
+    if not resultado:
         logging.warning(f"[REPARTO] No se pudo generar PNG para zona={zona}")
-        return
+        return False
+
+    # Mismo orden de visita que el mapa (el pool devuelve posiciones, no copias)
+    orden, png = resultado
+    sin_ruta = [p for i, p in enumerate(pedidos_lote) if i not in set(orden)]
+    pedidos_lote = [pedidos_lote[i] for i in orden] + sin_ruta
 
-    media_id = await upload_media(png_path, "image/png")
+    media_id = await upload_media(png, "image/png")
     if not media_id:
         logging.warning(f"[REPARTO] No se pudo subir PNG para zona={zona}")
-        return
+        return False
 
     # Armar resumen
     lineas: List[str] = []
-    lineas.append(f"🛵 *Nuevo lote de pedidos (hasta 7) - Zona {zona}*")
+    lineas.append(f"🛵 *Nuevo lote de {len(pedidos_lote)} pedido(s) - Zona {zona}*")
 
     for idx, p in enumerate(pedidos_lote, start=1):
         if p.direccion_texto:
@@ -246,8 +764,64 @@ async def enviar_lote_zona_al_repartidor(zona: str) -> None:
         "image": {"id": media_id, "caption": caption},
     }
 
-    await send_to_whatsapp(payload)
-    gestor_reparto.marcar_lote_enviado(zona)
+    # Esperamos el envío: si falla, el lote no se marca como enviado
+    await send_to_whatsapp(payload, esperar=True)
+
+    # Solo salen los de la foto; lo que entró mientras tanto queda en el lote
+    gestor_reparto.marcar_lote_enviado(zona, pedidos_lote)
+    enviado = time.time()
+    for p in pedidos_lote:
+        p.enviado = enviado
+        REPO.guardar_pedido(p)
+
+    logging.info(f"[REPARTO] Lote de {len(pedidos_lote)} enviado a zona={zona} (motivo={motivo})")
+    return True
+
+
+# Cada cuánto se revisan los lotes abiertos (espera máxima / ETA por zona,
+# ver ConfigLote en Dominio/Reparto.py)
+PLANIFICADOR_LOTES_S = float(os.getenv("PLANIFICADOR_LOTES_S", "5"))
+
+
+async def planificador_lotes() -> None:
+    """
+    Tarea de fondo: envía cada lote en cuanto se llena, su pedido más viejo
+    esperó demasiado o alguna entrega se pasaría de la hora. Un lote a
+    medias ya no queda esperando a que llegue el próximo pedido.
+    """
+    while True:
+        await asyncio.sleep(PLANIFICADOR_LOTES_S)
+        try:
+            dueno = REPO.reclamar_dueno(ID_PROCESO, REPO_DUENO_S)
+            if dueno != ID_PROCESO:
+                # Se nos venció el turno y otro proceso tomó la base: sus
+                # lotes son los buenos, este no manda nada
+                logging.error(f"[REPARTO] La base ahora es de {dueno}, no se envían lotes desde acá")
+                continue
+            revisar_lotes(time.time())
+        except Exception:
+            # Una vuelta rota no puede matar al planificador
+            logging.exception("[REPARTO] Error revisando lotes")
+
+
+# Referencias a los envíos lanzados por el planificador (si no, el GC puede
+# llevarse la tarea a medio camino)
+TAREAS_LOTES: set = set()
+
+
+def revisar_lotes(ahora: float) -> None:
+    for zona, repartidor in list(gestor_reparto.repartidores.items()):
+        if zona in LOTES_EN_ENVIO or lote_en_espera(zona, ahora):
+            continue
+        try:
+            motivo = repartidor.motivo_cierre(ahora, margen_s=PLANIFICADOR_LOTES_S)
+        except Exception:
+            logging.exception(f"[REPARTO] Error revisando el lote de zona={zona}")
+            continue
+        if motivo:
+            tarea = asyncio.create_task(enviar_lote_zona_al_repartidor(zona, motivo))
+            TAREAS_LOTES.add(tarea)
+            tarea.add_done_callback(TAREAS_LOTES.discard)
 
 
 async def intentar_cerrar_lote(telefono: str) -> None:
@@ -297,339 +871,399 @@ async def verify_token_endpoint(request: Request):
 
 
 # ---- RECEPCIÓN DE MENSAJES ----
+
 @app.post("/whatsapp")
 async def received_message(request: Request):
+    """
+    Solo valida y encola: la conversación se procesa en COLAS_MENSAJES.
+    Meta reintenta los webhooks que tardan, así que respondemos enseguida.
+    """
     try:
         body = await request.json()
         logging.info(f"Payload recibido: {body}")
 
-        entry = body["entry"][0]
-        changes = entry["changes"][0]
-        value = changes["value"]
-
-        if "messages" not in value or len(value["messages"]) == 0:
-            return "EVENT_RECEIVED"
+        # Meta puede juntar varios entries / changes / mensajes en un mismo
+        # POST: se encolan TODOS, en el orden en que vienen.
+        for entry in body.get("entry", []):
+            for change in entry.get("changes", []):
+                value = change.get("value", {})
+                contacts = value.get("contacts", [])
+
+                for message in value.get("messages", []):
+                    number = message.get("from")
+                    if not number:
+                        continue
+                    # Solo el contacto de quien mandó este mensaje
+                    contacto = [c for c in contacts if c.get("wa_id") == number] or contacts[:1]
+                    COLAS_MENSAJES.encolar(number, (message, contacto))
 
-        message = value["messages"][0]
-        type_message, content = get_message_type(message)
-        number = message["from"]
+    except Exception as e:
+        print("Error en /whatsapp:", e)
 
-        contacts = value.get("contacts", [])
-        name = contacts[0].get("profile", {}).get("name", "Cliente") if contacts else "Cliente"
+    return "EVENT_RECEIVED"
 
-        if number not in clientes:
-            clientes[number] = Cliente(telefono=number, nombre=name)
-            logging.info(f"[CLIENTE] Nuevo cliente registrado: {name} ({number})")
 
-        print(f"Mensaje recibido de {number}: {content} (tipo: {type_message})")
+async def procesar_mensaje(evento) -> None:
+    """
+    Máquina de estados de la conversación para UN mensaje entrante.
+    Corre en la cola del número que lo mandó: los mensajes de un mismo
+    cliente se atienden en orden, los de clientes distintos en paralelo.
+    """
+    message, contacts = evento
+    type_message, content = get_message_type(message)
+    number = message["from"]
+    name = contacts[0].get("profile", {}).get("name", "Cliente") if contacts else "Cliente"
+
+    if number not in clientes:
+        clientes[number] = Cliente(telefono=number, nombre=name)
+        logging.info(f"[CLIENTE] Nuevo cliente registrado: {name} ({number})")
+
+    print(f"Mensaje recibido de {number}: {content} (tipo: {type_message})")
+
+    texto_normalizado = content.strip().lower() if isinstance(content, str) else ""
+
+    estado = estado_usuarios.get(number)
+
+    # ------------------------------------------------
+    # FASE: CANTIDAD
+    # ------------------------------------------------
+    if estado and estado.get("fase") == "esperando_cantidad" and type_message == "text":
+        try:
+            cantidad = int(texto_normalizado)
+            if cantidad <= 0:
+                raise ValueError()
+        except ValueError:
+            await send_text(number, "❌ Cantidad inválida. Ej: *2*.")
+            return
+
+        estado["fase"] = "detalles_por_unidad"
+        estado["cantidad_total"] = cantidad
+        estado["indice_actual"] = 1
+        estado["detalles"] = []
+
+        prod = chat._buscar_producto_por_row_id(estado["row_id"])
+        nombre_prod = prod["nombre"] if prod else "el producto"
+
+        await send_text(
+            number,
+            f"📝 Para la unidad 1 de *{nombre_prod}*, "
+            "¿completa o con alguna modificación?"
+        )
+        return
 
-        texto_normalizado = content.strip().lower() if isinstance(content, str) else ""
+    # ------------------------------------------------
+    # FASE: DETALLES
+    # ------------------------------------------------
+    if estado and estado.get("fase") == "detalles_por_unidad" and type_message == "text":
+        detalle_texto = content.strip()
 
-        estado = estado_usuarios.get(number)
+        if detalle_texto.lower() in ("completa", "normal", "no"):
+            detalle_texto = ""
 
-        # ------------------------------------------------
-        # FASE: CANTIDAD
-        # ------------------------------------------------
-        if estado and estado.get("fase") == "esperando_cantidad" and type_message == "text":
-            try:
-                cantidad = int(texto_normalizado)
-                if cantidad <= 0:
-                    raise ValueError()
-            except ValueError:
-                await send_text(number, "❌ Cantidad inválida. Ej: *2*.")
-                return "EVENT_RECEIVED"
+        detalles = estado["detalles"]
+        detalles.append(detalle_texto)
 
-            estado["fase"] = "detalles_por_unidad"
-            estado["cantidad_total"] = cantidad
-            estado["indice_actual"] = 1
-            estado["detalles"] = []
+        cantidad_total = estado["cantidad_total"]
+        ya_tengo = len(detalles)
 
-            prod = chat._buscar_producto_por_row_id(estado["row_id"])
-            nombre_prod = prod["nombre"] if prod else "el producto"
+        prod = chat._buscar_producto_por_row_id(estado["row_id"])
+        nombre_prod = prod["nombre"] if prod else "el producto"
 
+        if ya_tengo < cantidad_total:
+            siguiente_n = ya_tengo + 1
             await send_text(
                 number,
-                f"📝 Para la unidad 1 de *{nombre_prod}*, "
-                "¿completa o con alguna modificación?"
+                f"📝 Para la unidad {siguiente_n} de *{nombre_prod}*, "
+                "¿completa o modificada?"
             )
-            return "EVENT_RECEIVED"
+            return
 
-        # ------------------------------------------------
-        # FASE: DETALLES
-        # ------------------------------------------------
-        if estado and estado.get("fase") == "detalles_por_unidad" and type_message == "text":
-            detalle_texto = content.strip()
+        # Todas las unidades cargadas
+        from collections import Counter
 
-            if detalle_texto.lower() in ("completa", "normal", "no"):
-                detalle_texto = ""
+        contador = Counter(detalles)
 
-            detalles = estado["detalles"]
-            detalles.append(detalle_texto)
+        for detalle_valor, cant in contador.items():
+            chat.agregar_producto_al_carrito(
+                telefono=number,
+                row_id=estado["row_id"],
+                cantidad=cant,
+                detalle=detalle_valor,
+            )
+
+        estado_usuarios.pop(number, None)
 
-            cantidad_total = estado["cantidad_total"]
-            ya_tengo = len(detalles)
+        resumen = chat.resumen_carrito(number)
+        await send_text(number, resumen)
+        await send_botones_siguiente_paso(number)
+        return
 
-            prod = chat._buscar_producto_por_row_id(estado["row_id"])
-            nombre_prod = prod["nombre"] if prod else "el producto"
+    # ------------------------------------------------
+    # FASE: UBICACIÓN
+    # ------------------------------------------------
+    if estado and estado.get("fase") == "esperando_ubicacion":
+        if message.get("type") == "location":
+            loc = message["location"]
+            lat = loc.get("latitude")
+            lng = loc.get("longitude")
 
-            if ya_tengo < cantidad_total:
-                siguiente_n = ya_tengo + 1
+            try:
+                ruta = await ejecutar_ruteo(calcular_ruta_cliente, lat, lng)
+            except PoolSaturado:
                 await send_text(
                     number,
-                    f"📝 Para la unidad {siguiente_n} de *{nombre_prod}*, "
-                    "¿completa o modificada?"
+                    "⏳ Estamos con mucha demanda. "
+                    "Reenviá tu ubicación en un momento, por favor."
                 )
-                return "EVENT_RECEIVED"
+                return
+            except Exception as e:
+                # guardar_ubicacion reintenta acá y deja el error en el log
+                logging.error(f"[RUTA] Falló el cálculo en el pool para tel={number}: {e}")
+                ruta = None
 
-            # Todas las unidades cargadas
-            from collections import Counter
+            chat.guardar_ubicacion(
+                number,
+                lat,
+                lng,
+                loc.get("address") or loc.get("name") or "",
+                ruta=ruta,
+            )
+            estado_usuarios.pop(number, None)
 
-            contador = Counter(detalles)
+            pedido = chat.pedidos.get(number)
+            extra = ""
+            codigo = None
 
-            for detalle_valor, cant in contador.items():
-                chat.agregar_producto_al_carrito(
-                    telefono=number,
-                    row_id=estado["row_id"],
-                    cantidad=cant,
-                    detalle=detalle_valor,
-                )
+            if pedido:
+                if not getattr(pedido, "codigo_validacion", None):
+                    codigo = generar_codigo_validacion()
+                    pedido.codigo_validacion = codigo
+                    codigos_pedidos[codigo] = pedido
+
+                if getattr(pedido, "distancia_km", 0) > 0:
+                    extra += (
+                        f"\n\n🛣 Distancia estimada: {pedido.distancia_km:.2f} km"
+                        f"\n⏱ Tiempo aprox: {pedido.tiempo_estimado_min:.1f} min"
+                    )
+                if getattr(pedido, "zona", None):
+                    extra += f"\n📍 Zona de reparto: {pedido.zona}"
 
-            estado_usuarios.pop(number, None)
+            mensaje = (
+                "📍 ¡Gracias! Ya registramos tu ubicación.\n"
+                "Tu pedido está en preparación. 🙌" + extra
+            )
 
-            resumen = chat.resumen_carrito(number)
-            await send_text(number, resumen)
-            await send_botones_siguiente_paso(number)
-            return "EVENT_RECEIVED"
-
-        # ------------------------------------------------
-        # FASE: UBICACIÓN
-        # ------------------------------------------------
-        if estado and estado.get("fase") == "esperando_ubicacion":
-            if message.get("type") == "location":
-                loc = message["location"]
-                lat = loc.get("latitude")
-                lng = loc.get("longitude")
-
-                chat.guardar_ubicacion(
-                    number,
-                    lat,
-                    lng,
-                    loc.get("address") or loc.get("name") or ""
-                )
-                estado_usuarios.pop(number, None)
-
-                pedido = chat.pedidos.get(number)
-                extra = ""
-                codigo = None
-
-                if pedido:
-                    if not getattr(pedido, "codigo_validacion", None):
-                        codigo = f"{random.randint(0, 999999):06d}"
-                        pedido.codigo_validacion = codigo
-                        codigos_pedidos[codigo] = pedido
-
-                    if getattr(pedido, "distancia_km", 0) > 0:
-                        extra += (
-                            f"\n\n🛣 Distancia estimada: {pedido.distancia_km:.2f} km"
-                            f"\n⏱ Tiempo aprox: {pedido.tiempo_estimado_min:.1f} min"
-                        )
-                    if getattr(pedido, "zona", None):
-                        extra += f"\n📍 Zona de reparto: {pedido.zona}"
-
-                mensaje = (
-                    "📍 ¡Gracias! Ya registramos tu ubicación.\n"
-                    "Tu pedido está en preparación. 🙌" + extra
+            if codigo:
+                mensaje += (
+                    f"\n\n🔑 Código de validación: *{codigo}*.\n"
+                    "Mostraselo al repartidor."
                 )
 
-                if codigo:
-                    mensaje += (
-                        f"\n\n🔑 Código de validación: *{codigo}*.\n"
-                        "Mostraselo al repartidor."
-                    )
+            await send_text(number, mensaje)
+            await intentar_cerrar_lote(number)
+            return
 
-                await send_text(number, mensaje)
-                await intentar_cerrar_lote(number)
-                return "EVENT_RECEIVED"
+        await send_text(
+            number,
+            "🚫 No puedo leer esa dirección.\n"
+            "Usá el clip 📎 ➜ *Ubicación* ➜ *Enviar ubicación actual*."
+        )
+        return
 
-            await send_text(
-                number,
-                "🚫 No puedo leer esa dirección.\n"
-                "Usá el clip 📎 ➜ *Ubicación* ➜ *Enviar ubicación actual*."
-            )
-            return "EVENT_RECEIVED"
+    # ------------------------------------------------
+    # FASE: CALIFICACIÓN
+    # ------------------------------------------------
+    estado = estado_usuarios.get(number)
+    if estado and estado.get("fase") == "esperando_calificacion" and type_message == "text":
+        try:
+            valor = int(texto_normalizado)
+        except ValueError:
+            await send_text(number, "❌ Enviá un número del 1 al 5.")
+            return
+
+        if valor < 1 or valor > 5:
+            await send_text(number, "⚠️ La calificación debe ser entre 1 y 5.")
+            return
+
+        pedido = chat.pedidos.get(number)
+
+        if not pedido:
+            cliente = clientes.get(number)
+            if cliente and cliente.pedidos:
+                pedido = cliente.pedidos[-1]
+
+        if pedido:
+            repartidor = gestor_reparto.repartidores.get(pedido.repartidor or pedido.zona or "")
+            entregado = repartidor.entregado_por_id(pedido.id_pedido) if repartidor else None
+            if entregado is not None:
+                # Puede ser otra copia (si /entregarpedido lo leyó de la base):
+                # la nota va a la de las entregas, que es la de los acumulados
+                repartidor.registrar_calificacion(entregado, valor)
+                pedido = entregado
+                usar_pedido_del_cliente(pedido)
+            else:
+                pedido.calificacion = valor
+            REPO.guardar_pedido(pedido)
 
-        # ------------------------------------------------
-        # FASE: CALIFICACIÓN
-        # ------------------------------------------------
-        estado = estado_usuarios.get(number)
-        if estado and estado.get("fase") == "esperando_calificacion" and type_message == "text":
-            try:
-                valor = int(texto_normalizado)
-            except ValueError:
-                await send_text(number, "❌ Enviá un número del 1 al 5.")
-                return "EVENT_RECEIVED"
+        estado_usuarios.pop(number, None)
 
-            if valor < 1 or valor > 5:
-                await send_text(number, "⚠️ La calificación debe ser entre 1 y 5.")
-                return "EVENT_RECEIVED"
+        await send_text(
+            number,
+            f"✨ ¡Gracias por tu valoración de *{valor}/5*! 🙌"
+        )
+        return
 
-            pedido = chat.pedidos.get(number)
+    # ------------------------------------------------
+    # SELECCIÓN DE PRODUCTO
+    # ------------------------------------------------
+    es_producto = isinstance(content, str) and content.startswith("producto_")
+    if es_producto:
+        estado_usuarios[number] = {"fase": "esperando_cantidad", "row_id": content}
 
-            if not pedido:
-                cliente = clientes.get(number)
-                if cliente and cliente.pedidos:
-                    pedido = cliente.pedidos[-1]
+        prod = chat._buscar_producto_por_row_id(content)
+        nombre_prod = prod["nombre"] if prod else "el producto elegido"
 
-            if pedido:
-                pedido.calificacion = valor
+        await send_text(
+            number,
+            f"🍽 ¿Cuántas unidades de *{nombre_prod}* querés?\n"
+            "Ejemplo: *1* o *3*."
+        )
+        return
 
-            estado_usuarios.pop(number, None)
+    # ------------------------------------------------
+    # ACCIONES DEL MENÚ
+    # ------------------------------------------------
+    es_accion_menu = (
+        isinstance(content, str)
+        and (
+            content in [
+                "next_page",
+                "prev_page",
+                "ordenar",
+                "filtrar_categoria",
+                "go_first_page",
+            ]
+            or content.startswith("categoria_")
+        )
+    )
 
-            await send_text(
-                number,
-                f"✨ ¡Gracias por tu valoración de *{valor}/5*! 🙌"
-            )
-            return "EVENT_RECEIVED"
+    if es_accion_menu:
+        nuevo_mensaje = chat.manejar_accion(content)
+        payload = {
+            "messaging_product": "whatsapp",
+            "to": number,
+            "type": "interactive",
+            "interactive": nuevo_mensaje,
+        }
+        await send_to_whatsapp(payload)
+        return
 
-        # ------------------------------------------------
-        # SELECCIÓN DE PRODUCTO
-        # ------------------------------------------------
-        es_producto = isinstance(content, str) and content.startswith("producto_")
-        if es_producto:
-            estado_usuarios[number] = {"fase": "esperando_cantidad", "row_id": content}
+    # ------------------------------------------------
+    # COMANDOS DEL CARRITO
+    # ------------------------------------------------
 
-            prod = chat._buscar_producto_por_row_id(content)
-            nombre_prod = prod["nombre"] if prod else "el producto elegido"
+    if texto_normalizado == "seguir_comprando":
+        await send_menu(number, name)
+        return
 
-            await send_text(
-                number,
-                f"🍽 ¿Cuántas unidades de *{nombre_prod}* querés?\n"
-                "Ejemplo: *1* o *3*."
-            )
-            return "EVENT_RECEIVED"
-
-        # ------------------------------------------------
-        # ACCIONES DEL MENÚ
-        # ------------------------------------------------
-        es_accion_menu = (
-            isinstance(content, str)
-            and (
-                content in [
-                    "next_page",
-                    "prev_page",
-                    "ordenar",
-                    "filtrar_categoria",
-                    "go_first_page",
-                ]
-                or content.startswith("categoria_")
-            )
-        )
+    if texto_normalizado == "quitar_producto":
+        menu_quitar = chat.generar_menu_quitar_producto(number)
+        if not menu_quitar:
+            await send_text(number, "🧺 Tu carrito está vacío.")
+            return
+
+        payload = {
+            "messaging_product": "whatsapp",
+            "to": number,
+            "type": "interactive",
+            "interactive": menu_quitar,
+        }
+        await send_to_whatsapp(payload)
+        return
 
-        if es_accion_menu:
-            nuevo_mensaje = chat.manejar_accion(content)
-            payload = {
-                "messaging_product": "whatsapp",
-                "to": number,
-                "type": "interactive",
-                "interactive": nuevo_mensaje,
-            }
-            await send_to_whatsapp(payload)
-            return "EVENT_RECEIVED"
-
-        # ------------------------------------------------
-        # COMANDOS DEL CARRITO
-        # ------------------------------------------------
-
-        if texto_normalizado == "seguir_comprando":
-            await send_menu(number, name)
-            return "EVENT_RECEIVED"
-
-        if texto_normalizado == "quitar_producto":
-            menu_quitar = chat.generar_menu_quitar_producto(number)
-            if not menu_quitar:
-                await send_text(number, "🧺 Tu carrito está vacío.")
-                return "EVENT_RECEIVED"
-
-            payload = {
-                "messaging_product": "whatsapp",
-                "to": number,
-                "type": "interactive",
-                "interactive": menu_quitar,
-            }
-            await send_to_whatsapp(payload)
-            return "EVENT_RECEIVED"
+    if texto_normalizado in ("carrito", "/carrito"):
+        await send_text(number, chat.resumen_carrito(number))
+        return
 
-        if texto_normalizado in ("carrito", "/carrito"):
-            await send_text(number, chat.resumen_carrito(number))
-            return "EVENT_RECEIVED"
+    if texto_normalizado in ("borrar", "vaciar", "/borrar"):
+        chat.vaciar_carrito(number)
+        await send_text(number, "🧺 Carrito vaciado.")
+        return
 
-        if texto_normalizado in ("borrar", "vaciar", "/borrar"):
-            chat.vaciar_carrito(number)
-            await send_text(number, "🧺 Carrito vaciado.")
-            return "EVENT_RECEIVED"
+    if texto_normalizado in ("/reset", "reset", "/salir", "salir"):
+        chat.reset_estado()
+        estado_usuarios.pop(number, None)
+        chat.vaciar_carrito(number)
+        await send_text(
+            number,
+            "🔄 Conversación reiniciada.\n"
+            "Escribí algo para ver el menú."
+        )
+        return
 
-        if texto_normalizado in ("/reset", "reset", "/salir", "salir"):
-            chat.reset_estado()
-            estado_usuarios.pop(number, None)
-            chat.vaciar_carrito(number)
+    if texto_normalizado in ("confirmar", "/confirmar", "finalizar_pedido"):
+        pedido = chat.pedidos.get(number)
+
+        if not pedido or not pedido.items:
             await send_text(
                 number,
-                "🔄 Conversación reiniciada.\n"
-                "Escribí algo para ver el menú."
+                "No tenés un pedido activo. Escribí algo para ver el menú."
             )
-            return "EVENT_RECEIVED"
+            return
 
-        if texto_normalizado in ("confirmar", "/confirmar", "finalizar_pedido"):
-            pedido = chat.pedidos.get(number)
+        resumen = chat.resumen_carrito(number)
+        await send_text(
+            number,
+            resumen + "\n\n📍 Enviame tu ubicación (clip ➜ Ubicación)."
+        )
 
-            if not pedido or not pedido.items:
-                await send_text(
-                    number,
-                    "No tenés un pedido activo. Escribí algo para ver el menú."
-                )
-                return "EVENT_RECEIVED"
+        estado_usuarios[number] = {"fase": "esperando_ubicacion"}
+        return
 
-            resumen = chat.resumen_carrito(number)
-            await send_text(
-                number,
-                resumen + "\n\n📍 Enviame tu ubicación (clip ➜ Ubicación)."
-            )
+    # ------------------------------------------------
+    # QUITAR UNIDAD DEL CARRITO
+    # ------------------------------------------------
+    if isinstance(content, str) and content.startswith("quitar_unidad_"):
+        resto = content[len("quitar_unidad_"):]
+        try:
+            idx_item_str, idx_unidad_str = resto.split("_", 1)
+            idx_item = int(idx_item_str)
+            idx_unidad = int(idx_unidad_str)
+        except Exception:
+            await send_text(number, "❌ No pude identificar la unidad.")
+            return
+
+        ok = chat.quitar_unidad_del_carrito(number, idx_item, idx_unidad)
+        if not ok:
+            await send_text(number, "❌ No se pudo quitar la unidad.")
+            return
+
+        resumen = chat.resumen_carrito(number)
+        await send_text(number, "🗑 Unidad quitada.\n\n" + resumen)
+        await send_botones_siguiente_paso(number)
+        return
 
-            estado_usuarios[number] = {"fase": "esperando_ubicacion"}
-            return "EVENT_RECEIVED"
+    # ------------------------------------------------
+    # ÚLTIMA OPCIÓN: MOSTRAR MENÚ
+    # ------------------------------------------------
+    await send_menu(number, name)
 
-        # ------------------------------------------------
-        # QUITAR UNIDAD DEL CARRITO
-        # ------------------------------------------------
-        if isinstance(content, str) and content.startswith("quitar_unidad_"):
-            resto = content[len("quitar_unidad_"):]
-            try:
-                idx_item_str, idx_unidad_str = resto.split("_", 1)
-                idx_item = int(idx_item_str)
-                idx_unidad = int(idx_unidad_str)
-            except Exception:
-                await send_text(number, "❌ No pude identificar la unidad.")
-                return "EVENT_RECEIVED"
-
-            ok = chat.quitar_unidad_del_carrito(number, idx_item, idx_unidad)
-            if not ok:
-                await send_text(number, "❌ No se pudo quitar la unidad.")
-                return "EVENT_RECEIVED"
-
-            resumen = chat.resumen_carrito(number)
-            await send_text(number, "🗑 Unidad quitada.\n\n" + resumen)
-            await send_botones_siguiente_paso(number)
-            return "EVENT_RECEIVED"
-
-        # ------------------------------------------------
-        # ÚLTIMA OPCIÓN: MOSTRAR MENÚ
-        # ------------------------------------------------
-        await send_menu(number, name)
-        return "EVENT_RECEIVED"
 
-    except Exception as e:
-        print("Error en /whatsapp:", e)
-        return "EVENT_RECEIVED"
+async def atender_mensaje(evento) -> None:
+    """procesar_mensaje + persistir lo que cambió de ese cliente."""
+    number = evento[0]["from"]
+    try:
+        await procesar_mensaje(evento)
+    finally:
+        persistir_telefono(number)
+
+
+# Una cola (y una tarea) por número de teléfono, ver utils/colas_por_clave.py
+COLAS_MENSAJES = ColasPorClave(
+    atender_mensaje,
+    max_por_clave=int(os.getenv("COLA_MAX_POR_CLIENTE", "50")),
+    nombre="MENSAJES",
+)
 
 
 # --------------------------------------------------------
@@ -663,39 +1297,119 @@ def pedidos_por_repartidor():
     return data
 
 
-@app.get("/pedidosentregados")
-def pedidos_entregados():
-    """Pedidos entregados + estrellas + distancia + gasto nafta."""
-    data: Dict[str, Any] = {}
+@app.post("/redistribuirpendientes")
+async def redistribuir_pendientes():
+    """
+    Reagrupa por cercanía los pedidos que todavía no salieron (k-medoides,
+    un grupo por repartidor) y envía los lotes que quedaron completos.
+    """
+    if LOTES_EN_ENVIO:
+        raise HTTPException(status_code=409, detail="Hay lotes enviándose, probá de nuevo en unos segundos.")
 
-    for zona, repartidor in gestor_reparto.repartidores.items():
-        entregados = repartidor.pedidos_entregados
+    antes = {
+        p.id_pedido: p.repartidor
+        for r in gestor_reparto.repartidores.values()
+        for p in r.obtener_pedidos_pendientes()
+    }
+    completos = gestor_reparto.redistribuir_pendientes()
 
-        calificaciones = [
-            p.calificacion
-            for p in entregados
-            if getattr(p, "calificacion", None) is not None
-        ]
+    movidos = 0
+    for repartidor in gestor_reparto.repartidores.values():
+        for p in repartidor.obtener_pedidos_pendientes():
+            if antes.get(p.id_pedido) != p.repartidor:
+                movidos += 1
+                REPO.guardar_pedido(p)
 
-        promedio = sum(calificaciones) / len(calificaciones) if calificaciones else None
+    for zona in completos:
+        await enviar_lote_zona_al_repartidor(zona)
+
+    return {"pendientes": len(antes), "movidos": movidos, "lotes_enviados": completos}
 
-        distancia_total_km = sum(getattr(p, "distancia_km", 0.0) or 0.0 for p in entregados)
 
-        litros_nafta = distancia_total_km / 10.0
+# Tope de pedidos por página en los listados de entregas
+MAX_PAGINA_ENTREGAS = int(os.getenv("MAX_PAGINA_ENTREGAS", "200"))
 
+
+@app.get("/pedidosentregados")
+def pedidos_entregados(offset: int = 0, limite: int = 20):
+    """
+    Pedidos entregados + estrellas + distancia + gasto nafta, por repartidor.
+    Los números salen de acumulados (no se recorren las entregas) y los
+    pedidos vienen paginados (offset / limite, en orden de entrega): si
+    `hay_mas`, la página siguiente arranca en `siguiente_offset`.
+    """
+    data: Dict[str, Any] = {}
+    limite = min(limite, MAX_PAGINA_ENTREGAS)
+
+    for zona, repartidor in gestor_reparto.repartidores.items():
+        pagina = repartidor.entregados_pagina(offset, limite)
+        siguiente = max(offset, 0) + len(pagina)
+        hay_mas = siguiente < len(repartidor.pedidos_entregados)
         data[zona] = {
             "telefono_repartidor": repartidor.telefono_whatsapp,
-            "cantidad_entregados": len(entregados),
-            "cantidad_calificados": len(calificaciones),
-            "promedio_estrellas": promedio,
-            "distancia_total_km": distancia_total_km,
-            "litros_nafta_estimados": litros_nafta,
-            "pedidos": [pedido_to_dict(p) for p in entregados],
+            **repartidor.estadisticas.resumen(),
+            "offset": offset,
+            "pedidos": [pedido_to_dict(p) for p in pagina],
+            "siguiente_offset": siguiente if hay_mas else None,
+            "hay_mas": hay_mas,
         }
 
     return data
 
 
+@app.get("/pedidosentregados/{zona}")
+def pedidos_entregados_zona(zona: str, cursor: int = 0, limite: int = 50):
+    """
+    Entregas de un repartidor a partir de `cursor`. Para seguirlas en vivo,
+    volver a pedir con el `siguiente_cursor` de la respuesta anterior.
+    """
+    repartidor = gestor_reparto.repartidores.get(zona)
+    if not repartidor:
+        raise HTTPException(status_code=404, detail=f"No hay repartidor para zona={zona}.")
+
+    pedidos, siguiente = repartidor.entregados_desde(cursor, min(limite, MAX_PAGINA_ENTREGAS))
+    return {
+        "zona": zona,
+        "pedidos": [pedido_to_dict(p) for p in pedidos],
+        "siguiente_cursor": siguiente,
+        "cantidad_entregados": repartidor.estadisticas.cantidad,
+    }
+
+
+@app.get("/cacherutas")
+def cache_rutas():
+    """Aciertos / fallos de la caché de rutas."""
+    return Rutas.CACHE_RUTAS.estadisticas()
+
+
+@app.get("/pooltrabajo")
+def pool_trabajo():
+    """Trabajos en curso / completados / rechazados del pool de procesos."""
+    return POOL.estadisticas()
+
+
+@app.get("/colasmensajes")
+def colas_mensajes():
+    """Mensajes entrantes encolados / procesados / descartados."""
+    return COLAS_MENSAJES.estadisticas()
+
+
+@app.get("/despacho")
+def despacho():
+    """Mensajes salientes pedidos vs. requests realmente hechos a Graph, y los últimos fallos."""
+    return {
+        **DESPACHADOR.estadisticas(),
+        "reintentos": PRESUPUESTO_REINTENTOS.estadisticas(),
+        "media": CACHE_MEDIA.estadisticas(),
+    }
+
+
+@app.get("/persistencia")
+def persistencia():
+    """Escrituras pendientes / tandas grabadas en la base."""
+    return REPO.estadisticas()
+
+
 @app.get("/entregarpedido/{codigo}")
 async def entregar_pedido(codigo: str):
     """
@@ -703,6 +1417,11 @@ async def entregar_pedido(codigo: str):
     y le pide al cliente que califique al repartidor.
     """
     pedido = codigos_pedidos.get(codigo)
+    if not pedido:
+        # No está en memoria (p. ej. se entregó antes de este arranque)
+        pedido = REPO.pedido_por_codigo(codigo)
+        if pedido:
+            usar_pedido_del_cliente(pedido)
     if not pedido:
         raise HTTPException(status_code=404, detail="Código inválido o pedido no encontrado.")
 
@@ -711,18 +1430,16 @@ async def entregar_pedido(codigo: str):
 
     pedido.entregado = True
 
-    zona = getattr(pedido, "zona", None) or "SO"
+    zona = pedido.repartidor or getattr(pedido, "zona", None) or "SO"
     repartidor = gestor_reparto.repartidores.get(zona)
 
     if repartidor:
         repartidor.registrar_entrega(pedido)
-
-        if pedido in repartidor.lote_actual.pedidos:
-            repartidor.lote_actual.pedidos.remove(pedido)
-        elif pedido in repartidor.cola_espera:
-            repartidor.cola_espera.remove(pedido)
+        # Si todavía no había salido en un lote, deja de estar pendiente (O(1))
+        repartidor.quitar_pedido(pedido)
 
     codigos_pedidos.pop(codigo, None)
+    REPO.guardar_pedido(pedido)
 
     texto = (
         "✅ Marcamos tu pedido como *entregado*.\n\n"
@@ -730,9 +1447,18 @@ async def entregar_pedido(codigo: str):
         "Enviá solo el número. Ej: *5*."
     )
 
-    await send_text(pedido.telefono_cliente, texto)
+    try:
+        await send_text(pedido.telefono_cliente, texto, esperar=True)
+    except Exception as e:
+        # El pedido ya quedó entregado; lo que falló es el aviso al cliente
+        logging.error(f"[ENTREGA] No se pudo avisar a tel={pedido.telefono_cliente}: {e}")
+        raise HTTPException(
+            status_code=502,
+            detail=f"Pedido marcado como entregado, pero no se pudo avisar al cliente: {e}",
+        )
 
     estado_usuarios[pedido.telefono_cliente] = {"fase": "esperando_calificacion"}
+    REPO.guardar_estado(pedido.telefono_cliente, estado_usuarios[pedido.telefono_cliente])
 
     return {"status": "ok", "telefono_cliente": pedido.telefono_cliente, "zona": zona}
 
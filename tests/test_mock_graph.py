@@ -0,0 +1,229 @@
+"""
+Envíos a la Graph API contra el servidor falso (utils/mock_graph.py).
+
+El mock corre con hypercorn y TLS (certificado de trustme) para que el
+cliente negocie HTTP/2 por ALPN, igual que con graph.facebook.com. Todo se
+verifica con los contadores de GET /_stats del mock.
+
+    uv run --group dev pytest
+
+main.py carga el grafo al importarse: hace falta el snapshot local
+(python -m Algoritmos.grafo_salto --refrescar), si no los tests se saltean.
+"""
+
+import asyncio
+import importlib
+import os
+import socket
+import ssl
+import threading
+
+import httpx
+import pytest
+
+from Algoritmos.grafo_salto import ruta_snapshot
+
+if not os.path.exists(ruta_snapshot()):
+    pytest.skip(f"No hay snapshot del grafo en {ruta_snapshot()}", allow_module_level=True)
+
+trustme = pytest.importorskip("trustme")
+pytest.importorskip("hypercorn")
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def mock(tmp_path_factory):
+    """Levanta el mock en un hilo con su propio event loop; devuelve su URL base."""
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    from utils.mock_graph import app
+
+    carpeta = tmp_path_factory.mktemp("tls")
+    ca = trustme.CA()
+    certificado = carpeta / "servidor.pem"
+    ca.issue_cert("localhost").private_key_and_cert_chain_pem.write_to_path(str(certificado))
+    ca.cert_pem.write_to_path(str(carpeta / "ca.pem"))
+
+    puerto = _puerto_libre()
+    config = Config()
+    config.bind = [f"localhost:{puerto}"]
+    config.certfile = config.keyfile = str(certificado)
+    config.alpn_protocols = ["h2", "http/1.1"]
+
+    loop = asyncio.new_event_loop()
+    listo = threading.Event()
+    parar = asyncio.Event()
+
+    async def servir():
+        listo.set()
+        await serve(app, config, shutdown_trigger=parar.wait)
+
+    hilo = threading.Thread(target=loop.run_until_complete, args=(servir(),), daemon=True)
+    hilo.start()
+    listo.wait()
+
+    base = f"https://localhost:{puerto}"
+    confianza = ssl.create_default_context(cafile=str(carpeta / "ca.pem"))
+    for _ in range(100):
+        try:
+            httpx.get(f"{base}/_stats", verify=confianza)
+            break
+        except httpx.ConnectError:
+            threading.Event().wait(0.05)
+
+    yield base, str(carpeta / "ca.pem")
+
+    loop.call_soon_threadsafe(parar.set)
+    hilo.join(timeout=5)
+
+
+@pytest.fixture(scope="module")
+def main(mock, tmp_path_factory):
+    base, ca = mock
+    entorno = {
+        "ACCESS_TOKEN": "token-de-prueba",
+        "PHONE_NUMBER_ID": "1",
+        "GRAPH_BASE_URL": base,
+        "GRAPH_TIMEOUT_S": "1",
+        "GRAPH_MAX_REINTENTOS": "2",
+        "SSL_CERT_FILE": ca,  # httpx confía en la CA del mock
+        "POOL_PROCESOS": "0",
+        "DB_PATH": str(tmp_path_factory.mktemp("db") / "reparto.db"),
+    }
+    anteriores = {clave: os.environ.get(clave) for clave in entorno}
+    os.environ.update(entorno)
+    try:
+        yield importlib.import_module("main")
+    finally:
+        for clave, valor in anteriores.items():
+            if valor is None:
+                os.environ.pop(clave, None)
+            else:
+                os.environ[clave] = valor
+
+
+@pytest.fixture(scope="module")
+def loop(main):
+    # Un solo loop para todo el módulo: el cliente compartido y el token
+    # bucket de main viven en él, como en la app real
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(main.cliente_http().aclose())
+    loop.close()
+
+
+@pytest.fixture
+def correr(main, mock, loop):
+    """
+    Corre una corrutina con el mock en cero y `fallas` programadas (ver
+    utils/mock_graph.py). Devuelve (resultado o excepción, /_stats).
+    """
+    base, ca = mock
+    confianza = ssl.create_default_context(cafile=ca)
+
+    def correr(corrutina, fallas=()):
+        with httpx.Client(base_url=base, verify=confianza) as control:
+            control.post("/_reiniciar")
+            control.post("/_fallas", json=list(fallas))
+            try:
+                resultado = loop.run_until_complete(corrutina)
+            except Exception as e:
+                resultado = e
+            return resultado, control.get("/_stats").json()
+
+    return correr
+
+
+def _texto(main, numero: str):
+    return main._post_graph(
+        main.GRAPH_SEND_URL,
+        json={"messaging_product": "whatsapp", "to": numero, "type": "text", "text": {"body": "hola"}},
+    )
+
+
+def test_un_cliente_http2_para_todos_los_envios(main, correr):
+    async def envios():
+        return await asyncio.gather(*(_texto(main, str(i)) for i in range(20)))
+
+    respuestas, stats = correr(envios())
+
+    assert main.cliente_http() is main.cliente_http()
+    assert {r.http_version for r in respuestas} == {"HTTP/2"}
+    assert stats["mensajes"] == 20
+    assert stats["http"] == {"2": 20}
+    assert stats["conexiones"] == 1
+
+
+def test_reintenta_503_y_429(main, correr):
+    respuesta, stats = correr(
+        _texto(main, "598"),
+        fallas=[{"estado": 503}, {"estado": 429, "retry_after": 1}],
+    )
+
+    assert respuesta.status_code == 200
+    assert stats["requests"] == 3
+    assert stats["503"] == 1 and stats["429"] == 1
+    assert stats["mensajes"] == 1
+
+
+def test_se_rinde_despues_de_los_reintentos(main, correr):
+    error, stats = correr(_texto(main, "598"), fallas=[{"estado": 503}] * 5)
+
+    assert isinstance(error, httpx.HTTPStatusError)
+    assert stats["requests"] == 1 + main.GRAPH_MAX_REINTENTOS
+
+
+def test_no_reintenta_errores_del_cliente(main, correr):
+    error, stats = correr(_texto(main, "598"), fallas=[{"estado": 400}])
+
+    assert isinstance(error, httpx.HTTPStatusError)
+    assert error.response.status_code == 400
+    assert stats["requests"] == 1
+
+
+def test_timeout_de_lectura_no_vuelve_a_postear(main, correr):
+    # Meta pudo haber recibido el mensaje: reenviarlo lo duplicaría
+    error, stats = correr(_texto(main, "598"), fallas=[{"demora": main.GRAPH_TIMEOUT_S + 1}])
+
+    assert isinstance(error, httpx.ReadTimeout)
+    assert stats["requests"] == 1
+    assert stats["mensajes"] == 0
+
+
+def test_upload_media_sube_una_vez_por_contenido(main, correr):
+    async def subidas():
+        primera = await main.upload_media(b"png-del-lote")
+        segunda = await main.upload_media(b"png-del-lote")
+        otra = await main.upload_media(b"png-de-otro-lote")
+        return primera, segunda, otra
+
+    (primera, segunda, otra), stats = correr(subidas())
+
+    assert primera and primera == segunda
+    assert otra and otra != primera
+    assert stats["media"] == 2
+    assert stats["http"] == {"2": 2}
+
+
+def test_despacho_registra_fallos_por_destinatario(main, correr):
+    async def envios():
+        await main.send_text("5981", "sin esperar")
+        await main.DESPACHADOR.cerrar()
+        try:
+            await main.send_text("5982", "esperando", esperar=True)
+        except httpx.HTTPStatusError as e:
+            return e
+
+    error, stats = correr(envios(), fallas=[{"estado": 400}, {"estado": 400}])
+
+    assert error is not None and error.response.status_code == 400
+    assert stats["requests"] == 2
+    fallos = {f["to"]: f for f in main.DESPACHADOR.estadisticas()["ultimos_fallos"]}
+    assert fallos["5981"]["fallos"] == 1 and "400" in fallos["5981"]["error"]
+    assert "5982" in fallos
@@ -0,0 +1,109 @@
+"""
+Caché de media ya subida a WhatsApp: hash del contenido -> media_id.
+
+Si se reenvía la misma imagen (p. ej. el mismo lote otra vez) no se vuelve
+a subir: se reutiliza el media_id mientras siga vivo en Graph. Meta guarda
+la media subida 30 días; por defecto la entrada vence un día antes.
+
+Si dos envíos suben el mismo contenido a la vez, el segundo espera el
+resultado del primero en vez de subirlo de nuevo.
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+TTL_MEDIA_S = 29 * 24 * 3600
+
+
+class CacheMedia:
+    def __init__(self, ttl_s: float = TTL_MEDIA_S, max_entradas: int = 1000):
+        self.ttl_s = ttl_s
+        self.max_entradas = max_entradas
+        self._ids: Dict[str, Tuple[str, float]] = {}
+        self._en_vuelo: Dict[str, asyncio.Future] = {}
+
+        self.aciertos = 0
+        self.subidas = 0
+
+    @staticmethod
+    def clave(contenido: bytes, mime_type: str) -> str:
+        return hashlib.sha256(mime_type.encode() + b"\0" + contenido).hexdigest()
+
+    def obtener(self, clave: str) -> Optional[str]:
+        entrada = self._ids.get(clave)
+        if entrada is None:
+            return None
+        media_id, vence = entrada
+        if time.time() >= vence:
+            del self._ids[clave]
+            return None
+        return media_id
+
+    def _guardar(self, clave: str, media_id: str) -> None:
+        if len(self._ids) >= self.max_entradas:
+            # Sacamos primero las vencidas y, si no alcanza, las más viejas
+            ahora = time.time()
+            for k in [k for k, (_, v) in self._ids.items() if v <= ahora]:
+                del self._ids[k]
+            while len(self._ids) >= self.max_entradas:
+                del self._ids[next(iter(self._ids))]
+        self._ids[clave] = (media_id, time.time() + self.ttl_s)
+
+    async def subir(
+        self,
+        contenido: bytes,
+        mime_type: str,
+        subir: Callable[[bytes, str], Awaitable[str]],
+    ) -> str:
+        """
+        Devuelve el media_id del contenido; solo llama a `subir` si no hay
+        uno vigente (ni otra subida igual en curso).
+        """
+        clave = self.clave(contenido, mime_type)
+
+        media_id = self.obtener(clave)
+        if media_id:
+            self.aciertos += 1
+            return media_id
+
+        en_vuelo = self._en_vuelo.get(clave)
+        if en_vuelo is not None:
+            try:
+                media_id = await asyncio.shield(en_vuelo)
+            except asyncio.CancelledError:
+                if not en_vuelo.cancelled():
+                    raise  # nos cancelaron a nosotros
+                # Cancelaron al que subía, no a este: lo intentamos de nuevo
+                return await self.subir(contenido, mime_type, subir)
+            self.aciertos += 1
+            return media_id
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_vuelo[clave] = futuro
+        try:
+            media_id = await subir(contenido, mime_type)
+            self.subidas += 1
+            if media_id:
+                self._guardar(clave, media_id)
+            futuro.set_result(media_id)
+            return media_id
+        except asyncio.CancelledError:
+            # La cancelación es de este llamador: los que esperaban reintentan
+            futuro.cancel()
+            raise
+        except Exception as e:
+            futuro.set_exception(e)
+            # Que nadie quede con una excepción "no leída" si no había espera
+            futuro.exception()
+            raise
+        finally:
+            del self._en_vuelo[clave]
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "entradas": len(self._ids),
+            "aciertos": self.aciertos,
+            "subidas": self.subidas,
+        }
@@ -0,0 +1,104 @@
+"""
+Colas de trabajo async con orden por clave (p. ej. por número de teléfono).
+
+Cada clave tiene su propia cola FIFO y una tarea que la vacía: los ítems de
+una misma clave se procesan de a uno y en orden de llegada, mientras que
+claves distintas avanzan en paralelo. La tarea de una clave termina sola
+después de `inactividad_s` sin trabajo, así no quedan tareas por cada
+cliente que escribió alguna vez.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class ColasPorClave:
+    def __init__(
+        self,
+        procesar: Callable[[Any], Awaitable[None]],
+        max_por_clave: int = 100,
+        inactividad_s: float = 60.0,
+        nombre: str = "COLAS",
+    ):
+        self._procesar = procesar
+        self.max_por_clave = max_por_clave
+        self.inactividad_s = inactividad_s
+        self.nombre = nombre
+        self._colas: Dict[Hashable, asyncio.Queue] = {}
+        self._tareas: Dict[Hashable, asyncio.Task] = {}
+
+        self.encolados = 0
+        self.procesados = 0
+        self.fallidos = 0
+        self.descartados = 0
+
+    def encolar(self, clave: Hashable, item: Any) -> bool:
+        """
+        Agrega el ítem a la cola de `clave` sin esperar. Devuelve False si
+        esa cola está llena (el ítem se descarta).
+        """
+        cola = self._colas.get(clave)
+        if cola is None:
+            cola = asyncio.Queue(maxsize=self.max_por_clave)
+            self._colas[clave] = cola
+            self._tareas[clave] = asyncio.create_task(self._drenar(clave, cola))
+
+        try:
+            cola.put_nowait(item)
+        except asyncio.QueueFull:
+            self.descartados += 1
+            logging.warning(f"[{self.nombre}] Cola llena para {clave}, se descarta un ítem")
+            return False
+
+        self.encolados += 1
+        return True
+
+    async def _drenar(self, clave: Hashable, cola: asyncio.Queue) -> None:
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(cola.get(), timeout=self.inactividad_s)
+                except asyncio.TimeoutError:
+                    if cola.empty():
+                        break
+                    continue
+
+                try:
+                    await self._procesar(item)
+                    self.procesados += 1
+                except Exception:
+                    self.fallidos += 1
+                    logging.exception(f"[{self.nombre}] Error procesando ítem de {clave}")
+                finally:
+                    cola.task_done()
+        finally:
+            if self._colas.get(clave) is cola:
+                del self._colas[clave]
+                del self._tareas[clave]
+
+    async def cerrar(self, espera_s: float = 10.0) -> None:
+        """Espera a que se vacíen las colas (hasta `espera_s`) y corta las tareas."""
+        if self._colas:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(c.join() for c in list(self._colas.values()))),
+                    timeout=espera_s,
+                )
+            except asyncio.TimeoutError:
+                logging.warning(f"[{self.nombre}] Quedaron ítems sin procesar al cerrar")
+
+        tareas = list(self._tareas.values())
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "claves_activas": len(self._colas),
+            "en_cola": sum(c.qsize() for c in self._colas.values()),
+            "encolados": self.encolados,
+            "procesados": self.procesados,
+            "fallidos": self.fallidos,
+            "descartados": self.descartados,
+        }
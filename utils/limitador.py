@@ -0,0 +1,83 @@
+"""
+Control de caudal para los envíos a la Graph API.
+
+- TokenBucket: como mucho `tasa` requests por segundo (con ráfagas de hasta
+  `capacidad`). Si no hay token, se espera en vez de recibir un 429.
+- PresupuestoReintentos: los reintentos no pueden pasar de un porcentaje de
+  los requests recientes. Si Graph está caído, no lo multiplicamos con
+  reintentos: se falla rápido.
+- espera_backoff: backoff exponencial con jitter ("full jitter").
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Dict
+
+
+class TokenBucket:
+    def __init__(self, tasa: float, capacidad: float):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._tokens = capacidad
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _recargar(self) -> None:
+        ahora = time.monotonic()
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    async def adquirir(self) -> None:
+        """Espera hasta tener un token y lo consume (en orden de llegada)."""
+        async with self._lock:
+            self._recargar()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.tasa)
+                self._recargar()
+            self._tokens -= 1
+
+    def penalizar(self, segundos: float) -> None:
+        """Graph pidió frenar (429 / Retry-After): vaciamos el balde por ese tiempo."""
+        self._recargar()
+        self._tokens = min(self._tokens, -segundos * self.tasa)
+
+
+class PresupuestoReintentos:
+    def __init__(self, proporcion: float = 0.2, minimo: int = 10, ventana_s: float = 10.0):
+        self.proporcion = proporcion
+        self.minimo = minimo
+        self.ventana_s = ventana_s
+        self._requests: deque = deque()
+        self._reintentos: deque = deque()
+
+    def _limpiar(self, ahora: float) -> None:
+        for marcas in (self._requests, self._reintentos):
+            while marcas and ahora - marcas[0] > self.ventana_s:
+                marcas.popleft()
+
+    def registrar_request(self) -> None:
+        self._requests.append(time.monotonic())
+
+    def puede_reintentar(self) -> bool:
+        """Consume un reintento del presupuesto si queda; si no, False."""
+        ahora = time.monotonic()
+        self._limpiar(ahora)
+        permitidos = max(self.minimo, self.proporcion * len(self._requests))
+        if len(self._reintentos) >= permitidos:
+            return False
+        self._reintentos.append(ahora)
+        return True
+
+    def estadisticas(self) -> Dict[str, Any]:
+        self._limpiar(time.monotonic())
+        return {
+            "requests_ventana": len(self._requests),
+            "reintentos_ventana": len(self._reintentos),
+        }
+
+
+def espera_backoff(intento: int, base_s: float = 0.5, max_s: float = 20.0) -> float:
+    """Segundos a esperar antes del reintento número `intento` (1, 2, ...)."""
+    return random.uniform(0, min(max_s, base_s * 2 ** (intento - 1)))
@@ -0,0 +1,140 @@
+"""
+Servidor falso de la Graph API de WhatsApp, para probar los envíos sin Meta.
+
+    uvicorn utils.mock_graph:app --port 8001
+    GRAPH_BASE_URL=http://localhost:8001 ACCESS_TOKEN=x PHONE_NUMBER_ID=1 uvicorn main:app
+
+uvicorn solo habla HTTP/1.1: para probar HTTP/2 (ALPN, una sola conexión
+multiplexada) hay que servirlo con TLS, p. ej. con hypercorn:
+    hypercorn utils.mock_graph:app --bind localhost:8443 --certfile cert.pem --keyfile key.pem
+
+Responde como Graph a /{version}/{phone_id}/messages y /{version}/{phone_id}/media
+y lleva la cuenta de lo recibido en GET /_stats (requests que llegaron,
+conexiones distintas, versión de HTTP). POST /_reiniciar pone todo en cero.
+
+Para probar throttling y reintentos:
+    MOCK_GRAPH_TASA=20      -> más de 20 req/s por phone_id responde 429 (Retry-After)
+    MOCK_GRAPH_ERRORES=0.1  -> 10% de los requests responde 503
+    POST /_fallas [{"estado": 503}, {"demora": 2}]
+                            -> los próximos requests, en orden, responden ese
+                               estado o tardan esos segundos (lo usan los tests)
+"""
+
+import asyncio
+import itertools
+import os
+import random
+import time
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Demora artificial por request (segundos), para simular la latencia de Meta
+LATENCIA_S = float(os.getenv("MOCK_GRAPH_LATENCIA", "0.05"))
+TASA_MAX = float(os.getenv("MOCK_GRAPH_TASA", "0"))  # 0 = sin límite
+PROB_ERROR = float(os.getenv("MOCK_GRAPH_ERRORES", "0"))
+
+app = FastAPI()
+
+_ids = itertools.count(1)
+_ultimos: Dict[str, List[float]] = {}
+_fallas: List[Dict[str, Any]] = []
+_conexiones: set = set()
+
+
+def _stats_vacias() -> Dict[str, Any]:
+    return {
+        "requests": 0, "mensajes": 0, "media": 0, "por_destinatario": {},
+        "429": 0, "503": 0, "http": {},
+    }
+
+
+_stats = _stats_vacias()
+
+
+async def _falla(phone_id: str, request: Request):
+    """Anota el request y devuelve la respuesta de error simulada, o None si pasa."""
+    _stats["requests"] += 1
+    http = request.scope.get("http_version", "")
+    _stats["http"][http] = _stats["http"].get(http, 0) + 1
+    _conexiones.add(tuple(request.scope.get("client") or ()))
+
+    await asyncio.sleep(LATENCIA_S)
+    if _fallas:
+        falla = _fallas.pop(0)
+        if "demora" in falla:
+            await asyncio.sleep(falla["demora"])
+        else:
+            estado = falla["estado"]
+            _stats[str(estado)] = _stats.get(str(estado), 0) + 1
+            headers = {"Retry-After": str(falla["retry_after"])} if "retry_after" in falla else None
+            return JSONResponse({"error": {"message": "Falla simulada"}}, status_code=estado, headers=headers)
+
+    if TASA_MAX > 0:
+        ahora = time.monotonic()
+        marcas = [t for t in _ultimos.get(phone_id, []) if ahora - t < 1.0]
+        _ultimos[phone_id] = marcas
+        if len(marcas) >= TASA_MAX:
+            _stats["429"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit hit", "code": 130429}},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+        marcas.append(ahora)
+
+    if PROB_ERROR and random.random() < PROB_ERROR:
+        _stats["503"] += 1
+        return JSONResponse({"error": {"message": "Service unavailable"}}, status_code=503)
+    return None
+
+
+@app.post("/{version}/{phone_id}/messages")
+async def mensajes(version: str, phone_id: str, request: Request):
+    payload = await request.json()
+    falla = await _falla(phone_id, request)
+    if falla is not None:
+        return falla
+
+    _stats["mensajes"] += 1
+    to = payload.get("to", "")
+    _stats["por_destinatario"][to] = _stats["por_destinatario"].get(to, 0) + 1
+
+    return {
+        "messaging_product": "whatsapp",
+        "contacts": [{"input": to, "wa_id": to}],
+        "messages": [{"id": f"wamid.mock{next(_ids)}"}],
+    }
+
+
+@app.post("/{version}/{phone_id}/media")
+async def media(version: str, phone_id: str, request: Request):
+    await request.body()
+    falla = await _falla(phone_id, request)
+    if falla is not None:
+        return falla
+
+    _stats["media"] += 1
+    return {"id": f"media{next(_ids)}"}
+
+
+@app.get("/_stats")
+def stats():
+    return {**_stats, "conexiones": len(_conexiones)}
+
+
+@app.post("/_fallas")
+async def programar_fallas(request: Request):
+    _fallas.extend(await request.json())
+    return {"pendientes": len(_fallas)}
+
+
+@app.post("/_reiniciar")
+def reiniciar():
+    global _stats
+    _stats = _stats_vacias()
+    _fallas.clear()
+    _conexiones.clear()
+    _ultimos.clear()
+    return {"ok": True}
@@ -0,0 +1,136 @@
+"""
+Pool de procesos para el trabajo pesado de CPU (ruteo y render de mapas).
+
+Los handlers de FastAPI son async: si calculan una ruta o dibujan el mapa
+ahí mismo, bloquean el event loop y todos los demás webhooks esperan.
+Con este pool el trabajo corre en procesos aparte (cada uno con el grafo ya
+cargado) y el handler solo hace `await pool.ejecutar(funcion, *args)`.
+
+Backpressure: como mucho `max_en_cola` trabajos entre corriendo y esperando.
+Si no se libera lugar en `espera_max` segundos se lanza PoolSaturado, en vez
+de acumular trabajos sin límite.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+
+class PoolSaturado(RuntimeError):
+    """No hubo lugar en la cola del pool dentro del tiempo de espera."""
+
+
+class PoolProcesos:
+    def __init__(
+        self,
+        procesos: int = 2,
+        max_en_cola: int = 16,
+        espera_max: float = 30.0,
+        inicializador: Optional[Callable[[], None]] = None,
+        contexto: str = "spawn",
+    ):
+        self.procesos = procesos
+        self.max_en_cola = max_en_cola
+        self.espera_max = espera_max
+        self._inicializador = inicializador
+        self._contexto = contexto
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lugares: Optional[asyncio.Semaphore] = None
+
+        self.en_curso = 0
+        self.completados = 0
+        self.fallidos = 0
+        self.rechazados = 0
+
+    # ---------------- ciclo de vida ----------------
+
+    def _crear_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.procesos,
+            mp_context=multiprocessing.get_context(self._contexto),
+            initializer=self._inicializador,
+        )
+
+    async def iniciar(self) -> None:
+        """
+        Levanta los procesos y espera a que todos terminen el inicializador
+        (cargar grafo, árbol, render), así el primer pedido real no paga eso.
+        """
+        if self.procesos <= 0:
+            logging.info("[POOL] Sin procesos: los trabajos corren en un hilo del proceso web")
+        else:
+            self._executor = self._crear_executor()
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(
+                loop.run_in_executor(self._executor, _nada) for _ in range(self.procesos)
+            ))
+            logging.info(f"[POOL] {self.procesos} procesos listos (max_en_cola={self.max_en_cola})")
+        self._lugares = asyncio.Semaphore(self.max_en_cola)
+
+    def cerrar(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    # ---------------- trabajos ----------------
+
+    async def ejecutar(self, funcion: Callable[..., Any], *args: Any) -> Any:
+        """
+        Corre funcion(*args) en el pool y devuelve su resultado.
+        `funcion` y sus argumentos tienen que poder pasarse por pickle
+        (funciones de módulo, dataclasses, tipos básicos).
+        """
+        if self._lugares is None:
+            raise RuntimeError("PoolProcesos.iniciar() no fue llamado")
+
+        try:
+            await asyncio.wait_for(self._lugares.acquire(), timeout=self.espera_max)
+        except asyncio.TimeoutError:
+            self.rechazados += 1
+            raise PoolSaturado(
+                f"{self.max_en_cola} trabajos en cola hace más de {self.espera_max:.0f}s"
+            ) from None
+
+        self.en_curso += 1
+        try:
+            resultado = await self._correr(funcion, *args)
+            self.completados += 1
+            return resultado
+        except Exception:
+            self.fallidos += 1
+            raise
+        finally:
+            self.en_curso -= 1
+            self._lugares.release()
+
+    async def _correr(self, funcion: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            return await loop.run_in_executor(None, funcion, *args)
+        try:
+            return await loop.run_in_executor(self._executor, funcion, *args)
+        except BrokenProcessPool:
+            # Un proceso murió (p. ej. sin memoria): rehacemos el pool y
+            # reintentamos una vez para no perder el trabajo.
+            logging.error("[POOL] Pool roto, se vuelve a crear")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._crear_executor()
+            return await loop.run_in_executor(self._executor, funcion, *args)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "procesos": self.procesos,
+            "max_en_cola": self.max_en_cola,
+            "en_curso": self.en_curso,
+            "completados": self.completados,
+            "fallidos": self.fallidos,
+            "rechazados": self.rechazados,
+        }
+
+
+def _nada() -> None:
+    """Trabajo vacío para forzar el arranque de cada proceso."""
+    return None